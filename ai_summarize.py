@@ -1,7 +1,13 @@
+import argparse
 import json
+from collections import Counter, OrderedDict
 from pathlib import Path
 from datetime import datetime
 
+import metrics
+import timestamps
+from findings_io import findings_path, iter_findings, write_jsonl
+
 # --- simple RMF-style templates (works without any API calls) ---
 SEVERITY_GUIDANCE = {
     "Critical": "Immediate response required; potential compromise or loss of audit integrity.",
@@ -51,6 +57,9 @@ DEFAULT_RISK = {
     "PROC-001": "Obfuscated PowerShell execution may indicate malicious command execution and can facilitate defense evasion, persistence, or payload delivery.",
 }
 
+FALLBACK_RISK = "Potential security risk identified; investigate and assess impact."
+FALLBACK_ACTIONS = ["Investigate and validate legitimacy.", "Document outcome and remediate as appropriate."]
+
 def rmf_summary(finding: dict) -> str:
     rule_id = finding.get("rule_id")
     severity = finding.get("severity")
@@ -65,44 +74,152 @@ def rmf_summary(finding: dict) -> str:
         f"- **NIST 800-53 Controls:** {controls}\n"
     )
 
-def main():
-    root = Path(__file__).resolve().parent
-    findings_path = root / "data" / "processed" / "findings.json"
-    out_findings_path = root / "data" / "processed" / "findings_enriched.json"
-    out_md = root / "data" / "processed" / "ai_summary.md"
+def template_catalog():
+    # Risk statement and recommended actions per rule_id. Enriched findings
+    # carry only "template": <rule_id>; the text lives once in
+    # enrichment_templates.json.
+    catalog = {rule_id: {"risk_statement": DEFAULT_RISK[rule_id], "recommended_actions": DEFAULT_ACTIONS[rule_id]}
+               for rule_id in DEFAULT_RISK}
+    catalog["default"] = {"risk_statement": FALLBACK_RISK, "recommended_actions": FALLBACK_ACTIONS}
+    return catalog
+
+def template_for(catalog, finding):
+    # Legacy findings_enriched.json carried the text inline
+    if "risk_statement" in finding:
+        return finding
+    return catalog.get(finding.get("template"), catalog["default"])
+
+# -----------------------
+# Markdown report
+# -----------------------
+# A section depends only on (rule_id, severity, title, controls, template),
+# so each distinct key is rendered once and the text reused; at scale a
+# report is thousands of copies of a handful of sections. Sections are
+# written to the report as findings stream past. Grouped mode instead
+# writes one section per key with a finding count and the most frequent
+# evidence entities.
+EVIDENCE_ENTITIES = ("host", "user", "ip")
+TOP_EVIDENCE = 5
+
+def section_key(finding):
+    return (finding.get("rule_id"), finding.get("severity"), finding.get("title"),
+            tuple(finding.get("nist_800_53_controls", [])), finding.get("template"))
 
-    findings = json.loads(findings_path.read_text(encoding="utf-8-sig"))
+def evidence_label(evidence):
+    source = evidence.get("event", evidence)
+    return ", ".join(f"{k}={source[k]}" for k in EVIDENCE_ENTITIES if source.get(k))
 
-    enriched = []
-    lines = []
-    lines.append(f"# AI-Assisted RMF Findings Summary")
-    lines.append(f"_Generated: {datetime.now().isoformat(timespec='seconds')}_\n")
+def evidence_times(evidence):
+    # (first, last) as epoch ms, None when missing or unparseable. Raw values
+    # mix ISO, offset-ISO and /Date(ms)/ forms, so they are not compared as
+    # text. Parsed into a scratch counter: ingest owns PARSE_STATS.
+    first = evidence.get("first_seen") or evidence.get("timestamp") or evidence.get("event", {}).get("timestamp")
+    last = evidence.get("last_seen") or first
+    scratch = Counter()
+    return timestamps.to_epoch_ms(first, stats=scratch), timestamps.to_epoch_ms(last, stats=scratch)
 
+class ReportWriter:
+    def __init__(self, f, catalog, grouped=False):
+        self.f = f
+        self.catalog = catalog
+        self.grouped = grouped
+        self.sections = {}
+        self.groups = OrderedDict()
+        f.write("# AI-Assisted RMF Findings Summary\n")
+        f.write(f"_Generated: {datetime.now().isoformat(timespec='seconds')}_\n")
+
+    def section(self, key, header=None):
+        text = self.sections.get(key)
+        if text is None:
+            rule_id, severity, title, controls, template_name = key
+            template = self.catalog.get(template_name, self.catalog["default"])
+            finding = {"rule_id": rule_id, "severity": severity, "title": title, "nist_800_53_controls": list(controls)}
+            lines = [f"## [{severity}] {rule_id} — {title}\n", rmf_summary(finding),
+                     f"**Risk statement (RMF-style):** {template['risk_statement']}\n",
+                     "**Recommended actions:**"]
+            lines += [f"- {a}" for a in template["recommended_actions"]]
+            lines.append("")  # blank line
+            text = self.sections[key] = "".join("\n" + line for line in lines)
+        if header:
+            # Grouped sections carry the finding count in their heading
+            head, _, rest = text.partition("\n\n")
+            return f"{head} ({header})\n{rest}"
+        return text
+
+    def add(self, finding):
+        key = section_key(finding)
+        if not self.grouped:
+            self.f.write(self.section(key))
+            return
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {"count": 0, "entities": Counter(), "first": None, "last": None}
+        group["count"] += 1
+        evidence = finding.get("evidence") or {}
+        label = evidence_label(evidence)
+        if label:
+            group["entities"][label] += 1
+        first, last = evidence_times(evidence)
+        if first is not None and (group["first"] is None or first < group["first"]):
+            group["first"] = first
+        if last is not None and (group["last"] is None or last > group["last"]):
+            group["last"] = last
+
+    def close(self):
+        for key, group in self.groups.items():
+            n = group["count"]
+            self.f.write(self.section(key, f"{n} finding{'s' if n != 1 else ''}"))
+            if group["first"] is not None:
+                self.f.write(f"\n**Seen:** {timestamps.format_ms(group['first'])} to "
+                             f"{timestamps.format_ms(group['last'])}\n")
+            if group["entities"]:
+                self.f.write("\n**Top evidence:**")
+                for label, count in group["entities"].most_common(TOP_EVIDENCE):
+                    self.f.write(f"\n- {label} ({count})")
+                self.f.write("\n")
+
+def enrich(findings, catalog, report=None):
+    # Tags each finding with its template (copies; the input is not changed)
     for f in findings:
         rule_id = f.get("rule_id")
-        summary = rmf_summary(f)
-        risk = DEFAULT_RISK.get(rule_id, "Potential security risk identified; investigate and assess impact.")
-        actions = DEFAULT_ACTIONS.get(rule_id, ["Investigate and validate legitimacy.", "Document outcome and remediate as appropriate."])
+        f = dict(f, template=rule_id if rule_id in catalog else "default")
+        if report is not None:
+            report.add(f)
+        yield f
+
+def write_report(findings, path: Path, catalog, grouped=False):
+    with path.open("w", encoding="utf-8") as md:
+        report = ReportWriter(md, catalog, grouped)
+        for f in findings:
+            report.add(f)
+        report.close()
 
-        f["ai_summary"] = summary
-        f["risk_statement"] = risk
-        f["recommended_actions"] = actions
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrich findings with RMF risk statements and write the summary report.")
+    parser.add_argument("--group", action="store_true",
+                        help="one report section per rule/severity with counts and top evidence, instead of one per finding")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
 
-        enriched.append(f)
+    root = Path(__file__).resolve().parent
+    processed_dir = root / "data" / "processed"
+    in_findings = findings_path(processed_dir, "findings")
+    out_findings_path = processed_dir / "findings_enriched.jsonl"
+    out_templates = processed_dir / "enrichment_templates.json"
+    out_md = processed_dir / "ai_summary.md"
 
-        # Markdown section
-        lines.append(f"## [{f.get('severity')}] {f.get('rule_id')} — {f.get('title')}\n")
-        lines.append(summary)
-        lines.append(f"**Risk statement (RMF-style):** {risk}\n")
-        lines.append("**Recommended actions:**")
-        for a in actions:
-            lines.append(f"- {a}")
-        lines.append("")  # blank line
+    catalog = template_catalog()
+    out_templates.write_text(json.dumps(catalog, indent=2), encoding="utf-8")
 
-    out_findings_path.write_text(json.dumps(enriched, indent=2), encoding="utf-8")
-    out_md.write_text("\n".join(lines), encoding="utf-8")
+    with metrics.profiled("ai_summarize", args, processed_dir):
+        with out_md.open("w", encoding="utf-8") as md:
+            report = ReportWriter(md, catalog, grouped=args.group)
+            count = write_jsonl(enrich(iter_findings(in_findings), catalog, report), out_findings_path)
+            report.close()
+        metrics.note(findings=count)
 
-    print(f"[OK] Wrote: {out_findings_path}")
+    print(f"[OK] Wrote: {out_findings_path} ({count} findings)")
+    print(f"[OK] Wrote: {out_templates}")
     print(f"[OK] Wrote: {out_md}")
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import timestamps
+from colstore import ColumnStore, ColumnStoreWriter
+
+# Time-partitioned archive of normalized events for historical hunts.
+# Events are appended to one column store per UTC hour:
+#   data/archive/<YYYY-MM-DD>/<HH>.cols/    (events without a ts: unknown.cols/)
+# catalog.json records, per partition, the committed row count, min/max ts,
+# the set of event IDs and a bloom filter of host names. A query reads only
+# the catalog to decide which partitions can hold matching rows, so a hunt
+# for one event ID or one week never opens the rest of the archive.
+#
+# The catalog is the commit point: it is replaced atomically after the
+# partitions are closed, and rows a partition holds beyond its catalog
+# count (an interrupted archive run) are ignored by readers and truncated
+# by the next writer.
+#
+# Archiving is idempotent on content: a store row is added only when its
+# partition does not already hold that event, so a store rebuilt by a plain
+# run_day1.py (a new generation with the same events) adds nothing. Copies
+# are counted, so an event logged twice is archived twice. catalog["sources"]
+# records the row count archived per store generation, which lets an
+# unchanged store skip the scan.
+
+CATALOG_FILE = "catalog.json"
+CATALOG_VERSION = 1
+UNKNOWN = "unknown"
+BLOOM_BITS = 8192
+BLOOM_HASHES = 4
+
+# -----------------------
+# Host bloom filter
+# -----------------------
+class BloomFilter:
+    # Host names are matched case-insensitively
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray(bits // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha1(str(value).lower().encode("utf-8")).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], "little") % self.bits
+
+    def add(self, value):
+        for p in self._positions(value):
+            self.data[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, value):
+        return all(self.data[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+    def to_hex(self):
+        return self.data.hex()
+
+    @classmethod
+    def from_hex(cls, text, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        return cls(bits, hashes, bytes.fromhex(text))
+
+# -----------------------
+# Catalog
+# -----------------------
+def partition_name(ts):
+    if ts is None:
+        return UNKNOWN
+    dt = timestamps.to_datetime(ts)
+    return f"{dt:%Y-%m-%d}/{dt:%H}"
+
+def partition_path(archive_dir: Path, name):
+    return archive_dir / f"{name}.cols"
+
+def load_catalog(archive_dir: Path):
+    path = archive_dir / CATALOG_FILE
+    if path.exists():
+        catalog = json.loads(path.read_text(encoding="utf-8"))
+        if catalog.get("version") == CATALOG_VERSION:
+            return catalog
+    return {"version": CATALOG_VERSION, "partitions": {}, "sources": {}}
+
+def save_catalog(archive_dir: Path, catalog):
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / CATALOG_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(catalog, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+def may_match(entry, start=None, end=None, event_ids=None, hosts=None):
+    # start is inclusive, end exclusive (epoch ms)
+    if start is not None or end is not None:
+        if entry["min_ts"] is None:
+            return False
+        if start is not None and entry["max_ts"] < start:
+            return False
+        if end is not None and entry["min_ts"] >= end:
+            return False
+    if event_ids is not None and not set(entry["event_ids"]) & set(event_ids):
+        return False
+    if hosts:
+        bloom = BloomFilter.from_hex(entry["hosts_bloom"])
+        if not any(h in bloom for h in hosts):
+            return False
+    return True
+
+# -----------------------
+# Writer
+# -----------------------
+class ArchiveWriter:
+    # Keeps at most max_open partition writers open (least recently used
+    # are closed), since rows from a long store spread over many hours
+    def __init__(self, archive_dir: Path, max_open=8):
+        self.archive_dir = Path(archive_dir)
+        self.catalog = load_catalog(self.archive_dir)
+        self.max_open = max_open
+        self.open = OrderedDict()
+        self.blooms = {}
+        self.held = {}
+        self.added = 0
+
+    def _writer(self, name):
+        w = self.open.get(name)
+        if w is not None:
+            self.open.move_to_end(name)
+            return w
+        if len(self.open) >= self.max_open:
+            self._close(*self.open.popitem(last=False))
+
+        entry = self.catalog["partitions"].get(name)
+        path = partition_path(self.archive_dir, name)
+        if entry is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            w = ColumnStoreWriter(path)
+            self.catalog["partitions"][name] = {"rows": 0, "min_ts": None, "max_ts": None, "event_ids": [],
+                                                "hosts_bloom": BloomFilter().to_hex(), "generation": w.generation}
+        else:
+            w = ColumnStoreWriter(path, append=True, rows=entry["rows"])
+        self.open[name] = w
+        return w
+
+    def existing(self, name):
+        # Content keys (with copies) of the rows a partition held when this
+        # writer started
+        held = self.held.get(name)
+        if held is None:
+            held = self.held[name] = Counter()
+            entry = self.catalog["partitions"].get(name)
+            if entry and entry["rows"]:
+                store = ColumnStore(partition_path(self.archive_dir, name))
+                held.update(row_key(row) for row in store.iter_rows(stop=entry["rows"]))
+        return held
+
+    def add(self, row):
+        name = partition_name(row.get("ts"))
+        self._writer(name).append(row)
+        entry = self.catalog["partitions"][name]
+        entry["rows"] += 1
+        ts = row.get("ts")
+        if ts is not None:
+            entry["min_ts"] = ts if entry["min_ts"] is None else min(entry["min_ts"], ts)
+            entry["max_ts"] = ts if entry["max_ts"] is None else max(entry["max_ts"], ts)
+        if row.get("event_id") is not None and row["event_id"] not in entry["event_ids"]:
+            entry["event_ids"].append(row["event_id"])
+        if row.get("host"):
+            bloom = self.blooms.get(name)
+            if bloom is None:
+                bloom = self.blooms[name] = BloomFilter.from_hex(entry["hosts_bloom"])
+            bloom.add(row["host"])
+        self.added += 1
+
+    def _close(self, name, w):
+        w.close()
+        self.catalog["partitions"][name]["ordered"] = w.ordered
+
+    def close(self):
+        for name, w in self.open.items():
+            self._close(name, w)
+        self.open.clear()
+        for name, bloom in self.blooms.items():
+            self.catalog["partitions"][name]["hosts_bloom"] = bloom.to_hex()
+        for entry in self.catalog["partitions"].values():
+            entry["event_ids"].sort()
+        save_catalog(self.archive_dir, self.catalog)
+        return self.added
+
+def row_key(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode("utf-8")).digest()
+
+def archive_store(store_path: Path, archive_dir: Path):
+    # Appends the rows of a normalized store that are not archived yet
+    store = ColumnStore(store_path)
+    writer = ArchiveWriter(archive_dir)
+    if writer.catalog["sources"].get(store.generation) == store.rows:
+        return writer.close()
+    seen = Counter()
+    for row in store.iter_rows():
+        name = partition_name(row.get("ts"))
+        key = row_key(row)
+        held = writer.existing(name)[key]
+        if held:
+            seen[name, key] += 1
+            if seen[name, key] <= held:
+                continue
+        writer.add(row)
+    writer.catalog["sources"][store.generation] = store.rows
+    return writer.close()
+
+# -----------------------
+# Reader
+# -----------------------
+class Archive:
+    def __init__(self, archive_dir: Path):
+        self.archive_dir = Path(archive_dir)
+        self.catalog = load_catalog(self.archive_dir)
+        self.opened = 0
+        self._stores = {}
+        # Partitions cover disjoint hours and are read oldest first, so rows
+        # come out time-ordered when every partition was written in order
+        self.ordered = all(e.get("ordered", False) for e in self.catalog["partitions"].values() if e["rows"])
+
+    def partitions(self, start=None, end=None, event_ids=None, hosts=None):
+        return [name for name, entry in sorted(self.catalog["partitions"].items())
+                if entry["rows"] and may_match(entry, start, end, event_ids, hosts)]
+
+    def store(self, name):
+        store = self._stores.get(name)
+        if store is None:
+            store = self._stores[name] = ColumnStore(partition_path(self.archive_dir, name))
+            self.opened += 1
+        return store
+
+    def iter_rows(self, start=None, end=None, event_ids=None, hosts=None, columns=None, ref=False):
+        # Rows of the matching partitions, oldest partition first, filtered
+        # on ts/host here; event_ids is pushed down to ColumnStore.iter_rows
+        wanted_hosts = {h.lower() for h in hosts} if hosts else None
+        need = extra = None
+        if columns is not None:
+            need = sorted(set(columns) | {"ts", "host"})
+            extra = set(need) - set(columns)
+        for name in self.partitions(start, end, event_ids, hosts):
+            store = self.store(name)
+            for row in store.iter_rows(need, event_ids, ref=ref, stop=self.catalog["partitions"][name]["rows"]):
+                ts = row.get("ts")
+                if start is not None and (ts is None or ts < start):
+                    continue
+                if end is not None and (ts is None or ts >= end):
+                    continue
+                if wanted_hosts is not None and str(row.get("host", "")).lower() not in wanted_hosts:
+                    continue
+                if extra:
+                    for k in extra:
+                        del row[k]
+                yield row
+
+    def resolve(self, ref, columns=None):
+        # event_ref of a finding made from archive rows -> the full event
+        generation = ref.rpartition(":")[0]
+        for name, entry in self.catalog["partitions"].items():
+            if entry["generation"] == generation:
+                return self.store(name).resolve(ref, columns)
+        raise KeyError(f"Event reference {ref} is not in the archive")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the time-partitioned event archive.")
+    parser.add_argument("command", choices=["add", "ls"])
+    parser.add_argument("--store", help="normalized store to archive (default data/processed/normalized_events.cols)")
+    parser.add_argument("--archive", help="archive directory (default data/archive)")
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    archive_dir = Path(args.archive) if args.archive else root / "data" / "archive"
+
+    if args.command == "add":
+        store_path = Path(args.store) if args.store else root / "data" / "processed" / "normalized_events.cols"
+        if not ColumnStore.exists(store_path):
+            raise SystemExit(f"[ERROR] No column store at {store_path}; run: python run_day1.py")
+        added = archive_store(store_path, archive_dir)
+        print(f"[OK] Archived {added} new events -> {archive_dir}")
+        return
+
+    catalog = load_catalog(archive_dir)
+    for name, entry in sorted(catalog["partitions"].items()):
+        span = ""
+        if entry["min_ts"] is not None:
+            span = f" {timestamps.format_ms(entry['min_ts'])} .. {timestamps.format_ms(entry['max_ts'])}"
+        print(f"{name}: rows={entry['rows']}{span} event_ids={entry['event_ids']}")
+    print(f"[INFO] {len(catalog['partitions'])} partitions, "
+          f"{sum(e['rows'] for e in catalog['partitions'].values())} events")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import generate_logs
+from findings_io import iter_findings
+
+# End-to-end benchmark harness. Generates a seeded dataset into a scratch
+# copy of the repo, runs every stage as its own process and records wall
+# time, CPU time and peak RSS per stage in a JSON results file. --compare
+# checks the run against an earlier results file and exits non-zero when a
+# stage slowed down by more than --threshold.
+
+REPO_ROOT = Path(__file__).resolve().parent
+
+STAGES = [
+    ("run_day1", ["run_day1.py"]),
+    ("detect", ["detect.py"]),
+    ("ai_summarize", ["ai_summarize.py"]),
+    ("poam_export", ["poam_export.py"]),
+    ("ticketing", ["ticketing.py"]),
+    ("dashboard", ["dashboard.py"]),
+]
+
+def git_commit():
+    try:
+        r = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(REPO_ROOT),
+                           capture_output=True, text=True, check=False)
+        return r.stdout.strip() or None
+    except OSError:
+        return None
+
+def make_workspace(tmp: Path):
+    for p in REPO_ROOT.glob("*.py"):
+        shutil.copy2(p, tmp / p.name)
+    (tmp / "data" / "processed").mkdir(parents=True)
+    return tmp
+
+def run_stage(workspace: Path, args):
+    # wait4 gives this child's own rusage (peak RSS, CPU); where it is not
+    # available (Windows) only wall time is recorded.
+    stats = {}
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        p = subprocess.Popen([sys.executable] + args, cwd=str(workspace), stdout=subprocess.DEVNULL, stderr=err)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(p.pid, 0)
+            returncode = p.returncode = os.waitstatus_to_exitcode(status)
+            scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KiB elsewhere
+            stats["cpu_s"] = round(usage.ru_utime + usage.ru_stime, 3)
+            stats["peak_rss_mb"] = round(usage.ru_maxrss * scale / (1024 * 1024), 1)
+        else:
+            returncode = p.wait()
+        stats["wall_s"] = round(time.perf_counter() - t0, 3)
+
+        if returncode != 0:
+            err.seek(0)
+            raise RuntimeError(f"{' '.join(args)} failed ({returncode}):\n{err.read().decode('utf-8', 'replace')}")
+    return stats
+
+def run_benchmark(events, seed=1, mix=None, stage_args=None, keep=None):
+    stage_args = stage_args or {}
+    with tempfile.TemporaryDirectory(prefix="rmf-bench-") as tmp:
+        workspace = make_workspace(Path(tmp))
+        t0 = time.perf_counter()
+        counts = generate_logs.generate(workspace / "data" / "raw", events, seed=seed, mix=mix)
+        print(f"[INFO] Generated {events} events in {time.perf_counter() - t0:.1f}s")
+
+        stages = {}
+        for name, args in STAGES:
+            stats = run_stage(workspace, args + stage_args.get(name, []))
+            stats["events_per_s"] = round(events / stats["wall_s"], 1) if stats["wall_s"] else None
+            stages[name] = stats
+            print(f"[BENCH] {name:<13} wall={stats['wall_s']:.3f}s cpu={stats.get('cpu_s', '-')}s "
+                  f"rss={stats.get('peak_rss_mb', '-')}MB")
+
+        findings = sum(1 for _ in iter_findings(workspace / "data" / "processed" / "findings.jsonl"))
+        if keep:
+            shutil.copytree(workspace / "data", Path(keep), dirs_exist_ok=True)
+
+    return {
+        "commit": git_commit(),
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "events": events,
+        "seed": seed,
+        "sources": counts,
+        "findings": findings,
+        "stages": stages,
+    }
+
+def compare(current, baseline, threshold=0.2, metric="wall_s"):
+    # Returns (stage, baseline, current, ratio) for every stage whose metric
+    # grew by more than threshold (0.2 = 20% slower).
+    regressions = []
+    for name, stats in current["stages"].items():
+        old = baseline.get("stages", {}).get(name, {}).get(metric)
+        new = stats.get(metric)
+        if not old or new is None:
+            continue
+        ratio = new / old
+        if ratio > 1 + threshold:
+            regressions.append((name, old, new, ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on generated data.")
+    parser.add_argument("--size", choices=sorted(generate_logs.SIZES), default="small")
+    parser.add_argument("--events", type=int, help="exact event count (overrides --size)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mix", help="event mix, see generate_logs.py --mix")
+    parser.add_argument("--stage-arg", action="append", default=[], metavar="STAGE=ARG",
+                        help="extra argument for a stage, e.g. detect=--backend=numpy (repeatable)")
+    parser.add_argument("--out", default="bench_results.json", help="results JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown before a stage counts as a regression (default 0.2 = 20%%)")
+    parser.add_argument("--keep", metavar="DIR", help="copy the generated data/ tree here")
+    args = parser.parse_args(argv)
+
+    stage_args = {}
+    for item in args.stage_arg:
+        stage, _, value = item.partition("=")
+        stage_args.setdefault(stage, []).append(value)
+
+    events = args.events or generate_logs.SIZES[args.size]
+    results = run_benchmark(events, args.seed, generate_logs.parse_mix(args.mix), stage_args, args.keep)
+    Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote: {args.out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, ratio in regressions:
+            print(f"[REGRESSION] {name}: {old:.3f}s -> {new:.3f}s ({ratio:.2f}x)")
+        if regressions:
+            raise SystemExit(1)
+        print(f"[OK] No stage slower than {args.threshold:.0%} vs {args.compare} (commit {baseline.get('commit')})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import json
+import mmap
+import os
+import shutil
+import sys
+import uuid
+from array import array
+from itertools import accumulate, islice
+from pathlib import Path
+
+from timestamps import to_epoch_ms
+
+# Columnar store for the normalized stage. A store is a directory holding one
+# file per column plus meta.json:
+#   int64 columns -> <name>.i64            (little-endian int64, MISSING = null)
+#   dict columns  -> <name>.codes + .dict.json (int32 codes into a value list)
+#   str columns   -> <name>.offsets + .data     (int64 offsets into utf-8 bytes)
+# Readers memory-map only the columns they touch; int64 and code columns are
+# exposed as zero-copy memoryviews (or NumPy arrays when NumPy is installed).
+
+FORMAT_VERSION = 1
+MISSING = -(2 ** 63)
+FLUSH_ROWS = 65536
+
+SCHEMA = {
+    "source": "dict",
+    "host": "dict",
+    "timestamp": "str",
+    "ts": "int64",
+    "event_id": "int64",
+    "level": "dict",
+    "provider": "dict",
+    "user": "dict",
+    "ip": "dict",
+    "message": "str",
+    "tags": "dict",
+}
+
+# Columns that make up a normalized event record
+EVENT_COLUMNS = ["source", "host", "timestamp", "event_id", "level", "provider", "user", "ip", "message", "tags", "ts"]
+
+if sys.byteorder != "little":
+    raise ImportError("colstore expects a little-endian platform")
+
+# -----------------------
+# Writer
+# -----------------------
+class ColumnStoreWriter:
+    # append=True extends an existing store in place. meta.json is written
+    # last, so anything past the committed row count (an interrupted append)
+    # is truncated away before new rows are added. `rows` lowers that count
+    # for callers that commit row counts elsewhere (see archive.py). meta
+    # also records whether ts never decreases (rows without a ts aside), so
+    # readers can use bounded per-key state instead of sorting.
+    def __init__(self, path: Path, append=False, rows=None):
+        self.path = Path(path)
+        self.files = {}
+        self.buffers = {}
+        self.dicts = {}
+        self.str_offset = {}
+        self.remaps = {}
+
+        if append and ColumnStore.exists(self.path):
+            meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+            self.rows = meta["rows"] if rows is None else min(rows, meta["rows"])
+            self.generation = meta["generation"]
+            # a truncated append may have dropped the row that set last_ts
+            self.ordered = meta.get("ordered", False) and self.rows == meta["rows"]
+            self.last_ts = meta.get("last_ts")
+            self._open_existing()
+            return
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        self.rows = 0
+        self.generation = uuid.uuid4().hex
+        self.ordered = True
+        self.last_ts = None
+
+        for name, kind in SCHEMA.items():
+            if kind == "int64":
+                self.files[name] = (self.path / f"{name}.i64").open("wb")
+                self.buffers[name] = array("q")
+            elif kind == "dict":
+                self.files[name] = (self.path / f"{name}.codes").open("wb")
+                self.buffers[name] = array("i")
+                self.dicts[name] = {}
+            else:
+                self.files[name] = (self.path / f"{name}.data").open("wb")
+                self.files[name + ".offsets"] = (self.path / f"{name}.offsets").open("wb")
+                self.buffers[name] = array("q", [0])
+                self.str_offset[name] = 0
+
+    def _open_existing(self):
+        def reopen(filename, size):
+            f = (self.path / filename).open("r+b")
+            f.truncate(size)
+            f.seek(size)
+            return f
+
+        for name, kind in SCHEMA.items():
+            if kind == "int64":
+                self.files[name] = reopen(f"{name}.i64", self.rows * 8)
+                self.buffers[name] = array("q")
+            elif kind == "dict":
+                values = json.loads((self.path / f"{name}.dict.json").read_text(encoding="utf-8"))
+                self.files[name] = reopen(f"{name}.codes", self.rows * 4)
+                self.buffers[name] = array("i")
+                self.dicts[name] = {v: i for i, v in enumerate(values)}
+            else:
+                offsets = self.files[name + ".offsets"] = reopen(f"{name}.offsets", (self.rows + 1) * 8)
+                offsets.seek(self.rows * 8)
+                end = array("q")
+                end.frombytes(offsets.read(8))
+                self.files[name] = reopen(f"{name}.data", end[0])
+                self.buffers[name] = array("q")
+                self.str_offset[name] = end[0]
+
+    def append(self, row: dict):
+        for name, kind in SCHEMA.items():
+            if name == "ts" and "ts" not in row:
+                value = to_epoch_ms(row.get("timestamp"))
+            else:
+                value = row.get(name)
+
+            if kind == "int64":
+                value = None if value is None else int(value)
+                self.buffers[name].append(MISSING if value is None else value)
+                if name == "ts" and value is not None:
+                    if self.last_ts is not None and value < self.last_ts:
+                        self.ordered = False
+                    self.last_ts = value if self.last_ts is None else max(self.last_ts, value)
+            elif kind == "dict":
+                value = "" if value is None else str(value)
+                codes = self.dicts[name]
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                self.buffers[name].append(code)
+            else:
+                data = ("" if value is None else str(value)).encode("utf-8")
+                self.files[name].write(data)
+                self.str_offset[name] += len(data)
+                self.buffers[name].append(self.str_offset[name])
+
+        self.rows += 1
+        if self.rows % FLUSH_ROWS == 0:
+            self.flush()
+
+    def _remap(self, store, name):
+        # The other store's codes for a dict column -> codes in this one
+        remap = self.remaps.get((store.generation, name))
+        if remap is None:
+            codes = self.dicts[name]
+            remap = [codes.setdefault(v, len(codes)) for v in store.dictionary(name)]
+            self.remaps[store.generation, name] = remap
+        return remap
+
+    def copy_rows(self, stores, picks):
+        # Appends rows of other stores, given as (store index, row) pairs,
+        # column by column: int64 values and string bytes are copied as they
+        # are and dict codes are translated, so no row is decoded into a dict
+        # and encoded again
+        for name, kind in SCHEMA.items():
+            cols = [s.column(name) for s in stores]
+            buf = self.buffers[name]
+            if kind == "int64":
+                buf.extend(cols[i][j] for i, j in picks)
+            elif kind == "dict":
+                remaps = [self._remap(s, name) for s in stores]
+                buf.extend(remaps[i][cols[i].codes[j]] for i, j in picks)
+            else:
+                offsets = [c.offsets for c in cols]
+                data = [c.data for c in cols]
+                chunks = [data[i][offsets[i][j]:offsets[i][j + 1]] for i, j in picks]
+                self.files[name].write(b"".join(chunks))
+                buf.extend(islice(accumulate(map(len, chunks), initial=self.str_offset[name]), 1, None))
+                if chunks:
+                    self.str_offset[name] = buf[-1]
+
+        for value in self.buffers["ts"][-len(picks):] if picks else ():
+            if value != MISSING:
+                if self.last_ts is not None and value < self.last_ts:
+                    self.ordered = False
+                self.last_ts = value if self.last_ts is None else max(self.last_ts, value)
+        self.rows += len(picks)
+        self.flush()
+
+    def flush(self):
+        for name, kind in SCHEMA.items():
+            buf = self.buffers[name]
+            if kind == "str":
+                buf.tofile(self.files[name + ".offsets"])
+            else:
+                buf.tofile(self.files[name])
+            del buf[:]
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        for name, codes in self.dicts.items():
+            values = sorted(codes, key=codes.get)
+            (self.path / f"{name}.dict.json").write_text(json.dumps(values), encoding="utf-8")
+        meta = {"version": FORMAT_VERSION, "generation": self.generation, "rows": self.rows, "columns": SCHEMA,
+                "ordered": self.ordered, "last_ts": self.last_ts}
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path / "meta.json")
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        # Closes the files without committing: meta.json keeps the last
+        # committed row count, and the next append truncates back to it
+        for f in self.files.values():
+            f.close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_store(events, path: Path, append=False):
+    with ColumnStoreWriter(path, append=append) as w:
+        for e in events:
+            w.append(e)
+    return w.rows
+
+# -----------------------
+# Reader
+# -----------------------
+def _map(path: Path):
+    with path.open("rb") as f:
+        if path.stat().st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class DictColumn:
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+class StrColumn:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+class ColumnStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported column store version: {meta.get('version')}")
+        self.rows = meta["rows"]
+        self.generation = meta.get("generation")
+        self.ordered = meta.get("ordered", False)
+        self.schema = meta["columns"]
+        self._columns = {}
+
+    @staticmethod
+    def exists(path: Path):
+        return (Path(path) / "meta.json").exists()
+
+    def _raw(self, filename):
+        return memoryview(_map(self.path / filename))
+
+    def column(self, name):
+        col = self._columns.get(name)
+        if col is not None:
+            return col
+
+        # Files may run past the committed row count (an interrupted
+        # append), so every view stops at meta's rows
+        kind = self.schema[name]
+        if kind == "int64":
+            col = self._raw(f"{name}.i64").cast("q")[:self.rows]
+        elif kind == "dict":
+            values = json.loads((self.path / f"{name}.dict.json").read_text(encoding="utf-8"))
+            col = DictColumn(self._raw(f"{name}.codes").cast("i")[:self.rows], values)
+        else:
+            col = StrColumn(self._raw(f"{name}.offsets").cast("q")[:self.rows + 1], self._raw(f"{name}.data"))
+        self._columns[name] = col
+        return col
+
+    def numpy(self, name):
+        # Zero-copy NumPy view of an int64 column or of a dict column's codes.
+        import numpy as np
+
+        kind = self.schema[name]
+        if kind == "int64":
+            return np.frombuffer(self._raw(f"{name}.i64"), dtype="<i8")[:self.rows]
+        if kind == "dict":
+            return np.frombuffer(self._raw(f"{name}.codes"), dtype="<i4")[:self.rows]
+        raise ValueError(f"Column {name} is not numeric")
+
+    def dictionary(self, name):
+        return self.column(name).values
+
+    def row(self, i, columns=None, ref=False):
+        # ref=True adds "_ref": "<generation>:<row>", a stable pointer back
+        # to this row for findings to carry instead of a copy of the event
+        out = {}
+        for name in columns or EVENT_COLUMNS:
+            value = self.column(name)[i]
+            if self.schema[name] == "int64" and value == MISSING:
+                value = None
+            out[name] = value
+        if ref:
+            out["_ref"] = f"{self.generation}:{i}"
+        return out
+
+    def resolve(self, ref, columns=None):
+        generation, _, i = ref.rpartition(":")
+        if generation != self.generation:
+            raise KeyError(f"Event reference {ref} is from another store generation")
+        return self.row(int(i), columns)
+
+    def iter_rows(self, columns=None, event_ids=None, start=0, ref=False, stop=None):
+        # event_ids filters on the event_id column before any other column is
+        # decoded, so unsubscribed rows cost one integer comparison.
+        ids = self.column("event_id")
+        for i in range(start, self.rows if stop is None else min(stop, self.rows)):
+            if event_ids is None or ids[i] in event_ids:
+                yield self.row(i, columns, ref)
@@ -1,56 +1,135 @@
+import argparse
 import json
+from collections import Counter
 from pathlib import Path
 from datetime import datetime, date
 
+import metrics
+from ticket_index import open_index
+
 STATUS_DIRS = ["open", "in_progress", "awaiting_validation", "closed"]
 SEV_ORDER = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
 
-def load_all_tickets(root: Path):
-    tickets = []
-    for status in STATUS_DIRS:
-        folder = root / "tickets" / status
-        if not folder.exists():
-            continue
-        for p in folder.glob("*.json"):
-            t = json.loads(p.read_text(encoding="utf-8-sig"))
-            t["_path"] = str(p)
-            t["_status_dir"] = status
-            tickets.append(t)
-    return tickets
-
-def is_overdue(ticket):
+def is_overdue(ticket, today=None):
     try:
         due = date.fromisoformat(ticket.get("due_date"))
-        return date.today() > due and ticket.get("status") != "Closed"
+        return (today or date.today()) > due and ticket.get("status") != "Closed"
     except Exception:
         return False
 
-def main():
-    root = Path(__file__).resolve().parent
-    out_md = root / "DASHBOARD.md"
-
-    tickets = load_all_tickets(root)
-
-    by_status = {s: 0 for s in STATUS_DIRS}
-    by_sev = {}
-    overdue = []
-
-    for t in tickets:
-        s = t.get("_status_dir") or "open"
-        by_status[s] += 1
-        sev = t.get("severity", "Unknown")
-        by_sev[sev] = by_sev.get(sev, 0) + 1
-        if is_overdue(t):
-            overdue.append(t)
-
-    active = [t for t in tickets if t.get("_status_dir") in ("open", "in_progress", "awaiting_validation")]
-    active.sort(key=lambda x: (SEV_ORDER.get(x.get("severity", "Low"), 99), x.get("due_date","9999-12-31")))
-
-    control_counts = {}
-    for t in tickets:
-        controls = str(t.get("nist_controls","")).split(",")
-        for c in [x.strip() for x in controls if x.strip()]:
-            control_counts[c] = control_counts.get(c, 0) + 1
+# -----------------------
+# Persisted aggregates
+# -----------------------
+# Status, severity and control counts and the set of overdue tickets live in
+# the ticket index database. Each run reads the index's change log, subtracts
+# every changed ticket's previously counted fields and adds its current ones,
+# then clears the consumed entries. Overdue flags are re-evaluated only for
+# changed tickets and for tickets whose due date fell between the last run's
+# date and today. A rebuilt index (new epoch) or --full recomputes everything.
+DASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dash_counts (kind TEXT, name TEXT, n INTEGER NOT NULL, PRIMARY KEY (kind, name));
+CREATE TABLE IF NOT EXISTS dash_overdue (ticket_id TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS dash_state (key TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX IF NOT EXISTS tickets_active ON tickets ({order}) WHERE status_dir != 'closed';
+"""
+ACTIVE_ORDER = ("CASE COALESCE(severity, 'Low') WHEN 'Critical' THEN 0 WHEN 'High' THEN 1 "
+                "WHEN 'Medium' THEN 2 WHEN 'Low' THEN 3 ELSE 99 END, "
+                "COALESCE(due_date, '9999-12-31'), ticket_id")
+
+def contributions(row):
+    yield "status", row["status_dir"]
+    yield "severity", row["severity"] if row["severity"] is not None else "Unknown"
+    for c in str(row["controls"] or "").split(","):
+        if c.strip():
+            yield "control", c.strip()
+
+def set_overdue(conn, ticket_id, row, today):
+    if row is not None and is_overdue(row, today):
+        conn.execute("INSERT OR IGNORE INTO dash_overdue VALUES (?)", (ticket_id,))
+    else:
+        conn.execute("DELETE FROM dash_overdue WHERE ticket_id = ?", (ticket_id,))
+
+def add_counts(conn, delta):
+    for (kind, name), n in delta.items():
+        if n:
+            conn.execute("INSERT INTO dash_counts VALUES (?, ?, ?) "
+                         "ON CONFLICT (kind, name) DO UPDATE SET n = n + excluded.n", (kind, name, n))
+    conn.execute("DELETE FROM dash_counts WHERE n = 0")
+
+def refresh_all(idx, today):
+    conn = idx.conn
+    conn.execute("DELETE FROM dash_counts")
+    conn.execute("DELETE FROM dash_overdue")
+    delta = Counter()
+    for row in idx.rows():
+        delta.update(contributions(row))
+        set_overdue(conn, row["ticket_id"], row, today)
+    add_counts(conn, delta)
+    conn.execute("DELETE FROM changes")
+    return idx.count()
+
+def apply_changes(idx, today, last_date):
+    conn = idx.conn
+    log = conn.execute("SELECT seq, ticket_id, old FROM changes ORDER BY seq").fetchall()
+    # The first logged entry holds what the last run counted for the ticket
+    first = {}
+    for _, ticket_id, old in log:
+        first.setdefault(ticket_id, old)
+
+    delta = Counter()
+    for ticket_id, old in first.items():
+        if old is not None:
+            delta.subtract(contributions(json.loads(old)))
+        row = idx.get(ticket_id)
+        if row is not None:
+            delta.update(contributions(row))
+        set_overdue(conn, ticket_id, row, today)
+    add_counts(conn, delta)
+
+    if today.isoformat() != last_date:
+        crossed = conn.execute("SELECT ticket_id, status, due_date FROM tickets WHERE due_date >= ? AND due_date < ?",
+                               (last_date, today.isoformat())).fetchall()
+        for ticket_id, status, due_date in crossed:
+            set_overdue(conn, ticket_id, {"status": status, "due_date": due_date}, today)
+
+    if log:
+        conn.execute("DELETE FROM changes WHERE seq <= ?", (log[-1][0],))
+    return len(first)
+
+def update_aggregates(idx, today=None, full=False):
+    # Returns (mode, tickets touched)
+    today = today or date.today()
+    conn = idx.conn
+    conn.executescript(DASH_SCHEMA.format(order=ACTIVE_ORDER))
+    state = dict(conn.execute("SELECT key, value FROM dash_state").fetchall())
+    last_date = state.get("date")
+
+    with idx.batch():
+        if full or state.get("epoch") != idx.epoch() or last_date is None or last_date > today.isoformat():
+            mode, touched = "full", refresh_all(idx, today)
+        else:
+            mode, touched = "incremental", apply_changes(idx, today, last_date)
+        conn.execute("INSERT OR REPLACE INTO dash_state VALUES ('epoch', ?)", (idx.epoch(),))
+        conn.execute("INSERT OR REPLACE INTO dash_state VALUES ('date', ?)", (today.isoformat(),))
+    return mode, touched
+
+# -----------------------
+# Rendering
+# -----------------------
+def render(idx):
+    conn = idx.conn
+    counts = {}
+    for kind, name, n in conn.execute("SELECT kind, name, n FROM dash_counts WHERE kind != 'control'"):
+        counts.setdefault(kind, {})[name] = n
+    by_status = counts.get("status", {})
+    by_sev = counts.get("severity", {})
+
+    overdue = conn.execute("SELECT t.ticket_id, t.severity, t.due_date, t.weakness FROM dash_overdue o "
+                           "JOIN tickets t ON t.ticket_id = o.ticket_id ORDER BY t.due_date, t.ticket_id").fetchall()
+    active = conn.execute(f"SELECT ticket_id, status_dir, severity, due_date, weakness FROM tickets "
+                          f"WHERE status_dir != 'closed' ORDER BY {ACTIVE_ORDER} LIMIT 10").fetchall()
+    controls = conn.execute("SELECT name, n FROM dash_counts WHERE kind = 'control' "
+                            "ORDER BY n DESC, name LIMIT 15").fetchall()
 
     lines = []
     lines.append("# RMF Ticketing Dashboard")
@@ -58,7 +137,7 @@ def main():
 
     lines.append("## Status Summary")
     for s in STATUS_DIRS:
-        lines.append(f"- **{s}**: {by_status[s]}")
+        lines.append(f"- **{s}**: {by_status.get(s, 0)}")
     lines.append("")
 
     lines.append("## Severity Summary")
@@ -70,26 +149,45 @@ def main():
     if not overdue:
         lines.append("- None")
     else:
-        for t in sorted(overdue, key=lambda x: x.get("due_date","")):
-            lines.append(f"- **{t['ticket_id']}** ({t.get('severity')}) due {t.get('due_date')} — {t.get('weakness')}")
+        for ticket_id, sev, due, weakness in overdue:
+            lines.append(f"- **{ticket_id}** ({sev}) due {due} — {weakness}")
     lines.append("")
 
     lines.append("## Top Active Tickets (by severity then due date)")
     if not active:
         lines.append("- None")
     else:
-        for t in active[:10]:
-            lines.append(f"- **{t['ticket_id']}** [{t.get('_status_dir')}] ({t.get('severity')}) due {t.get('due_date')} — {t.get('weakness')}")
+        for ticket_id, status_dir, sev, due, weakness in active:
+            lines.append(f"- **{ticket_id}** [{status_dir}] ({sev}) due {due} — {weakness}")
     lines.append("")
 
     lines.append("## NIST 800-53 Control Impact Rollup")
-    for c, cnt in sorted(control_counts.items(), key=lambda x: (-x[1], x[0]))[:15]:
+    for c, cnt in controls:
         lines.append(f"- **{c}**: {cnt}")
     lines.append("")
+    return lines
+
+def write_dashboard(root: Path, full=False):
+    out_md = root / "DASHBOARD.md"
+
+    idx = open_index(root)
+    mode, touched = update_aggregates(idx, full=full)
+    print(f"[INFO] Aggregates updated ({mode}): {touched} tickets")
+    metrics.note(mode=mode, tickets_touched=touched)
 
-    out_md.write_text("\n".join(lines), encoding="utf-8")
+    out_md.write_text("\n".join(render(idx)), encoding="utf-8")
     print(f"[OK] Wrote: {out_md}")
+    return out_md
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render DASHBOARD.md from the ticket index.")
+    parser.add_argument("--full", action="store_true", help="recompute all aggregates instead of applying changes")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    with metrics.profiled("dashboard", args, root / "data" / "processed"):
+        write_dashboard(root, full=args.full)
 
 if __name__ == "__main__":
     main()
-
@@ -1,153 +1,831 @@
+import argparse
 import json
 import csv
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque, namedtuple
+
+import metrics
+import timestamps
+from archive import Archive
+from colstore import ColumnStore
+from findings_io import findings_path, iter_findings, write_jsonl
 
 # -----------------------
 # Helpers
 # -----------------------
-def load_normalized_csv(path: Path):
-    rows = []
+def iter_normalized_csv(path: Path):
     with path.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         for r in reader:
             r["event_id"] = int(r["event_id"]) if r.get("event_id") else None
-            rows.append(r)
-    return rows
+            # CSVs written before the ts column existed are parsed here
+            r["ts"] = int(r["ts"]) if r.get("ts") else timestamps.to_epoch_ms(r.get("timestamp"))
+            yield r
+
+def load_normalized_csv(path: Path):
+    return list(iter_normalized_csv(path))
+
+def iter_normalized(processed_dir: Path, rules=None):
+    # Prefers the columnar store written by run_day1; falls back to the CSV.
+    # With a store, only rows whose event_id some rule subscribes to are
+    # decoded, and only the columns those rules need.
+    store_path = processed_dir / "normalized_events.cols"
+    if ColumnStore.exists(store_path):
+        store = ColumnStore(store_path)
+        if rules is None:
+            return store.iter_rows(ref=True)
+        return store.iter_rows(columns=required_columns(rules), event_ids=set(build_routes(rules)), ref=True)
+    return iter_normalized_csv(processed_dir / "normalized_events.csv")
 
 def parse_ts(ts: str):
-    if not ts:
-        return None
-    try:
-        ts = ts.replace("Z", "+00:00")
-        return datetime.fromisoformat(ts)
-    except Exception:
-        return None
+    return timestamps.to_datetime(timestamps.to_epoch_ms(ts))
+
+def event_ts(e):
+    # Epoch ms normalized at ingest; events built by hand may only carry the
+    # timestamp text.
+    if "ts" in e:
+        return e["ts"]
+    return timestamps.to_epoch_ms(e.get("timestamp"))
 
-def add_finding(findings, rule_id, severity, title, evidence, nist_controls, rmf_note):
-    findings.append({
+def fingerprint(rule_id, keys):
+    # Stable identity of what a finding is about (rule + normalized entity
+    # keys): the same weakness gets the same fingerprint on every run
+    norm = [" ".join(str("" if k is None else k).split()).lower() for k in keys]
+    return hashlib.sha1(json.dumps([rule_id] + norm).encode("utf-8")).hexdigest()[:16]
+
+def add_finding(findings, rule_id, severity, title, evidence, nist_controls, rmf_note, keys=None, occurrence=None):
+    finding = {
         "rule_id": rule_id,
         "severity": severity,
         "title": title,
         "evidence": evidence,
         "nist_800_53_controls": nist_controls,
         "rmf_note": rmf_note,
-    })
+    }
+    if keys is not None:
+        # occurrence_id identifies this particular sighting (see finding_key,
+        # or `occurrence` when the evidence alone does not pin it down)
+        finding["fingerprint"] = fingerprint(rule_id, keys)
+        occurrence = finding_key(finding) if occurrence is None else occurrence
+        finding["occurrence_id"] = hashlib.sha1(occurrence.encode("utf-8")).hexdigest()[:16]
+    findings.append(finding)
+
+# -----------------------
+# Sliding-window engine
+# -----------------------
+# One distinct burst: indices/timestamps of its first and last event in the
+# fed sequence, how many events fell inside the window opened by its first
+# event, and the timestamps of its first few events.
+Burst = namedtuple("Burst", ["start_index", "end_index", "start", "end", "count", "sample"])
+
+class SlidingWindowCounter:
+    # Threshold-in-window counter for any rule of the form "at least N events
+    # within W". Timestamps must be fed in non-decreasing order. State is a
+    # ring of the last `threshold` timestamps plus the open burst, so memory
+    # per counter is bounded however many events arrive: an event completes a
+    # qualifying run when the oldest timestamp in the full ring is within the
+    # window, and runs that share an event are merged, so every distinct
+    # burst is reported once. `window` must be in the same unit as the
+    # timestamps (epoch ms for normalized events).
+    def __init__(self, window, threshold, sample_size=5):
+        self.window = window
+        self.threshold = threshold
+        self.sample_size = sample_size
+        self.ring = deque(maxlen=threshold)
+        self.seen = 0
+        self.current = None     # open burst as [start_i, end_i, start, end, count]
+        self.sample = []
+
+    @property
+    def last(self):
+        return self.ring[-1] if self.ring else None
+
+    def add(self, ts):
+        closed = []
+        idx = self.seen
+        self.seen += 1
+        self.ring.append(ts)
+        run_start = idx - self.threshold + 1
+
+        cur = self.current
+        if cur and (ts - cur[3] > self.window or (self.threshold > 1 and run_start > cur[1])):
+            # No later run can share an event with this burst
+            closed.append(self._close())
+            cur = None
+
+        if len(self.ring) == self.threshold and ts - self.ring[0] <= self.window:
+            if cur:
+                self._take(idx - cur[1])
+                cur[1] = idx
+                cur[3] = ts
+                if ts <= cur[2] + self.window:
+                    cur[4] += 1
+            else:
+                self.current = [run_start, idx, self.ring[0], ts, self.threshold]
+                self._take(self.threshold)
+        return closed
+
+    def _take(self, k):
+        # The last k timestamps in the ring just joined the open burst
+        room = self.sample_size - len(self.sample)
+        if room > 0:
+            self.sample += list(self.ring)[len(self.ring) - k:][:room]
+
+    def flush(self):
+        closed = [self._close()] if self.current else []
+        self.ring.clear()
+        return closed
+
+    def _close(self):
+        burst = Burst(*self.current, tuple(self.sample))
+        self.current = None
+        self.sample = []
+        return burst
+
+    def peek(self):
+        # Bursts a flush would report right now, without touching the state
+        return [Burst(*self.current, tuple(self.sample))] if self.current else []
+
+    def get_state(self):
+        # Timestamps must be JSON-serializable (epoch ms for normalized events)
+        return {
+            "ring": list(self.ring),
+            "seen": self.seen,
+            "current": self.current,
+            "sample": self.sample,
+        }
+
+    @classmethod
+    def from_state(cls, window, threshold, state, sample_size=5):
+        counter = cls(window, threshold, sample_size)
+        counter.ring.extend(state["ring"])
+        counter.seen = state["seen"]
+        counter.current = state["current"]
+        counter.sample = state["sample"]
+        return counter
+
+def find_bursts(timestamps, window, threshold, sample_size=5):
+    counter = SlidingWindowCounter(window, threshold, sample_size)
+    bursts = []
+    for ts in timestamps:
+        bursts += counter.add(ts)
+    return bursts + counter.flush()
+
+# -----------------------
+# Rule registry + dispatcher
+# -----------------------
+# Each rule declares the event IDs it subscribes to. run_rules() walks the
+# event stream once and hands every event only to the rules registered for
+# its ID, so a rule costs nothing for events it does not subscribe to.
+RULES = []
+
+def register_rule(cls):
+    RULES.append(cls)
+    return cls
+
+class Rule:
+    rule_id = None
+    event_ids = ()
+    columns = None  # normalized columns the rule reads; None means all
+
+    # Content rules: indicators maps a name to a regex fragment; the rule
+    # matches an event when every indicator occurs in its content_column.
+    content_column = None
+    indicators = None
+    matcher = None
+
+    def __init__(self):
+        self.findings = []
+
+    def matches(self, text):
+        if self.matcher is None:
+            bind_content_matcher([self])
+        return self.matcher.matches(self, text)
+
+    def on_event(self, e):
+        raise NotImplementedError
+
+    def finish(self):
+        return self.findings
+
+    # Incremental runs: snapshot() reports provisional findings for work
+    # still in progress (without consuming it); get_state()/set_state()
+    # carry that work between runs as JSON.
+    def snapshot(self):
+        return []
+
+    def get_state(self):
+        return None
+
+    def set_state(self, state):
+        pass
+
+def build_routes(rules):
+    routes = defaultdict(list)
+    for r in rules:
+        for event_id in r.event_ids:
+            routes[event_id].append(r)
+    return dict(routes)
+
+def required_columns(rules):
+    needed = {"event_id"}
+    for r in rules:
+        if r.columns is None:
+            return None
+        needed.update(r.columns)
+    return sorted(needed)
+
+def run_rules(events, rules=None):
+    if rules is None:
+        rules = [cls() for cls in RULES]
+    bind_content_matcher(rules)
+    metrics.instrument_rules(rules)
+    routes = build_routes(rules)
+
+    for e in events:
+        subscribed = routes.get(e.get("event_id"))
+        if subscribed:
+            for r in subscribed:
+                r.on_event(e)
+
+    # Findings keep registry order so output does not depend on event order
+    findings = []
+    for r in rules:
+        findings += r.finish()
+    return findings
+
+def stream_rules(events, rules=None, final=True):
+    # Streaming variant of run_rules: findings are yielded as soon as a rule
+    # produces them (emission order, not registry order) and nothing but the
+    # rules' own state is held between events. With final=False the rules
+    # are not finished; their open work is reported via snapshot() instead,
+    # so the state can be carried into the next incremental run.
+    if rules is None:
+        rules = build_rules(streaming=True)
+    bind_content_matcher(rules)
+    metrics.instrument_rules(rules)
+    routes = build_routes(rules)
+
+    for e in events:
+        subscribed = routes.get(e.get("event_id"))
+        if subscribed:
+            for r in subscribed:
+                r.on_event(e)
+                if r.findings:
+                    yield from r.findings
+                    r.findings.clear()
+
+    for r in rules:
+        yield from (r.finish() if final else r.snapshot())
+
+def burst_order(f):
+    # Batch order of burst findings: by burst start, then key. It does not
+    # depend on how the bursts were found, so the bucketed, ordered, NumPy
+    # and sharded paths return the same list.
+    ev = f["evidence"]
+    start = datetime.fromisoformat(ev["first_seen"].replace("Z", "+00:00"))
+    return start, ev["user"] is None, ev["user"] or "", ev["ip"] is None, ev["ip"] or ""
+
+def build_rules(streaming=False, ordered=False):
+    rules = []
+    for cls in RULES:
+        if cls is FailedLoginBurstRule:
+            rules.append(cls(streaming=streaming, ordered=ordered))
+        else:
+            rules.append(cls())
+    return rules
+
+# -----------------------
+# Content matching
+# -----------------------
+# The indicators of every content rule are compiled into one case-insensitive
+# regex, so a message is scanned once however many rules look at it. Each
+# indicator is a named group inside a lookahead: the match is zero-width, so
+# finditer tries every start position and indicators that overlap are all
+# found. An alternation reports only one group per position, so at each hit
+# the other indicators are re-tested at that offset (e.g. "invoke-" and
+# "invoke-expression" both start there). Identical fragments shared by
+# several rules become one group.
+def prefixes(word, shortest):
+    # Regex for any prefix of word at least `shortest` characters long, the
+    # way PowerShell accepts abbreviated parameter names
+    tail = ""
+    for ch in reversed(word[shortest:]):
+        tail = f"(?:{re.escape(ch)}{tail})?"
+    return re.escape(word[:shortest]) + tail
+
+class ContentMatcher:
+    def __init__(self, rules):
+        self.rules = [r for r in rules if r.indicators]
+        self.required = {}
+        groups = {}
+        for r in self.rules:
+            names = set()
+            for fragment in r.indicators.values():
+                names.add(groups.setdefault(fragment, f"i{len(groups)}"))
+            self.required[r] = frozenset(names)
+        alternation = "|".join(f"(?P<{name}>{fragment})" for fragment, name in groups.items())
+        self.regex = re.compile(f"(?=(?:{alternation}))", re.IGNORECASE) if groups else None
+        self.singles = {name: re.compile(fragment, re.IGNORECASE) for fragment, name in groups.items()}
+        self._last = None
+        self._last_hits = frozenset()
+
+    def hits(self, text):
+        # Names of the indicator groups present in text. Rules sharing the
+        # matcher test the same message object in turn, so the last result is
+        # kept and reused.
+        if text is self._last:
+            return self._last_hits
+        found = set()
+        if text and self.regex:
+            for m in self.regex.finditer(text):
+                found.add(m.lastgroup)
+                for name, single in self.singles.items():
+                    if name not in found and single.match(text, m.start()):
+                        found.add(name)
+        found = frozenset(found)
+        self._last, self._last_hits = text, found
+        return found
+
+    def matches(self, rule, text):
+        return self.required[rule] <= self.hits(text)
+
+    def scan(self, text):
+        # Every content rule that matches text, in registry order
+        found = self.hits(text)
+        return [r for r in self.rules if self.required[r] <= found]
+
+def bind_content_matcher(rules):
+    matcher = ContentMatcher(rules)
+    for r in matcher.rules:
+        r.matcher = matcher
+    return matcher
 
 # -----------------------
 # Detection Rules
 # -----------------------
-def rule_failed_login_burst(events, window_minutes=5, threshold=3):
-    failed = [e for e in events if e.get("event_id") == 4625]
-    buckets = defaultdict(list)
+class EventIdRule(Rule):
+    # Any subscribed event is a finding. Events read from the column store
+    # are referenced by their "_ref" plus a few identifying fields instead
+    # of being copied; other events are embedded whole. fingerprint_fields
+    # are the event fields that identify the weakness.
+    evidence_fields = ("event_id", "timestamp", "host", "user")
+    severity = None
+    title = None
+    nist_controls = []
+    rmf_note = None
+    fingerprint_fields = ("host", "user")
+
+    def on_event(self, e):
+        event = {k: v for k, v in e.items() if k != "_ref"}
+        if "_ref" in e:
+            evidence = {"event_ref": e["_ref"]}
+            evidence.update((k, e.get(k)) for k in self.evidence_fields)
+        else:
+            evidence = {"event": event}
+        add_finding(
+            self.findings,
+            self.rule_id,
+            self.severity,
+            self.title,
+            evidence,
+            list(self.nist_controls),
+            self.rmf_note,
+            keys=[e.get(k) for k in self.fingerprint_fields],
+            # same occurrence_id whether the event is embedded or referenced
+            occurrence=json.dumps([self.rule_id, {"event": event}], sort_keys=True)
+        )
 
-    for e in failed:
+@register_rule
+class FailedLoginBurstRule(Rule):
+    # Streaming mode keeps one SlidingWindowCounter per key, so state per key
+    # is a ring of `threshold` ints and the open burst. It expects
+    # chronological input: an event older than its key's latest one, or
+    # older than the window behind the newest event seen (its key may have
+    # been flushed already), is dropped and counted in `late` and the
+    # rule's "late" metric rather than moved in time, which could invent a
+    # burst. Keys are kept in least-recently-seen order: keys idle
+    # for longer than the window are flushed as the clock advances, and past
+    # max_keys the least recently seen key is flushed early (a burst that
+    # resumes after that is reported as a new finding).
+    #
+    # Batch mode over input known to be time-ordered (ordered=True, e.g. a
+    # column store whose meta says so) uses the same bounded counters. Only
+    # unordered batch input buckets every timestamp per key and sorts them
+    # at finish. Batch findings are returned in burst_order() either way.
+    rule_id = "AUTH-001"
+    event_ids = (4625,)
+    columns = ["ts", "user", "ip"]
+
+    def __init__(self, window_minutes=5, threshold=3, streaming=False, max_keys=100000, sample_size=5,
+                 ordered=False):
+        super().__init__()
+        self.window_minutes = window_minutes
+        self.window = window_minutes * 60 * 1000
+        self.threshold = threshold
+        self.streaming = streaming
+        self.ordered = ordered
+        self.max_keys = max_keys
+        self.sample_size = sample_size
+        self.buckets = defaultdict(list)
+        self.counters = OrderedDict()
+        self.clock = None
+        self.evicted = 0
+        self.late = 0
+
+    def on_event(self, e):
+        ts = event_ts(e)
+        if ts is None:
+            return
         key = (e.get("user"), e.get("ip"))
-        dt = parse_ts(e.get("timestamp", ""))
-        if dt:
-            buckets[key].append((dt, e))
+        if not self.streaming and not self.ordered:
+            self.buckets[key].append(ts)
+            return
 
-    findings = []
-    for (user, ip), items in buckets.items():
-        items.sort(key=lambda x: x[0])
-        for i in range(len(items)):
-            start = items[i][0]
-            end = start + timedelta(minutes=window_minutes)
-            window = [it for (t, it) in items if start <= t <= end]
-            if len(window) >= threshold:
-                add_finding(
-                    findings,
-                    "AUTH-001",
-                    "Medium",
-                    "Failed login burst (possible password guessing)",
-                    {"user": user, "ip": ip, "count": len(window), "window_minutes": window_minutes},
-                    ["AC-7", "IA-2", "AU-6"],
-                    "Supports monitoring of authentication anomalies and audit review."
-                )
+        counter = self.counters.get(key)
+        if (counter is not None and ts < counter.last) or (self.clock is not None and ts < self.clock - self.window):
+            self.late += 1
+            metrics.count_late(self.rule_id)
+            return
+        if counter is None:
+            if len(self.counters) >= self.max_keys:
+                self.flush_key(next(iter(self.counters)))
+                self.evicted += 1
+            counter = self.counters[key] = SlidingWindowCounter(self.window, self.threshold, self.sample_size)
+        else:
+            self.counters.move_to_end(key)
+        for b in counter.add(ts):
+            self.add_burst(key, b)
+
+        self.clock = ts if self.clock is None else max(self.clock, ts)
+        self.expire()
+
+    def expire(self):
+        # The front of the LRU order is the key seen longest ago
+        while self.counters:
+            key = next(iter(self.counters))
+            if self.clock - self.counters[key].last <= self.window:
                 break
-    return findings
+            self.flush_key(key)
+
+    def flush_key(self, key):
+        for b in self.counters.pop(key).flush():
+            self.add_burst(key, b)
+
+    def add_burst(self, key, b):
+        user, ip = key
+        add_finding(
+            self.findings,
+            "AUTH-001",
+            "Medium",
+            "Failed login burst (possible password guessing)",
+            {
+                "user": user,
+                "ip": ip,
+                "count": b.count,
+                "window_minutes": self.window_minutes,
+                "first_seen": timestamps.format_ms(b.start),
+                "last_seen": timestamps.format_ms(b.end),
+                "events": b.end_index - b.start_index + 1,
+                "sample": [timestamps.format_ms(t) for t in b.sample],
+            },
+            ["AC-7", "IA-2", "AU-6"],
+            "Supports monitoring of authentication anomalies and audit review.",
+            keys=[user, ip]
+        )
+
+    def finish(self):
+        for key, times in self.buckets.items():
+            times.sort()
+            for b in find_bursts(times, self.window, self.threshold, self.sample_size):
+                self.add_burst(key, b)
+        self.buckets.clear()
+        for key in list(self.counters):
+            self.flush_key(key)
+        if not self.streaming:
+            self.findings.sort(key=burst_order)
+        return self.findings
+
+    def snapshot(self):
+        findings, self.findings = self.findings, []
+        for key, counter in self.counters.items():
+            for b in counter.peek():
+                self.add_burst(key, b)
+        findings, self.findings = self.findings, findings
+        return findings
+
+    def get_state(self):
+        # Keys are listed in LRU order so eviction order survives the restart
+        return {
+            "clock": self.clock,
+            "keys": [[user, ip, counter.get_state()] for (user, ip), counter in self.counters.items()],
+        }
+
+    def set_state(self, state):
+        self.clock = state["clock"]
+        for user, ip, counter in state["keys"]:
+            self.counters[(user, ip)] = SlidingWindowCounter.from_state(self.window, self.threshold, counter, self.sample_size)
+
+@register_rule
+class AdminAccountCreatedRule(EventIdRule):
+    rule_id = "ACCT-001"
+    event_ids = (4720,)
+    severity = "High"
+    title = "New user account created"
+    nist_controls = ["AC-2", "IA-2", "AU-6"]
+    rmf_note = "Account creation must be authorized and auditable."
+
+@register_rule
+class AddedToAdminGroupRule(EventIdRule):
+    rule_id = "PRIV-001"
+    event_ids = (4732,)
+    severity = "High"
+    title = "User added to Administrators group"
+    nist_controls = ["AC-2", "AC-6", "AU-6"]
+    rmf_note = "Privilege escalation should follow least privilege principles."
+
+@register_rule
+class AuditLogClearedRule(EventIdRule):
+    rule_id = "AUD-001"
+    event_ids = (1102,)
+    severity = "Critical"
+    title = "Audit log cleared"
+    nist_controls = ["AU-9", "AU-6", "IR-4"]
+    rmf_note = "Audit integrity loss may indicate anti-forensics activity."
+    fingerprint_fields = ("host",)
+
+@register_rule
+class EncodedPowerShellRule(EventIdRule):
+    rule_id = "PROC-001"
+    event_ids = (4688,)
+    severity = "High"
+    title = "Encoded PowerShell execution detected"
+    nist_controls = ["SI-4", "AU-6", "IR-4"]
+    rmf_note = "Obfuscated command execution may indicate malicious activity."
+    fingerprint_fields = ("host", "user", "message")
+
+    # -e, -ec, -enc ... -EncodedCommand; PowerShell also takes / and the
+    # en/em dash as the parameter prefix
+    content_column = "message"
+    indicators = {
+        "powershell": r"powershell|pwsh",
+        "encoded_flag": r"(?<![\w-])[-/\u2013\u2014\u2015](?:ec|" + prefixes("encodedcommand", 1) + r")(?![\w-])",
+    }
+
+    def on_event(self, e):
+        if self.matches(e.get("message")):
+            super().on_event(e)
+
+# Single-rule entry points, kept for callers that run one rule at a time
+def rule_failed_login_burst(events, window_minutes=5, threshold=3):
+    return run_rules(events, [FailedLoginBurstRule(window_minutes, threshold)])
 
 def rule_admin_account_created(events):
-    findings = []
-    for e in events:
-        if e.get("event_id") == 4720:
-            add_finding(
-                findings,
-                "ACCT-001",
-                "High",
-                "New user account created",
-                {"event": e},
-                ["AC-2", "IA-2", "AU-6"],
-                "Account creation must be authorized and auditable."
-            )
-    return findings
+    return run_rules(events, [AdminAccountCreatedRule()])
 
 def rule_added_to_admin_group(events):
-    findings = []
-    for e in events:
-        if e.get("event_id") == 4732:
-            add_finding(
-                findings,
-                "PRIV-001",
-                "High",
-                "User added to Administrators group",
-                {"event": e},
-                ["AC-2", "AC-6", "AU-6"],
-                "Privilege escalation should follow least privilege principles."
-            )
-    return findings
+    return run_rules(events, [AddedToAdminGroupRule()])
 
 def rule_audit_log_cleared(events):
-    findings = []
-    for e in events:
-        if e.get("event_id") == 1102:
-            add_finding(
-                findings,
-                "AUD-001",
-                "Critical",
-                "Audit log cleared",
-                {"event": e},
-                ["AU-9", "AU-6", "IR-4"],
-                "Audit integrity loss may indicate anti-forensics activity."
-            )
-    return findings
+    return run_rules(events, [AuditLogClearedRule()])
 
 def rule_encoded_powershell(events):
-    findings = []
-    for e in events:
-        msg = (e.get("message") or "").lower()
-        if e.get("event_id") == 4688 and "powershell" in msg and (" -enc " in msg or "encodedcommand" in msg):
-            add_finding(
-                findings,
-                "PROC-001",
-                "High",
-                "Encoded PowerShell execution detected",
-                {"event": e},
-                ["SI-4", "AU-6", "IR-4"],
-                "Obfuscated command execution may indicate malicious activity."
-            )
+    return run_rules(events, [EncodedPowerShellRule()])
+
+# -----------------------
+# Incremental detection
+# -----------------------
+# detect_state.json records how many store rows have been evaluated (and
+# which store generation they came from) plus each rule's carried state.
+# New findings are merged into the previous findings.jsonl by finding_key(),
+# so a burst that keeps growing across runs updates one finding in place.
+STATE_FILE = "detect_state.json"
+STATE_VERSION = 2
+
+def finding_key(f):
+    ev = f.get("evidence", {})
+    if f.get("rule_id") == "AUTH-001":
+        return json.dumps([f["rule_id"], ev.get("user"), ev.get("ip"), ev.get("first_seen")])
+    return json.dumps([f.get("rule_id"), ev], sort_keys=True)
+
+def merge_findings(prior, new):
+    merged = list(prior)
+    index = {finding_key(f): i for i, f in enumerate(merged)}
+    added = 0
+    for f in new:
+        k = finding_key(f)
+        if k in index:
+            merged[index[k]] = f
+        else:
+            index[k] = len(merged)
+            merged.append(f)
+            added += 1
+    return merged, added
+
+def load_incremental(processed_dir: Path, store):
+    # Streaming rules with the state carried from the last run, and the
+    # first store row they have not seen (0 when the state does not apply)
+    state_path = processed_dir / STATE_FILE
+    state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+    if (state.get("version") != STATE_VERSION or state.get("generation") != store.generation
+            or state.get("rows", 0) > store.rows):
+        state = {}  # store was rebuilt or state is from an older release: start from scratch
+
+    rules = build_rules(streaming=True)
+    for r in rules:
+        if r.rule_id in state.get("rules", {}):
+            r.set_state(state["rules"][r.rule_id])
+    return rules, state.get("rows", 0)
+
+def detect_rows(store, rules, start):
+    events = store.iter_rows(columns=required_columns(rules), event_ids=set(build_routes(rules)), start=start, ref=True)
+    order = {r.rule_id: i for i, r in enumerate(rules)}
+    return sorted(stream_rules(events, rules, final=False), key=lambda f: order[f["rule_id"]])
+
+def save_incremental(processed_dir: Path, store, rules):
+    state = {
+        "version": STATE_VERSION,
+        "generation": store.generation,
+        "rows": store.rows,
+        "rules": {r.rule_id: r.get_state() for r in rules if r.get_state() is not None},
+    }
+    state_path = processed_dir / STATE_FILE
+    tmp = state_path.with_name(state_path.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, state_path)
+
+def run_incremental(processed_dir: Path, out_findings: Path):
+    store_path = processed_dir / "normalized_events.cols"
+    if not ColumnStore.exists(store_path):
+        raise SystemExit(f"[ERROR] Incremental detection needs the column store: {store_path}")
+    store = ColumnStore(store_path)
+
+    rules, start = load_incremental(processed_dir, store)
+    new = detect_rows(store, rules, start)
+    metrics.count_findings(new)
+    metrics.note(events=store.rows - start)
+
+    prior = []
+    prior_path = findings_path(processed_dir, "findings")
+    if start and prior_path.exists():
+        prior = iter_findings(prior_path)
+    findings, added = merge_findings(prior, new)
+
+    write_jsonl(findings, out_findings)
+    save_incremental(processed_dir, store, rules)
+
+    print(f"[INFO] Evaluated rows {start}..{store.rows}: {len(new)} findings ({added} new)")
     return findings
 
+# -----------------------
+# Sharded detection
+# -----------------------
+# detect.py --workers N splits a full run across N processes. Rows are
+# hash-partitioned by (user, ip), the key the burst rule keeps state for,
+# so each shard sees every event of the keys it owns, in row order; the
+# event rules hold no state and are split along with them. Workers map the
+# column store themselves and decode only their own rows. The partition is
+# computed on the user/ip dictionary codes: they stand 1:1 for the values,
+# are the same in every worker, and (unlike str) int hashes do not change
+# between processes.
+#
+# run_rules reports findings rule by rule: event rules in row order, the
+# burst rule in burst_order(). Both can be recomputed from the findings, so
+# the merge puts them back in that order and the output is identical to a
+# one-process run.
+def detect_shard(task):
+    store_path, shard, shards = task
+    store = ColumnStore(store_path)
+    rules = build_rules(ordered=store.ordered)
+    routes = build_routes(rules)
+    columns = required_columns(rules)
+    ids = store.column("event_id")
+    user_codes, ip_codes = store.column("user").codes, store.column("ip").codes
+
+    def rows():
+        for i in range(store.rows):
+            event_id = ids[i]
+            if event_id not in routes:
+                continue
+            pair = (user_codes[i], ip_codes[i])
+            if hash(pair) % shards != shard:
+                continue
+            yield store.row(i, columns, ref=True)
+
+    return run_rules(rows(), rules)
+
+def run_sharded(store_path: Path, workers):
+    tasks = [(str(store_path), shard, workers) for shard in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(detect_shard, tasks))
+    order = {r.rule_id: i for i, r in enumerate(build_rules())}
+
+    def rank(f):
+        ev = f["evidence"]
+        if "event_ref" in ev:
+            return order[f["rule_id"]], int(ev["event_ref"].rpartition(":")[2])
+        return (order[f["rule_id"]],) + burst_order(f)
+
+    return sorted((f for findings in results for f in findings), key=rank)
+
 # -----------------------
 # Main
 # -----------------------
-def main():
-    root = Path(__file__).resolve().parent
-    normalized = root / "data" / "processed" / "normalized_events.csv"
-    out_findings = root / "data" / "processed" / "findings.json"
+def detect_findings(processed_dir: Path, backend="python", workers=None):
+    store_path = processed_dir / "normalized_events.cols"
+    if ColumnStore.exists(store_path):
+        metrics.note(events=ColumnStore(store_path).rows)
+    if backend == "numpy":
+        if not ColumnStore.exists(store_path):
+            raise SystemExit(f"[ERROR] The numpy backend needs the column store: {store_path}")
+        try:
+            import detect_numpy
+        except ImportError as e:
+            raise SystemExit(f"[ERROR] The numpy backend is unavailable: {e}")
+        findings = detect_numpy.run_rules(ColumnStore(store_path))
+    elif workers and workers > 1:
+        if not ColumnStore.exists(store_path):
+            raise SystemExit(f"[ERROR] Sharded detection needs the column store: {store_path}")
+        findings = run_sharded(store_path, workers)
+    else:
+        # bounded burst state when the store is known to be time-ordered
+        ordered = ColumnStore.exists(store_path) and ColumnStore(store_path).ordered
+        rules = build_rules(ordered=ordered)
+        findings = run_rules(iter_normalized(processed_dir, rules), rules)
+    metrics.count_findings(findings)
+    return findings
 
-    events = load_normalized_csv(normalized)
+def hunt(archive_dir: Path, rule_ids=None, since=None, until=None, event_ids=None, hosts=None):
+    # Historical run over the partitioned archive. The rules' subscribed
+    # event IDs (narrowed by event_ids), the time range and the hosts are
+    # checked against the archive catalog first, so only partitions that
+    # can hold a matching event are opened.
+    archive = Archive(archive_dir)
+    rules = [r for r in build_rules(ordered=archive.ordered) if not rule_ids or r.rule_id in rule_ids]
+    if not rules:
+        raise SystemExit(f"[ERROR] No rules match: {', '.join(rule_ids)}")
+    ids = set(build_routes(rules))
+    if event_ids:
+        ids &= set(event_ids)
+    start = timestamps.to_epoch_ms(since) if since else None
+    end = timestamps.to_epoch_ms(until) if until else None
+    if (since and start is None) or (until and end is None):
+        raise SystemExit("[ERROR] --since/--until must be ISO-8601 dates or timestamps")
 
-    findings = []
-    findings += rule_failed_login_burst(events)
-    findings += rule_admin_account_created(events)
-    findings += rule_added_to_admin_group(events)
-    findings += rule_audit_log_cleared(events)
-    findings += rule_encoded_powershell(events)
+    rows = archive.iter_rows(start, end, ids, hosts, columns=required_columns(rules), ref=True)
+    findings = run_rules(rows, rules)
+    print(f"[INFO] Archive partitions opened: {archive.opened} of {len(archive.catalog['partitions'])}")
+    metrics.count_findings(findings)
+    return findings
+
+def comma_list(text):
+    return [v.strip() for v in text.split(",") if v.strip()] if text else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run detection rules over normalized events.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="evaluate only rows appended since the last run, carrying rule state forward")
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python",
+                        help="numpy evaluates rules as array operations over the column store (requires NumPy)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="shard a full python-backend run by (user, ip) across this many processes")
+    hunting = parser.add_argument_group("archive hunts")
+    hunting.add_argument("--archive", action="store_true",
+                         help="run over the partitioned archive (data/archive, see archive.py) instead of today's store")
+    hunting.add_argument("--since", help="only events at or after this ISO-8601 time")
+    hunting.add_argument("--until", help="only events before this ISO-8601 time")
+    hunting.add_argument("--event-ids", help="comma list of event IDs to consider")
+    hunting.add_argument("--hosts", help="comma list of host names to consider")
+    hunting.add_argument("--rules", help="comma list of rule IDs to run (default: all)")
+    hunting.add_argument("--out", help="findings file (default data/processed/hunt_findings.jsonl)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    processed_dir = root / "data" / "processed"
+    out_findings = processed_dir / "findings.jsonl"
+
+    with metrics.profiled("detect", args, processed_dir):
+        if args.archive:
+            out_findings = Path(args.out) if args.out else processed_dir / "hunt_findings.jsonl"
+            event_ids = [int(v) for v in comma_list(args.event_ids)] if args.event_ids else None
+            findings = hunt(root / "data" / "archive", comma_list(args.rules), args.since, args.until,
+                            event_ids, comma_list(args.hosts))
+            write_jsonl(findings, out_findings)
+        elif args.incremental:
+            findings = run_incremental(processed_dir, out_findings)
+        else:
+            findings = detect_findings(processed_dir, args.backend, args.workers)
+            write_jsonl(findings, out_findings)
 
-    out_findings.write_text(json.dumps(findings, indent=2), encoding="utf-8")
     print(f"[OK] Findings written: {len(findings)} -> {out_findings}")
+    if timestamps.failures():
+        print(f"[WARN] Unparseable timestamps: {timestamps.report()}")
 
     for f in findings:
         print(f"- [{f['severity']}] {f['rule_id']} {f['title']} -> Controls: {', '.join(f['nist_800_53_controls'])}")
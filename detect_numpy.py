@@ -0,0 +1,203 @@
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import colstore
+import metrics
+import detect
+
+# Optional NumPy backend for detect.py. Events are read from the column store
+# as zero-copy NumPy columns; event-ID subscriptions become boolean masks and
+# the failed-login burst rule becomes a lexsort + searchsorted window count
+# over (user, ip) groups. Findings are built through the same Rule objects as
+# the pure-Python path, so findings.jsonl is byte-identical.
+
+def rows_for(ids, event_ids):
+    return np.flatnonzero(np.isin(ids, np.asarray(event_ids, dtype=np.int64)))
+
+def burst_rule(store, rule, ids):
+    ts = store.numpy("ts")
+    idx = np.flatnonzero((ids == 4625) & (ts != colstore.MISSING))
+    if len(idx) == 0:
+        return
+
+    n_ip = max(len(store.dictionary("ip")), 1)
+    keys = store.numpy("user")[idx].astype(np.int64) * n_ip + store.numpy("ip")[idx]
+    times = ts[idx]
+
+    # Group keys in order of first appearance (the Python path's bucket
+    # order). Offsetting each group by more than the time span + window puts
+    # every group in its own range, so a single sort orders by (group, time)
+    # and one searchsorted finds every window end without crossing groups.
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    rank = np.empty(len(uniq), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(uniq))
+    group = rank[inverse]
+
+    base = times - times.min()
+    stride = int(base.max()) + rule.window + 1
+    if stride * len(uniq) >= 2 ** 62:
+        raise OverflowError("time span too large for a single searchsorted pass")
+    shifted = base + group * stride
+    order = np.argsort(shifted)
+    shifted = shifted[order]
+    group = group[order]
+    times = times[order]
+    keys = keys[order]
+
+    right = np.searchsorted(shifted, shifted + rule.window, side="right")
+    count = right - np.arange(len(shifted))
+
+    heads = np.flatnonzero(count >= rule.threshold)
+    if len(heads) == 0:
+        return
+    ends = right[heads] - 1
+    new = np.ones(len(heads), dtype=bool)
+    new[1:] = (group[heads[1:]] != group[heads[:-1]]) | (heads[1:] > ends[:-1])
+    starts = np.flatnonzero(new)
+    stops = np.append(starts[1:], len(heads)) - 1
+
+    users = store.dictionary("user")
+    ips = store.dictionary("ip")
+    for s, e in zip(starts, stops):
+        first_i = int(heads[s])
+        last_i = int(ends[e])
+        g_start = int(np.searchsorted(group, group[first_i], side="left"))
+        key = int(keys[first_i])
+        sample = tuple(int(t) for t in times[first_i:min(last_i + 1, first_i + rule.sample_size)])
+        b = detect.Burst(first_i - g_start, last_i - g_start, int(times[first_i]), int(times[last_i]),
+                         int(count[first_i]), sample)
+        rule.add_burst((users[key // n_ip], ips[key % n_ip]), b)
+
+def content_candidates(store, column, rows, matcher, rules):
+    # Prefilter for the content rules: the subscribed rows' text is joined
+    # with newlines and each indicator is searched once over the whole
+    # buffer, match positions are mapped back to rows with searchsorted, and
+    # a row is kept only if it holds every indicator of one of the rules.
+    # ^/$ are matched per line, so the kept rows are a superset of the
+    # matches; the shared matcher still checks each of them exactly.
+    # Non-ASCII text, where character and byte offsets differ, is not
+    # prefiltered.
+    if len(rows) == 0 or not rules:
+        return rows
+    col = store.column(column)
+    offsets = np.frombuffer(col.offsets, dtype="<i8")
+    starts, ends = offsets[rows], offsets[rows + 1]
+    joined = b"\n".join(col.data[a:b] for a, b in zip(starts.tolist(), ends.tolist()))
+    if not joined.isascii():
+        return rows
+    text = joined.decode("ascii")
+    line_starts = np.concatenate(([0], np.cumsum(ends - starts + 1)[:-1]))
+
+    present = {}
+    for name in set().union(*(matcher.required[r] for r in rules)):
+        lookahead = re.compile(f"(?=(?:{matcher.singles[name].pattern}))", re.IGNORECASE | re.MULTILINE)
+        pos = np.fromiter((m.start() for m in lookahead.finditer(text)), dtype=np.int64)
+        hit = np.zeros(len(rows), dtype=bool)
+        hit[np.searchsorted(line_starts, pos, side="right") - 1] = True
+        present[name] = hit
+
+    keep = np.zeros(len(rows), dtype=bool)
+    for r in rules:
+        keep |= np.logical_and.reduce([present[name] for name in matcher.required[r]])
+    return rows[keep]
+
+def run_rules(store, rules=None):
+    if rules is None:
+        rules = detect.build_rules()
+    ids = store.numpy("event_id")
+    matcher = detect.bind_content_matcher(rules)
+    metrics.instrument_rules(rules)
+
+    # Content rules share one pass per column: the subscribed rows are
+    # prefiltered in bulk, each remaining row's text is decoded and scanned
+    # once, and only matching rows are decoded in full.
+    by_column = {}
+    for r in matcher.rules:
+        by_column.setdefault(r.content_column, []).append(r)
+    for column, content_rules in by_column.items():
+        content = store.column(column)
+        subscribers = detect.build_routes(content_rules)
+        for i in content_candidates(store, column, rows_for(ids, list(subscribers)), matcher, content_rules):
+            i = int(i)
+            for r in matcher.scan(content[i]):
+                if r in subscribers[int(ids[i])]:
+                    r.on_event(store.row(i, r.columns, ref=True))
+
+    findings = []
+    for r in rules:
+        if type(r) is detect.FailedLoginBurstRule and not r.streaming:
+            with metrics.timed_rule(r.rule_id):
+                burst_rule(store, r, ids)
+        elif not r.indicators:
+            for i in rows_for(ids, r.event_ids):
+                r.on_event(store.row(int(i), r.columns, ref=True))
+        findings += r.finish()
+    return findings
+
+# -----------------------
+# Benchmark
+# -----------------------
+def synthetic_events(n, seed=7):
+    rng = np.random.default_rng(seed)
+    base = 1770300000000
+    event_ids = rng.choice([4625, 4624, 4688, 4720, 4732, 1102], size=n, p=[0.7, 0.27, 0.0297, 0.0001, 0.0001, 0.0001])
+    encoded = rng.random(size=n) < 0.01
+    times = np.sort(base + rng.integers(0, 86400000, size=n))
+    users = rng.integers(0, 500, size=n)
+    ips = rng.integers(0, 200, size=n)
+    for i in range(n):
+        yield {
+            "source": "synthetic",
+            "host": "BENCH",
+            "timestamp": "",
+            "ts": int(times[i]),
+            "event_id": int(event_ids[i]),
+            "level": "Information",
+            "provider": "",
+            "user": f"user{users[i]}",
+            "ip": f"10.0.{ips[i] // 256}.{ips[i] % 256}",
+            "message": ("powershell.exe -enc SQBFAFgA" if encoded[i] else "powershell.exe -File report.ps1")
+                       if event_ids[i] == 4688 else "",
+            "tags": "",
+        }
+
+def bench(n, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.cols"
+        colstore.write_store(synthetic_events(n), path)
+        store = colstore.ColumnStore(path)
+
+        def python_path():
+            rules = detect.build_rules()
+            events = store.iter_rows(columns=detect.required_columns(rules), event_ids=set(detect.build_routes(rules)), ref=True)
+            return detect.run_rules(events, rules)
+
+        timings = {}
+        results = {}
+        for name, fn in (("python", python_path), ("numpy", lambda: run_rules(store))):
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                results[name] = fn()
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+
+    same = results["python"] == results["numpy"]
+    print(f"[BENCH] events={n} findings={len(results['python'])} python={timings['python']:.3f}s "
+          f"numpy={timings['numpy']:.3f}s speedup={timings['python'] / max(timings['numpy'], 1e-9):.1f}x "
+          f"identical={same}")
+    return same
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy detection backend against pure Python.")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3, help="best-of-N timing")
+    args = parser.parse_args()
+    if not bench(args.events, args.repeat):
+        raise SystemExit(1)
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from run_day1 import iter_json_array
+
+# Findings move between detect, ai_summarize and poam_export as JSON Lines:
+# one compact finding per line, written and read one at a time, so no stage
+# holds a whole findings file in memory. Pretty-printed JSON arrays from
+# older runs (findings.json, findings_enriched.json) are still readable.
+
+def write_jsonl(records, path: Path, append=False):
+    count = 0
+    with path.open("a" if append else "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+def iter_findings(path: Path):
+    if path.suffix == ".json":
+        yield from iter_json_array(path)
+        return
+    with path.open("r", encoding="utf-8-sig") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def findings_path(processed_dir: Path, stem):
+    # <stem>.jsonl, or the legacy <stem>.json when only that exists
+    path = processed_dir / f"{stem}.jsonl"
+    legacy = processed_dir / f"{stem}.json"
+    if not path.exists() and legacy.exists():
+        return legacy
+    return path
+
+def resolve_event(store, evidence):
+    # Full event behind a finding's evidence: embedded, or looked up in the
+    # column store (a ColumnStore, or None when there is none) by event_ref
+    if "event" in evidence:
+        return evidence["event"]
+    if "event_ref" not in evidence or store is None:
+        return None
+    return store.resolve(evidence["event_ref"])
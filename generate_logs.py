@@ -0,0 +1,198 @@
+import argparse
+import json
+import random
+import tempfile
+from array import array
+from pathlib import Path
+
+from timestamps import format_ms
+
+# Seeded generator for production-scale test data. Writes a
+# synthetic_logs.jsonl (run_day1's JSONL schema) and a real_events.json
+# (Get-WinEvent ConvertTo-Json shape, /Date(ms)/ timestamps). The JSONL is
+# in time order; the export is newest first, as Get-WinEvent writes it. Both
+# are streamed through disk so 10M-event runs need no extra memory.
+
+SIZES = {"small": 10_000, "medium": 1_000_000, "large": 10_000_000}
+
+# Share of all events per kind. "4625" failed logons are emitted by spray
+# campaigns; ENCODED_SHARE of 4688 process events use -EncodedCommand.
+DEFAULT_MIX = {
+    "4625": 0.30,
+    "4624": 0.50,
+    "4688": 0.19,
+    "4720": 0.004,
+    "4732": 0.004,
+    "1102": 0.002,
+}
+ENCODED_SHARE = 0.05
+
+START_MS = 1770300000000  # 2026-02-05T14:00:00Z
+DAY_MS = 86_400_000
+REVERSE_BLOCK = 4096  # spooled export records replayed per read
+
+MESSAGES = {
+    "4625": "An account failed to log on. Status: 0xC000006D SubStatus: 0xC000006A",
+    "4624": "An account was successfully logged on. Logon Type: 3",
+    "4720": "A user account was created. Target Account Name: {user}_tmp",
+    "4732": "A member was added to a security-enabled local group. Group: Administrators Member: {user}",
+    "1102": "The audit log was cleared. Subject: {user}",
+}
+TAGS = {
+    "4625": ["auth", "failed_login"],
+    "4624": ["auth", "logon"],
+    "4688": ["process"],
+    "4720": ["account", "user_created"],
+    "4732": ["privilege", "group_change"],
+    "1102": ["audit", "log_cleared"],
+}
+LEVELS = {"4720": "Warning", "4732": "Warning", "1102": "Warning"}
+PROCESSES = [
+    "C:\\Windows\\System32\\svchost.exe -k netsvcs",
+    "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe -File C:\\scripts\\inventory.ps1",
+    "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
+    "C:\\Windows\\System32\\cmd.exe /c whoami",
+]
+ENCODED = [
+    "powershell.exe -enc SQBFAFgAIAAoAE4AZQB3AC0ATwBiAGoAZQBjAHQA",
+    "powershell -NoP -W Hidden -EncodedCommand JABjAGwAaQBlAG4AdAAgAD0A",
+    "PowerShell.exe -ec SQBFAFgA",
+]
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    if text:
+        for part in text.split(","):
+            kind, _, share = part.partition("=")
+            mix[kind.strip()] = float(share)
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items()}
+
+class SprayPool:
+    # A fixed number of concurrent spray campaigns; each (user, ip) pair
+    # fires a run of failed logons and is then replaced by a new pair.
+    def __init__(self, rng, size=50, users=5000):
+        self.rng = rng
+        self.users = users
+        self.active = [self._new() for _ in range(size)]
+
+    def _new(self):
+        ip = f"203.0.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}"
+        return [f"user{self.rng.randrange(self.users)}", ip, self.rng.randint(3, 200)]
+
+    def next(self):
+        i = self.rng.randrange(len(self.active))
+        user, ip, left = self.active[i]
+        if left <= 1:
+            self.active[i] = self._new()
+        else:
+            self.active[i][2] = left - 1
+        return user, ip
+
+def iter_events(n, seed=1, mix=None, hosts=200, users=5000, span_ms=DAY_MS):
+    rng = random.Random(seed)
+    mix = parse_mix(None) if mix is None else mix
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    sprays = SprayPool(rng, users=users)
+    gap = span_ms / max(n, 1)
+    ts = float(START_MS)
+
+    for _ in range(n):
+        ts += rng.expovariate(1 / gap)
+        kind = rng.choices(kinds, weights)[0]
+        host = f"HOST-{rng.randrange(hosts):04d}"
+        if kind == "4625":
+            user, ip = sprays.next()
+        else:
+            user, ip = f"user{rng.randrange(users)}", f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        if kind == "4688":
+            message = rng.choice(ENCODED) if rng.random() < ENCODED_SHARE else rng.choice(PROCESSES)
+        else:
+            message = MESSAGES.get(kind, "Event").format(user=user)
+        yield {
+            "ts": int(ts),
+            "host": host,
+            "event_id": int(kind),
+            "level": LEVELS.get(kind, "Information"),
+            "user": user,
+            "ip": ip,
+            "message": message,
+            "tags": TAGS.get(kind, []),
+        }
+
+def generate(out_dir: Path, n, seed=1, mix=None, real_share=0.1):
+    # real_share of events go to real_events.json (no user/ip, like a
+    # Get-WinEvent export); the rest to synthetic_logs.jsonl.
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed + 1)
+    counts = {"synthetic": 0, "real": 0}
+
+    # Export records are spooled oldest first, with each one's end offset,
+    # then written out in reverse
+    ends = array("q")
+    with (out_dir / "synthetic_logs.jsonl").open("w", encoding="utf-8") as jsonl, \
+         tempfile.TemporaryFile(dir=out_dir) as spool:
+        for e in iter_events(n, seed=seed, mix=mix):
+            if rng.random() < real_share:
+                record = {
+                    "TimeCreated": f"/Date({e['ts']})/",
+                    "Id": e["event_id"],
+                    "LevelDisplayName": e["level"],
+                    "ProviderName": "Microsoft-Windows-Security-Auditing",
+                    "MachineName": e["host"],
+                    "Message": e["message"],
+                }
+                spool.write(json.dumps(record).encode("utf-8") + b"\n")
+                ends.append(spool.tell())
+                counts["real"] += 1
+            else:
+                record = {
+                    "source": "synthetic",
+                    "host": e["host"],
+                    "timestamp": format_ms(e["ts"]),
+                    "event_id": e["event_id"],
+                    "level": e["level"],
+                    "user": e["user"],
+                    "ip": e["ip"],
+                    "message": e["message"],
+                    "tags": e["tags"],
+                }
+                jsonl.write(json.dumps(record, separators=(",", ":")) + "\n")
+                counts["synthetic"] += 1
+        with (out_dir / "real_events.json").open("w", encoding="utf-8") as real:
+            write_newest_first(spool, ends, real)
+    return counts
+
+def write_newest_first(spool, ends, out):
+    out.write("[")
+    sep = ""
+    stop = len(ends)
+    while stop:
+        start = max(stop - REVERSE_BLOCK, 0)
+        begin = ends[start - 1] if start else 0
+        spool.seek(begin)
+        lines = spool.read(ends[stop - 1] - begin).decode("utf-8").split("\n")[:-1]
+        for line in reversed(lines):
+            out.write(sep + "\n    " + line)
+            sep = ","
+        stop = start
+    out.write("\n]\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic Windows security logs.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--events", type=int, help="exact event count (overrides --size)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mix", help="comma list of event_id=share, e.g. 4625=0.5,4624=0.4,4688=0.1")
+    parser.add_argument("--real-share", type=float, default=0.1,
+                        help="fraction of events written as real_events.json records")
+    parser.add_argument("--out", default="data/bench/raw", help="output directory")
+    args = parser.parse_args(argv)
+
+    n = args.events or SIZES[args.size]
+    counts = generate(Path(args.out), n, seed=args.seed, mix=parse_mix(args.mix), real_share=args.real_share)
+    print(f"[OK] Generated {n} events (synthetic={counts['synthetic']}, real={counts['real']}) -> {args.out}")
+
+if __name__ == "__main__":
+    main()
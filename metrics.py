@@ -0,0 +1,254 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import timestamps
+from ticket_store import LOCK_STATS
+
+# Opt-in instrumentation shared by the stage scripts and run_pipeline.py.
+# With --profile each stage records wall time, CPU time of the thread that
+# ran it, the process' peak RSS so far and, where a stage reports an event
+# count, events/sec; detection adds per-rule evaluation time, events seen
+# and findings. Results are merged into data/processed/metrics.json (and
+# metrics.prom with --prometheus), so separate stage runs add up to one
+# picture. --cprofile / --tracemalloc dump the hot path of every profiled
+# stage to data/processed/profile/. When nothing is enabled every hook
+# is a no-op.
+
+METRICS_FILE = "metrics.json"
+PROM_FILE = "metrics.prom"
+PROFILE_DIR = "profile"
+TOP_LINES = 25
+
+ENABLED = False
+OPTIONS = {"cprofile": False, "tracemalloc": False, "out_dir": None}
+METRICS = {"stages": {}, "rules": {}}
+_local = threading.local()
+
+def add_arguments(parser):
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true",
+                       help=f"record stage and rule metrics in data/processed/{METRICS_FILE}")
+    group.add_argument("--prometheus", action="store_true",
+                       help=f"also write the metrics in Prometheus text format ({PROM_FILE}); implies --profile")
+    group.add_argument("--cprofile", action="store_true",
+                       help=f"dump cProfile stats per stage to data/processed/{PROFILE_DIR}/; implies --profile")
+    group.add_argument("--tracemalloc", action="store_true",
+                       help=f"dump the top allocation sites per stage to data/processed/{PROFILE_DIR}/; implies --profile")
+
+def enable(out_dir: Path, cprofile=False, trace_memory=False):
+    global ENABLED
+    ENABLED = True
+    OPTIONS.update(cprofile=cprofile, tracemalloc=trace_memory, out_dir=Path(out_dir))
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KiB elsewhere
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024), 1)
+
+def note(**values):
+    # Adds counts (events=..., findings=...) to the stage running in this thread
+    current = getattr(_local, "stage", None)
+    if current is not None:
+        current.update(values)
+
+@contextmanager
+def stage(name):
+    if not ENABLED:
+        yield {}
+        return
+    m = {}
+    _local.stage = m
+    profiler = None
+    if OPTIONS["cprofile"]:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if OPTIONS["tracemalloc"]:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield m
+    finally:
+        m["wall_s"] = round(time.perf_counter() - t0, 4)
+        m["cpu_s"] = round(time.thread_time() - c0, 4)
+        m["peak_rss_mb"] = peak_rss_mb()
+        if m.get("events") and m["wall_s"]:
+            m["events_per_s"] = round(m["events"] / m["wall_s"], 1)
+        if profiler is not None:
+            profiler.disable()
+            dump_cprofile(name, profiler)
+        if OPTIONS["tracemalloc"]:
+            m["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            dump_tracemalloc(name, tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        _local.stage = None
+        METRICS["stages"][name] = m
+
+def profile_dir():
+    folder = OPTIONS["out_dir"] / PROFILE_DIR
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+def dump_cprofile(name, profiler):
+    folder = profile_dir()
+    profiler.dump_stats(str(folder / f"{name}.pstats"))
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(TOP_LINES)
+    (folder / f"{name}.cprofile.txt").write_text(text.getvalue(), encoding="utf-8")
+
+def dump_tracemalloc(name, snapshot):
+    lines = [f"Top {TOP_LINES} allocation sites ({name})"]
+    for stat in snapshot.statistics("lineno")[:TOP_LINES]:
+        lines.append(str(stat))
+    (profile_dir() / f"{name}.tracemalloc.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+# -----------------------
+# Rules
+# -----------------------
+def rule_stats(rule_id):
+    return METRICS["rules"].setdefault(rule_id, {"eval_s": 0.0, "events": 0, "findings": 0, "late": 0})
+
+def _timed(fn, stats, counts_event):
+    def timed(*args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            stats["eval_s"] += time.perf_counter() - t0
+            if counts_event:
+                stats["events"] += 1
+    return timed
+
+def instrument_rules(rules):
+    # Wraps each rule's on_event/finish in timers (instance attributes, so
+    # the rule classes are untouched)
+    if not ENABLED:
+        return
+    for r in rules:
+        if "on_event" in r.__dict__:
+            continue  # already instrumented
+        stats = rule_stats(r.rule_id)
+        r.on_event = _timed(r.on_event, stats, True)
+        r.finish = _timed(r.finish, stats, False)
+
+@contextmanager
+def timed_rule(rule_id):
+    # For rule work done outside on_event/finish (vectorized backends)
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rule_stats(rule_id)["eval_s"] += time.perf_counter() - t0
+
+def count_late(rule_id):
+    # An event a streaming rule dropped because it arrived out of order
+    if ENABLED:
+        rule_stats(rule_id)["late"] += 1
+
+def count_findings(findings):
+    if not ENABLED:
+        return
+    for f in findings:
+        rule_stats(f["rule_id"])["findings"] += 1
+
+# -----------------------
+# Output
+# -----------------------
+def snapshot():
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "stages": dict(METRICS["stages"]),
+        "rules": {rid: dict(s, eval_s=round(s["eval_s"], 4)) for rid, s in METRICS["rules"].items()},
+        "timestamps": dict(timestamps.PARSE_STATS),
+        "locks": {k: round(v, 1) for k, v in LOCK_STATS.items()},
+    }
+
+def write(out_dir: Path, prometheus=False):
+    # Merged into the existing file: a stage run on its own replaces only
+    # its own entries
+    path = Path(out_dir) / METRICS_FILE
+    merged = {}
+    if path.exists():
+        try:
+            merged = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            merged = {}
+    current = snapshot()
+    for section in ("stages", "rules"):
+        merged[section] = dict(merged.get(section, {}), **current.pop(section))
+    for key, value in current.items():
+        if value or key not in merged:
+            merged[key] = value
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+    written = [path]
+    if prometheus:
+        prom = path.with_name(PROM_FILE)
+        prom.write_text(prometheus_text(merged), encoding="utf-8")
+        written.append(prom)
+    return written
+
+def prometheus_text(data):
+    lines = []
+
+    def family(name, help_text, samples):
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    stages = data.get("stages", {})
+    for field, name, help_text in [("wall_s", "rmf_stage_wall_seconds", "Stage wall time in seconds"),
+                                   ("cpu_s", "rmf_stage_cpu_seconds", "Stage CPU time in seconds"),
+                                   ("peak_rss_mb", "rmf_stage_peak_rss_mb", "Process peak RSS at stage end in MiB"),
+                                   ("events_per_s", "rmf_stage_events_per_second", "Events processed per second")]:
+        family(name, help_text, [({"stage": stage_name}, s.get(field)) for stage_name, s in sorted(stages.items())])
+    rules = data.get("rules", {})
+    family("rmf_rule_eval_seconds", "Time spent evaluating the rule",
+           [({"rule": rid}, s["eval_s"]) for rid, s in sorted(rules.items())])
+    family("rmf_rule_events", "Events passed to the rule",
+           [({"rule": rid}, s["events"]) for rid, s in sorted(rules.items())])
+    family("rmf_rule_findings", "Findings produced by the rule",
+           [({"rule": rid}, s["findings"]) for rid, s in sorted(rules.items())])
+    family("rmf_rule_late_events", "Out-of-order events the rule dropped",
+           [({"rule": rid}, s.get("late")) for rid, s in sorted(rules.items())])
+    family("rmf_timestamps", "Timestamp parse outcomes",
+           [({"outcome": k}, v) for k, v in sorted(data.get("timestamps", {}).items())])
+    family("rmf_ticket_locks", "Ticket lock statistics",
+           [({"stat": k}, v) for k, v in sorted(data.get("locks", {}).items())])
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def profiled(name, args, out_dir: Path):
+    # Entry-point helper: enables metrics from the parsed --profile flags,
+    # runs the body as stage `name` and writes the metrics files
+    if not (args.profile or args.prometheus or args.cprofile or args.tracemalloc):
+        yield {}
+        return
+    enable(out_dir, args.cprofile, args.tracemalloc)
+    with stage(name) as m:
+        yield m
+    for path in write(out_dir, args.prometheus):
+        print(f"[OK] Metrics: {path}")
@@ -1,46 +1,90 @@
+import argparse
 import json
 import csv
 from pathlib import Path
 from datetime import datetime
 
-def main():
-    root = Path(__file__).resolve().parent
-    enriched_path = root / "data" / "processed" / "findings_enriched.json"
-    out_csv = root / "data" / "processed" / "poam.csv"
+import metrics
+from ai_summarize import template_catalog, template_for
+from findings_io import findings_path, iter_findings
+
+POAM_COLUMNS = [
+    "poam_id",
+    "date_identified",
+    "severity",
+    "weakness_or_deficiency",
+    "nist_800_53_controls",
+    "risk_statement",
+    "recommended_actions",
+    "status",
+    "notes",
+    "entity",
+    "first_seen",
+    "fingerprint",
+    "occurrence_id",
+]
+
+ENTITY_FIELDS = ("host", "user", "ip")
 
-    findings = json.loads(enriched_path.read_text(encoding="utf-8-sig"))
+def finding_entity(fin):
+    # What the finding is about, e.g. "host=DC01; user=eve"
+    ev = fin.get("evidence", {})
+    ev = ev.get("event", ev)
+    return "; ".join(f"{k}={ev[k]}" for k in ENTITY_FIELDS if ev.get(k))
 
-    cols = [
-        "poam_id",
-        "date_identified",
-        "severity",
-        "weakness_or_deficiency",
-        "nist_800_53_controls",
-        "risk_statement",
-        "recommended_actions",
-        "status",
-        "notes",
-    ]
+def finding_first_seen(fin):
+    ev = fin.get("evidence", {})
+    ev = ev.get("event", ev)
+    return ev.get("first_seen") or ev.get("timestamp") or ""
 
-    today = datetime.now().date().isoformat()
+def poam_rows(findings, catalog, today=None):
+    today = today or datetime.now().date().isoformat()
+    for i, fin in enumerate(findings, start=1):
+        template = template_for(catalog, fin)
+        yield {
+            "poam_id": f"POAM-{i:03d}",
+            "date_identified": today,
+            "severity": fin.get("severity"),
+            "weakness_or_deficiency": f"{fin.get('rule_id')} - {fin.get('title')}",
+            "nist_800_53_controls": ", ".join(fin.get("nist_800_53_controls", [])),
+            "risk_statement": template.get("risk_statement"),
+            "recommended_actions": " | ".join(template.get("recommended_actions", [])),
+            "status": "Open",
+            "notes": fin.get("rmf_note", ""),
+            "entity": finding_entity(fin),
+            "first_seen": finding_first_seen(fin),
+            "fingerprint": fin.get("fingerprint", ""),
+            "occurrence_id": fin.get("occurrence_id", ""),
+        }
 
+def write_poam(rows, out_csv: Path):
+    count = 0
     with out_csv.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=cols)
+        w = csv.DictWriter(f, fieldnames=POAM_COLUMNS)
         w.writeheader()
+        for row in rows:
+            w.writerow(row)
+            count += 1
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export enriched findings as POA&M rows (poam.csv).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    processed_dir = root / "data" / "processed"
+    enriched_path = findings_path(processed_dir, "findings_enriched")
+    templates_path = processed_dir / "enrichment_templates.json"
+    out_csv = processed_dir / "poam.csv"
 
-        for i, fin in enumerate(findings, start=1):
-            w.writerow({
-                "poam_id": f"POAM-{i:03d}",
-                "date_identified": today,
-                "severity": fin.get("severity"),
-                "weakness_or_deficiency": f"{fin.get('rule_id')} - {fin.get('title')}",
-                "nist_800_53_controls": ", ".join(fin.get("nist_800_53_controls", [])),
-                "risk_statement": fin.get("risk_statement"),
-                "recommended_actions": " | ".join(fin.get("recommended_actions", [])),
-                "status": "Open",
-                "notes": fin.get("rmf_note", ""),
-            })
+    if templates_path.exists():
+        catalog = json.loads(templates_path.read_text(encoding="utf-8-sig"))
+    else:
+        catalog = template_catalog()
 
+    with metrics.profiled("poam_export", args, processed_dir):
+        metrics.note(rows=write_poam(poam_rows(iter_findings(enriched_path), catalog), out_csv))
     print(f"[OK] Wrote: {out_csv}")
 
 if __name__ == "__main__":
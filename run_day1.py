@@ -1,24 +1,110 @@
 
-print("RUN_DAY1 STARTED")
-
+import argparse
+import glob
+import hashlib
+import heapq
 import json
 import csv
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from pathlib import Path
 
-def read_real_events_json(path: Path):
-    if not path.exists():
-        print(f"[INFO] No real events file found (ok): {path}")
-        return []
+import archive
+import colstore
+import metrics
+import timestamps
+
+COLUMNS = ["source","host","timestamp","event_id","level","provider","user","ip","message","tags","ts"]
+
+def normalize_event(e):
+    # Canonical normalized record: exactly what a round trip through
+    # normalized_events.csv yields, so streaming and CSV paths agree.
+    # ts is the timestamp as epoch milliseconds, parsed once here.
+    row = {c: "" if e.get(c) is None else str(e.get(c)) for c in COLUMNS}
+    row["event_id"] = int(row["event_id"]) if row["event_id"] else None
+    row["ts"] = int(row["ts"]) if row["ts"] else timestamps.to_epoch_ms(row["timestamp"])
+    return row
+
+JSON_WS = " \t\r\n\ufeff"
+NUMBER_TAIL = ".eE+-"  # what can follow a valid number prefix mid-token
+
+def iter_json_array(path: Path, chunk_size=1 << 20):
+    # Incremental parser for a top-level JSON array (or a single object, which
+    # is what ConvertTo-Json emits for one event). Records are decoded one at a
+    # time from a sliding text buffer, so memory is bounded by the largest
+    # record plus one chunk rather than by the file.
+    decoder = json.JSONDecoder()
+    with path.open("r", encoding="utf-8-sig") as f:
+        buf = ""
+        pos = 0
+        eof = False
 
-    raw_text = path.read_text(encoding="utf-8-sig").lstrip("\ufeff")
-    data = json.loads(raw_text)
+        def fill(buf, pos, eof):
+            if eof:
+                return buf, pos, eof
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            return buf[pos:] + chunk, 0, not chunk
 
-    if isinstance(data, dict):
-        data = [data]
+        def skip(buf, pos, eof, chars):
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf, pos, eof
+                buf, pos, eof = fill(buf, pos, eof)
 
-    events = []
-    for e in data:
-        events.append({
+        buf, pos, eof = skip(buf, pos, eof, JSON_WS)
+        if pos >= len(buf):
+            return
+        if buf[pos] != "[":
+            buf, pos, eof = fill(buf, pos, eof)
+            while not eof:
+                buf, pos, eof = fill(buf, pos, eof)
+            yield decoder.raw_decode(buf, pos)[0]
+            return
+        buf, pos, eof = skip(buf, pos + 1, eof, JSON_WS)
+        if pos < len(buf) and buf[pos] == "]":
+            return
+
+        # Each element is followed by exactly one "," or by the closing "]"
+        while True:
+            buf, pos, eof = skip(buf, pos, eof, JSON_WS)
+            if pos >= len(buf):
+                raise ValueError(f"Unterminated JSON array: {path}")
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos, eof = fill(buf, pos, eof)
+                continue
+            sep = end
+            while sep < len(buf) and buf[sep] in JSON_WS:
+                sep += 1
+            if not eof and (sep >= len(buf) or not buf[end:].strip(NUMBER_TAIL)):
+                # The separator is in the next chunk, or a number was cut at
+                # the chunk edge ("1." or "2e") and continues there
+                buf, pos, eof = fill(buf, pos, eof)
+                continue
+            if sep >= len(buf):
+                raise ValueError(f"Unterminated JSON array: {path}")
+            if buf[sep] not in ",]":
+                raise ValueError(f"Expected ',' or ']' after array element: {path}")
+            yield obj
+            if buf[sep] == "]":
+                return
+            pos = sep + 1
+
+def iter_real_events_json(path: Path):
+    if not path.exists():
+        print(f"[INFO] No real events file found (ok): {path}")
+        return
+
+    for e in iter_json_array(path):
+        yield {
             "source": "real",
             "host": e.get("MachineName") or "UNKNOWN",
             "timestamp": str(e.get("TimeCreated") or ""),
@@ -29,54 +115,380 @@ def read_real_events_json(path: Path):
             "ip": None,
             "message": e.get("Message"),
             "tags": None,
-        })
-    return events
+        }
 
-def read_jsonl(path: Path):
-    events = []
+def read_real_events_json(path: Path):
+    return list(iter_real_events_json(path))
+
+def iter_jsonl(path: Path):
     if not path.exists():
         print(f"[WARN] Missing synthetic file: {path}")
-        return events
+        return
     with path.open("r", encoding="utf-8-sig") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             line = line.lstrip("\ufeff")
-            events.append(json.loads(line))
-    return events
+            yield json.loads(line)
+
+def read_jsonl(path: Path):
+    return list(iter_jsonl(path))
+
+# -----------------------
+# Incremental ingestion
+# -----------------------
+# Each raw source has a checkpoint dict (inode + byte offset for JSONL;
+# inode/size/mtime + newest ingested ts and record digests for JSON exports).
+# The tail readers only yield events past the checkpoint and advance it as
+# they go; main() saves the checkpoints once the normalized store has been
+# committed.
+CHECKPOINTS_FILE = "ingest_checkpoints.json"
+
+def load_checkpoints(path: Path):
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_checkpoints(path: Path, checkpoints: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(checkpoints, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+def iter_jsonl_range(path: Path, start=0, end=None, partial_ok=False):
+    # Yields (event, offset just past its line) for the lines in [start, end).
+    # A trailing line without a newline may still be being written, so it is
+    # skipped unless partial_ok is set.
+    with path.open("rb") as f:
+        f.seek(start)
+        offset = start
+        while end is None or offset < end:
+            raw = f.readline()
+            if not raw or (not raw.endswith(b"\n") and not partial_ok):
+                break
+            offset += len(raw)
+            line = raw.decode("utf-8").strip().lstrip("\ufeff")
+            if line:
+                yield json.loads(line), offset
+
+def iter_jsonl_tail(path: Path, cp: dict, partial_ok=False):
+    if not path.exists():
+        print(f"[WARN] Missing synthetic file: {path}")
+        return
+    st = path.stat()
+    if cp.get("inode") != st.st_ino or st.st_size < cp.get("offset", 0):
+        cp.clear()  # rotated or truncated: start over
+    cp["inode"] = st.st_ino
+
+    for e, offset in iter_jsonl_range(path, cp.get("offset", 0), partial_ok=partial_ok):
+        cp["offset"] = offset
+        yield e
+
+def record_digest(e):
+    return hashlib.sha1(json.dumps(e, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def iter_real_events_tail(path: Path, cp: dict):
+    # Get-WinEvent exports are rewritten, newest event first, rather than
+    # appended, so records are recognised by identity, not position. The
+    # checkpoint keeps the newest ts ingested plus the digests of the records
+    # at exactly that ts (and of any without a ts); a re-export yields only
+    # what is newer, or at that ts and not seen yet. Anything older counts as
+    # ingested, so a smaller or reordered re-export adds nothing. An
+    # unchanged file is skipped outright.
+    if not path.exists():
+        print(f"[INFO] No real events file found (ok): {path}")
+        return
+    st = path.stat()
+    unchanged = cp.get("inode") == st.st_ino and cp.get("size") == st.st_size and cp.get("mtime_ns") == st.st_mtime_ns
+    if unchanged and "last_ts" in cp:
+        return
+    # A count checkpoint from an older release on an unchanged file: its
+    # records are in the store, so only the identity state is rebuilt
+    ingested = unchanged
+
+    last = cp.get("last_ts")
+    seen = set(cp.get("seen", []))
+    undated = set(cp.get("undated", []))
+    new_last, new_seen, new_undated = last, set(seen), set(undated)
+    scratch = Counter()  # parsed again at normalize time; counted there
+    for e in iter_real_events_json(path):
+        ts = timestamps.to_epoch_ms(e["timestamp"], stats=scratch)
+        digest = record_digest(e)
+        if ts is None:
+            fresh = digest not in undated
+            new_undated.add(digest)
+        else:
+            fresh = last is None or ts > last or (ts == last and digest not in seen)
+            if new_last is None or ts > new_last:
+                new_last, new_seen = ts, {digest}
+            elif ts == new_last:
+                new_seen.add(digest)
+        if fresh and not ingested:
+            yield e
+    cp.clear()
+    cp.update(inode=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns, last_ts=new_last,
+              seen=sorted(new_seen), undated=sorted(new_undated))
+
+def iter_events(raw_dir: Path, checkpoints=None, incremental=False):
+    # Streaming ingest: yields normalized events one at a time, synthetic
+    # first then real, matching the order main() writes them. Pass the
+    # checkpoints from a previous run with incremental=True to read only what
+    # has been appended since.
+    if checkpoints is None:
+        checkpoints = {}
+    synthetic = raw_dir / "synthetic_logs.jsonl"
+    real = raw_dir / "real_events.json"
+    if not incremental:
+        checkpoints.clear()
+
+    raw = chain(iter_jsonl_tail(synthetic, checkpoints.setdefault(synthetic.name, {}), partial_ok=not incremental),
+                iter_real_events_tail(real, checkpoints.setdefault(real.name, {})))
+    for e in raw:
+        yield normalize_event(e)
 
 def write_csv(events, out_path: Path):
-    cols = ["source","host","timestamp","event_id","level","provider","user","ip","message","tags"]
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with out_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=cols)
+        w = csv.DictWriter(f, fieldnames=COLUMNS)
         w.writeheader()
         for e in events:
-            w.writerow({c: e.get(c) for c in cols})
+            w.writerow({c: e.get(c) for c in COLUMNS})
 
-def main():
-    root = Path(__file__).resolve().parent
+def tee_csv(events, out_path: Path, append=False):
+    # Passes events through while exporting them to CSV in the same pass
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    append = append and out_path.exists()
+    with out_path.open("a" if append else "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=COLUMNS)
+        if not append:
+            w.writeheader()
+        for e in events:
+            w.writerow({c: e.get(c) for c in COLUMNS})
+            yield e
+
+# -----------------------
+# Parallel multi-file ingestion
+# -----------------------
+# Sources (a directory, file or glob; *.jsonl and Get-WinEvent *.json) are
+# split into tasks: one per JSON export and one per CHUNK_BYTES slice of a
+# JSONL file, cut on line boundaries. Each worker normalizes its task, sorts
+# it by time and writes sorted runs of at most RUN_ROWS events as temporary
+# column stores (a large export becomes several runs); the parent k-way
+# merges the runs into the normalized store, so memory stays bounded by the
+# chunk size rather than the input size. The merge compares ts columns only
+# and copies the merged rows column-wise, FLUSH_ROWS at a time, without
+# decoding them into dicts.
+CHUNK_BYTES = 64 * 1024 * 1024
+RUN_ROWS = 200000  # about one CHUNK_BYTES slice of JSONL
+
+def discover_sources(inputs):
+    paths = []
+    for spec in inputs:
+        p = Path(spec)
+        if p.is_dir():
+            candidates = sorted(p.rglob("*"))
+        else:
+            candidates = sorted(Path(x) for x in glob.glob(spec, recursive=True))
+        for c in candidates:
+            if c.is_file() and c.suffix.lower() in (".jsonl", ".json") and c not in paths:
+                paths.append(c)
+    return paths
+
+def split_jsonl(path: Path, start=0, chunk_bytes=None):
+    chunk_bytes = chunk_bytes or CHUNK_BYTES
+    size = path.stat().st_size
+    bounds = [start]
+    with path.open("rb") as f:
+        pos = start + chunk_bytes
+        while pos < size:
+            f.seek(pos)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+            pos += chunk_bytes
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+def event_sort_key(e):
+    ts = e.get("ts")
+    return (ts is None, ts or 0)
+
+def plan_tasks(sources, checkpoints, incremental, run_dir: Path, chunk_bytes=None):
+    tasks = []
+    for path in sources:
+        key = str(path.resolve())
+        cp = checkpoints.get(key, {}) if incremental else {}
+        st = path.stat()
+        if path.suffix.lower() == ".jsonl":
+            start = cp.get("offset", 0)
+            if cp.get("inode") != st.st_ino or st.st_size < start:
+                start = 0
+            for a, b in split_jsonl(path, start, chunk_bytes):
+                tasks.append({"kind": "jsonl", "path": str(path), "key": key, "start": a, "end": b,
+                              "partial_ok": not incremental, "inode": st.st_ino})
+        else:
+            tasks.append({"kind": "json", "path": str(path), "key": key, "checkpoint": dict(cp)})
+    for i, t in enumerate(tasks):
+        t["out"] = str(run_dir / f"run-{i:05d}")
+    return tasks
+
+def ingest_task(task):
+    path = Path(task["path"])
+    result = {"key": task["key"]}
+    if task["kind"] == "jsonl":
+        result["checkpoint"] = {"inode": task["inode"], "offset": task["start"]}
+
+        def raw_events():
+            for e, offset in iter_jsonl_range(path, task["start"], task["end"], task["partial_ok"]):
+                result["checkpoint"]["offset"] = offset
+                yield e
+        raw = raw_events()
+    else:
+        result["checkpoint"] = task["checkpoint"]
+        raw = iter_real_events_tail(path, result["checkpoint"])
+
+    stats_before = Counter(timestamps.PARSE_STATS)
+    result["outs"] = []
+    result["sources"] = Counter()
+    result["rows"] = 0
+    events = [normalize_event(e) for e in islice(raw, RUN_ROWS)]
+    while events:
+        events.sort(key=event_sort_key)
+        out = Path(f"{task['out']}-{len(result['outs']):03d}.cols")
+        colstore.write_store(events, out)
+        result["outs"].append(str(out))
+        result["rows"] += len(events)
+        result["sources"].update(e["source"] for e in events)
+        events = [normalize_event(e) for e in islice(raw, RUN_ROWS)]
+    result["ts_stats"] = timestamps.PARSE_STATS - stats_before
+    return result
+
+def merge_runs(run_paths, out_store: Path, append=False):
+    stores = [colstore.ColumnStore(p) for p in run_paths]
+
+    def keyed(i, store):
+        ts = store.column("ts")
+        for j in range(store.rows):
+            value = ts[j]
+            missing = value == colstore.MISSING
+            yield missing, 0 if missing else value, i, j
+
+    with colstore.ColumnStoreWriter(out_store, append=append) as w:
+        picks = []
+        for *_, i, j in heapq.merge(*(keyed(i, s) for i, s in enumerate(stores))):
+            picks.append((i, j))
+            if len(picks) == colstore.FLUSH_ROWS:
+                w.copy_rows(stores, picks)
+                picks = []
+        w.copy_rows(stores, picks)
+    return w.rows
+
+def ingest_parallel(inputs, out_store: Path, checkpoints: dict, incremental=False, workers=None):
+    sources = discover_sources(inputs)
+    print(f"[INFO] Sources: {len(sources)}")
+
+    with tempfile.TemporaryDirectory(prefix="ingest-", dir=out_store.parent) as tmp:
+        tasks = plan_tasks(sources, checkpoints, incremental, Path(tmp))
+        print(f"[INFO] Tasks: {len(tasks)} across {workers or os.cpu_count()} workers")
+        if workers == 1:
+            results = [ingest_task(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(ingest_task, tasks))
+
+        counts = Counter()
+        for r in results:
+            counts.update(r["sources"])
+            if workers != 1:
+                timestamps.PARSE_STATS.update(r["ts_stats"])
+            # Results come back in task order, so the last chunk of a file
+            # carries its final offset.
+            checkpoints[r["key"]] = r["checkpoint"]
+
+        total = merge_runs([out for r in results for out in r["outs"]], out_store, append=incremental)
+    return total, counts
+
+def ingest(root: Path, export_csv=False, incremental=False, inputs=None, workers=None):
+    # Builds data/processed/normalized_events.cols under root; returns its path
+    print("RUN_DAY1 STARTED")
     raw_dir = root / "data" / "raw"
     processed_dir = root / "data" / "processed"
 
     print(f"[INFO] Project root: {root}")
     print(f"[INFO] Raw dir: {raw_dir}")
 
-    synthetic = read_jsonl(raw_dir / "synthetic_logs.jsonl")
-    real = read_real_events_json(raw_dir / "real_events.json")
-    events = synthetic + real
+    counts = Counter()
+    preview = []
+
+    def tracked(events):
+        for e in events:
+            counts[e["source"]] += 1
+            if len(preview) < 5:
+                preview.append(e)
+            yield e
+
+    out_store = processed_dir / "normalized_events.cols"
+    checkpoints_path = processed_dir / CHECKPOINTS_FILE
+    incremental = incremental and colstore.ColumnStore.exists(out_store)
+    checkpoints = load_checkpoints(checkpoints_path) if incremental else {}
+    out_csv = processed_dir / "normalized_events.csv"
+
+    if inputs:
+        processed_dir.mkdir(parents=True, exist_ok=True)
+        total, parallel_counts = ingest_parallel(inputs, out_store, checkpoints, incremental, workers)
+        counts.update(parallel_counts)
+        if export_csv:
+            store = colstore.ColumnStore(out_store)
+            write_csv(store.iter_rows(), out_csv)
+        preview = list(islice(colstore.ColumnStore(out_store).iter_rows(), 5))
+    else:
+        events = tracked(iter_events(raw_dir, checkpoints, incremental=incremental))
+        if export_csv:
+            events = tee_csv(events, out_csv, append=incremental)
+        total = colstore.write_store(events, out_store, append=incremental)
+    save_checkpoints(checkpoints_path, checkpoints)
+    metrics.note(events=sum(counts.values()), rows=total)
 
-    print(f"[INFO] Synthetic events: {len(synthetic)}")
-    print(f"[INFO] Real events: {len(real)}")
-    print(f"[INFO] Total events: {len(events)}")
+    if incremental:
+        print(f"[INFO] Incremental run: {sum(counts.values())} new events")
+    print(f"[INFO] Synthetic events: {counts['synthetic']}")
+    print(f"[INFO] Real events: {counts['real']}")
+    print(f"[INFO] Total events: {total}")
+    print(f"[INFO] Timestamps: {timestamps.report()}")
+    if timestamps.failures():
+        print(f"[WARN] Unparseable timestamps: {timestamps.failures()} (stored with no ts)")
 
-    for e in events[:5]:
+    for e in preview:
         print(f"{e.get('timestamp')} | {e.get('event_id')} | {e.get('level')} | {e.get('source')}")
 
-    out_csv = processed_dir / "normalized_events.csv"
-    write_csv(events, out_csv)
-    print(f"[OK] Saved: {out_csv}")
+    print(f"[OK] Saved: {out_store}")
+    if export_csv:
+        print(f"[OK] Saved: {out_csv}")
+    return out_store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest and normalize raw logs.")
+    parser.add_argument("--csv", action="store_true",
+                        help="also export data/processed/normalized_events.csv for humans")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest events appended since the last run's checkpoints")
+    parser.add_argument("--inputs", action="append", metavar="PATH_OR_GLOB",
+                        help="raw source directory, file or glob (repeatable); enables parallel, time-ordered ingest")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for --inputs (default: CPU count)")
+    parser.add_argument("--archive", action="store_true",
+                        help="also append the new events to the partitioned archive (data/archive)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    with metrics.profiled("run_day1", args, root / "data" / "processed"):
+        out_store = ingest(root, args.csv, args.incremental, args.inputs, args.workers)
+        if args.archive:
+            archive_dir = root / "data" / "archive"
+            print(f"[OK] Archived {archive.archive_store(out_store, archive_dir)} new events -> {archive_dir}")
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,329 @@
-import subprocess
-import sys
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+import metrics
+
 REPO_ROOT = Path(__file__).resolve().parent
 
-def run(cmd):
-    print(f"[RUN] {' '.join(cmd)}")
-    r = subprocess.run(cmd, cwd=str(REPO_ROOT), check=False)
-    if r.returncode != 0:
-        raise SystemExit(r.returncode)
+# In-process DAG runner. Each stage is a function over its dependencies'
+# in-memory results (findings lists, POA&M rows), so nothing is re-parsed
+# between stages; intermediate files are still written for the stand-alone
+# scripts unless --no-materialize is given.
+#
+# A stage is skipped when its key -- a hash of its code, parameters, input
+# file contents and its dependencies' output digests -- matches the last
+# run and its outputs still exist. A skipped stage's result is loaded from
+# its outputs only if a downstream stage actually runs. Stages whose
+# dependencies are done run concurrently on a thread pool.
+
+STATE_FILE = "pipeline_state.json"
+STATE_VERSION = 1
+
+_print_lock = threading.Lock()
+
+def say(msg):
+    # Status lines from concurrent stages stay whole
+    with _print_lock:
+        print(msg, flush=True)
+
+# -----------------------
+# Hashing
+# -----------------------
+def sha1_file(path: Path):
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def files_under(path: Path):
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.is_file())
+    return [path] if path.exists() else []
+
+def digest_records(records):
+    h = hashlib.sha1()
+    for r in records:
+        h.update(json.dumps(r, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+class FileHasher:
+    # Content hashes of input files, re-read only when size or mtime changed
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+
+    def digest(self, path: Path):
+        h = hashlib.sha1()
+        for p in files_under(path):
+            st = p.stat()
+            key = str(p)
+            with self.lock:
+                cached = self.cache.get(key)
+            if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+                sha = cached[2]
+            else:
+                sha = sha1_file(p)
+                with self.lock:
+                    self.cache[key] = [st.st_size, st.st_mtime_ns, sha]
+            h.update(f"{p.relative_to(path) if p != path else p.name}:{sha}\n".encode("utf-8"))
+        return h.hexdigest()
+
+# -----------------------
+# Runner
+# -----------------------
+class Stage:
+    # fn(results) -> value, where results maps each dependency to its value.
+    # load() rebuilds the value from the outputs when the stage is skipped;
+    # digest(value) identifies the value for downstream keys.
+    def __init__(self, name, fn, deps=(), modules=(), inputs=(), outputs=(), params=None,
+                 load=None, digest=None, always=False):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.modules = list(modules)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.load = load
+        self.digest = digest or (lambda value: digest_records(value if isinstance(value, list) else [value]))
+        self.always = always
+
+class Pipeline:
+    def __init__(self, stages, state_path: Path, jobs=4, force=False):
+        self.stages = {s.name: s for s in stages}
+        self.state_path = state_path
+        self.jobs = jobs
+        self.force = force
+        state = {}
+        if state_path.exists():
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+        if state.get("version") != STATE_VERSION:
+            state = {}
+        self.state = {"version": STATE_VERSION, "files": state.get("files", {}), "stages": state.get("stages", {})}
+        self.hasher = FileHasher(self.state["files"])
+        self.values = {}
+        self.digests = {}
+        self.locks = {name: threading.Lock() for name in self.stages}
+        self.status = {}
+
+    def value(self, name):
+        # A skipped stage's value is loaded on first use
+        with self.locks[name]:
+            if name not in self.values:
+                self.values[name] = self.stages[name].load()
+            return self.values[name]
+
+    def key(self, stage):
+        parts = {
+            "code": [sha1_file(REPO_ROOT / f"{m}.py") for m in stage.modules],
+            "params": stage.params,
+            "inputs": [self.hasher.digest(p) for p in stage.inputs],
+            "deps": [self.digests[d] for d in stage.deps],
+        }
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def run_stage(self, stage):
+        t0 = time.perf_counter()
+        key = self.key(stage)
+        recorded = self.state["stages"].get(stage.name, {})
+        if (not self.force and not stage.always and recorded.get("key") == key
+                and all(p.exists() for p in stage.outputs) and stage.load is not None):
+            self.digests[stage.name] = recorded["digest"]
+            if metrics.ENABLED:
+                metrics.METRICS["stages"][stage.name] = {"skipped": True}
+            return "skipped", time.perf_counter() - t0
+
+        say(f"[RUN] {stage.name}")
+        inputs = {d: self.value(d) for d in stage.deps}
+        with metrics.stage(stage.name):
+            value = stage.fn(inputs)
+        with self.locks[stage.name]:
+            self.values[stage.name] = value
+        self.digests[stage.name] = stage.digest(value)
+        if stage.load is not None and all(p.exists() for p in stage.outputs):
+            self.state["stages"][stage.name] = {"key": key, "digest": self.digests[stage.name]}
+        else:
+            self.state["stages"].pop(stage.name, None)
+        return "ran", time.perf_counter() - t0
+
+    def run(self):
+        pending = dict(self.stages)
+        running = {}
+        failed = None
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or running:
+                if failed is None:
+                    for name, stage in list(pending.items()):
+                        if all(self.status.get(d) in ("ran", "skipped") for d in stage.deps):
+                            running[pool.submit(self.run_stage, stage)] = name
+                            del pending[name]
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.status[name], elapsed = future.result()
+                    except Exception as e:
+                        self.status[name] = "failed"
+                        failed = failed or (name, e)
+                        say(f"[ERROR] {name} failed: {e!r}")
+                        continue
+                    label = "[SKIP]" if self.status[name] == "skipped" else "[OK]"
+                    note = " (inputs unchanged)" if self.status[name] == "skipped" else ""
+                    say(f"{label} {name}{note} {elapsed:.2f}s")
+        self.save()
+        if failed:
+            raise failed[1]
+        return self.status
+
+    def save(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps(self.state), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+# -----------------------
+# Stages
+# -----------------------
+def build_stages(root: Path, stream=False, backend="python", group=False, materialize=True):
+    import ai_summarize
+    import dashboard
+    import detect
+    import poam_export
+    import run_day1
+    import ticketing
+    from colstore import ColumnStore
+    from findings_io import iter_findings, write_jsonl
+
+    raw_dir = root / "data" / "raw"
+    processed_dir = root / "data" / "processed"
+    store_path = processed_dir / "normalized_events.cols"
+    findings_out = processed_dir / "findings.jsonl"
+    enriched_out = processed_dir / "findings_enriched.jsonl"
+    templates_out = processed_dir / "enrichment_templates.json"
+    def intermediate(*paths):
+        # Without materialization these stages keep no outputs and always rerun
+        return list(paths) if materialize else []
+
+    def ingest(results):
+        return ColumnStore(run_day1.ingest(root))
+
+    def find(results):
+        if stream:
+            # JSONL/JSON -> normalize -> detect in one pass, no column store
+            findings = list(detect.stream_rules(run_day1.iter_events(raw_dir)))
+        else:
+            findings = detect.detect_findings(processed_dir, backend)
+        if stream:
+            metrics.count_findings(findings)
+        if materialize:
+            write_jsonl(findings, findings_out)
+        say(f"[OK] Findings: {len(findings)}")
+        return findings
+
+    def enrich(results):
+        catalog = ai_summarize.template_catalog()
+        templates_out.write_text(json.dumps(catalog, indent=2), encoding="utf-8")
+        findings = list(ai_summarize.enrich(results["detect"], catalog))
+        if materialize:
+            write_jsonl(findings, enriched_out)
+        metrics.note(findings=len(findings))
+        return {"catalog": catalog, "findings": findings}
+
+    def load_enriched():
+        return {"catalog": json.loads(templates_out.read_text(encoding="utf-8")),
+                "findings": list(iter_findings(enriched_out))}
+
+    def report(results):
+        enriched = results["ai_summarize"]
+        out_md = processed_dir / "ai_summary.md"
+        ai_summarize.write_report(enriched["findings"], out_md, enriched["catalog"], group)
+        say(f"[OK] Wrote: {out_md}")
+        return str(out_md)
+
+    def poam(results):
+        enriched = results["ai_summarize"]
+        rows = list(poam_export.poam_rows(enriched["findings"], enriched["catalog"]))
+        metrics.note(rows=poam_export.write_poam(rows, processed_dir / "poam.csv"))
+        return rows
+
+    stages = [
+        Stage("detect", find, modules=["detect", "detect_numpy", "findings_io"], params={"backend": backend},
+              outputs=intermediate(findings_out), load=lambda: list(iter_findings(findings_out))),
+        Stage("ai_summarize", enrich, deps=["detect"], modules=["ai_summarize"],
+              outputs=intermediate(enriched_out, templates_out), load=load_enriched,
+              digest=lambda v: digest_records(v["findings"] + [v["catalog"]])),
+        Stage("report", report, deps=["ai_summarize"], modules=["ai_summarize"], params={"group": group},
+              outputs=[processed_dir / "ai_summary.md"], load=lambda: str(processed_dir / "ai_summary.md")),
+        Stage("poam_export", poam, deps=["ai_summarize"], modules=["poam_export"],
+              outputs=[processed_dir / "poam.csv"], load=lambda: ticketing.load_poam(processed_dir / "poam.csv")),
+        # upserts are idempotent, so unchanged POA&M rows need no pass over the tickets
+        Stage("ticketing", lambda results: ticketing.upsert_all(root, results["poam_export"]), deps=["poam_export"],
+              modules=["ticketing", "ticket_index", "ticket_store"], load=lambda: None, digest=lambda v: ""),
+        # tickets also change outside the pipeline (update_ticket.py); the
+        # dashboard is incremental, so it always runs
+        Stage("dashboard", lambda results: str(dashboard.write_dashboard(root)), deps=["ticketing"],
+              modules=["dashboard"], always=True),
+    ]
+    if stream:
+        stages[0].inputs = [raw_dir]
+        stages[0].params["stream"] = True
+    else:
+        # the store's generation changes whenever it is rebuilt, also by a
+        # manual run_day1.py, so downstream keys follow the actual store
+        stages.insert(0, Stage("run_day1", ingest, modules=["run_day1", "colstore", "timestamps"], inputs=[raw_dir],
+                               outputs=[store_path], load=lambda: ColumnStore(store_path),
+                               digest=lambda store: store.generation))
+        stages[1].deps = ["run_day1"]
+    return stages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the RMF log analysis pipeline.")
+    parser.add_argument("--stream", action="store_true",
+                        help="ingest raw logs and detect in one streaming pass (no column store)")
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python", help="detection backend")
+    parser.add_argument("--group", action="store_true", help="grouped ai_summary.md (see ai_summarize.py --group)")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="keep findings in memory only (no findings*.jsonl); those stages then always rerun")
+    parser.add_argument("--force", action="store_true", help="run every stage even if its inputs are unchanged")
+    parser.add_argument("--jobs", type=int, default=4, help="stages run concurrently (default 4)")
+    parser.add_argument("--root", default=str(REPO_ROOT), help="project root holding data/ and tickets/")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).resolve()
+    processed_dir = root / "data" / "processed"
+    profiling = args.profile or args.prometheus or args.cprofile or args.tracemalloc
+    jobs = args.jobs
+    if profiling:
+        metrics.enable(processed_dir, args.cprofile, args.tracemalloc)
+        if args.cprofile or args.tracemalloc:
+            # both hook the whole interpreter, so stages must not overlap
+            print("[INFO] --cprofile/--tracemalloc: running stages one at a time")
+            jobs = 1
+
+    t0 = time.perf_counter()
+    stages = build_stages(root, args.stream, args.backend, args.group, not args.no_materialize)
+    pipeline = Pipeline(stages, processed_dir / STATE_FILE, jobs=jobs, force=args.force)
+    status = pipeline.run()
+    if profiling:
+        metrics.METRICS["stages"]["pipeline"] = {"wall_s": round(time.perf_counter() - t0, 4),
+                                                 "peak_rss_mb": metrics.peak_rss_mb()}
+        for path in metrics.write(processed_dir, args.prometheus):
+            print(f"[OK] Metrics: {path}")
+
+    skipped = sum(1 for s in status.values() if s == "skipped")
+    print(f"[OK] Pipeline complete ({len(status) - skipped} ran, {skipped} skipped).")
+    print(f"Open: {root / 'data' / 'processed' / 'ai_summary.md'}")
 
 if __name__ == "__main__":
-    run([sys.executable, "detect.py"])
-    run([sys.executable, "ai_summarize.py"])
-    print("[OK] Pipeline complete.")
-    print("Open: data/processed/ai_summary.md")
+    main()
@@ -0,0 +1,46 @@
+from pathlib import Path
+import io
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import ai_summarize
+
+
+def _finding(user, first_seen):
+    return {"rule_id": "AUTH-001", "severity": "Medium", "title": "Failed login burst",
+            "nist_800_53_controls": ["AC-7"], "template": "AUTH-001",
+            "evidence": {"user": user, "ip": "203.0.113.10", "first_seen": first_seen, "last_seen": first_seen}}
+
+
+def test_report_reuses_sections_per_key():
+    out = io.StringIO()
+    report = ai_summarize.ReportWriter(out, ai_summarize.template_catalog())
+    for i in range(50):
+        report.add(_finding(f"user{i % 3}", "2026-02-05T14:00:00Z"))
+    report.close()
+    assert len(report.sections) == 1
+    assert out.getvalue().count("## [Medium] AUTH-001") == 50
+
+
+def test_grouped_report_collapses_findings():
+    out = io.StringIO()
+    report = ai_summarize.ReportWriter(out, ai_summarize.template_catalog(), grouped=True)
+    for i in range(7):
+        report.add(_finding("alice" if i < 5 else "bob", f"2026-02-05T14:0{i}:00Z"))
+    report.close()
+    text = out.getvalue()
+    assert text.count("## [Medium] AUTH-001 — Failed login burst (7 findings)") == 1
+    assert "**Seen:** 2026-02-05T14:00:00Z to 2026-02-05T14:06:00Z" in text
+    assert text.index("user=alice, ip=203.0.113.10 (5)") < text.index("user=bob, ip=203.0.113.10 (2)")
+
+
+def test_grouped_seen_range_compares_instants_not_strings():
+    # As text, "/Date(...)/" sorts after every ISO value and the -05:00 value
+    # sorts before the Z one; as instants the order is 14:10, 14:20, 14:30Z.
+    out = io.StringIO()
+    report = ai_summarize.ReportWriter(out, ai_summarize.template_catalog(), grouped=True)
+    for ts in ("2026-02-05T14:20:00Z", "2026-02-05T09:30:00-05:00", "/Date(1770300600000)/"):
+        report.add(_finding("alice", ts))
+    report.close()
+    assert "**Seen:** 2026-02-05T14:10:00Z to 2026-02-05T14:30:00Z" in out.getvalue()
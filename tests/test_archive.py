@@ -0,0 +1,67 @@
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import archive
+import colstore
+import detect
+import run_day1
+
+
+def _event(ts, event_id, host="WS01", user="jsmith"):
+    return run_day1.normalize_event({"source": "synthetic", "host": host, "timestamp": ts, "event_id": event_id,
+                                     "user": user, "message": "synthetic event"})
+
+
+def _archive(tmp_path):
+    events = [_event(f"2026-02-0{d}T{h:02d}:10:00Z", 4624) for d in (1, 2) for h in range(0, 24, 6)]
+    events.append(_event("2026-02-02T12:40:00Z", 1102, host="DC01"))
+    store = tmp_path / "normalized_events.cols"
+    colstore.write_store(events, store)
+    archive.archive_store(store, tmp_path / "archive")
+    return store
+
+
+def test_hunt_opens_only_matching_partitions(tmp_path):
+    store = _archive(tmp_path)
+    findings = detect.hunt(tmp_path / "archive", rule_ids=["AUD-001"])
+    assert [f["rule_id"] for f in findings] == ["AUD-001"]
+
+    arc = archive.Archive(tmp_path / "archive")
+    assert len(arc.catalog["partitions"]) == 8
+    assert arc.partitions(event_ids={1102}) == ["2026-02-02/12"]
+    assert arc.partitions(hosts=["dc01"]) == ["2026-02-02/12"]
+    assert len(arc.partitions(archive.timestamps.to_epoch_ms("2026-02-02T00:00:00Z"))) == 4
+
+    rows = list(arc.iter_rows(event_ids={1102}, columns=["event_id"], ref=True))
+    assert [r["event_id"] for r in rows] == [1102] and arc.opened == 1
+    assert arc.resolve(rows[0]["_ref"])["host"] == "DC01"
+
+    # re-archiving the same store adds nothing
+    assert archive.archive_store(store, tmp_path / "archive") == 0
+
+
+def test_appended_rows_extend_partitions(tmp_path):
+    store = _archive(tmp_path)
+    colstore.write_store([_event("2026-02-02T12:50:00Z", 1102)], store, append=True)
+    assert archive.archive_store(store, tmp_path / "archive") == 1
+
+    arc = archive.Archive(tmp_path / "archive")
+    assert arc.catalog["partitions"]["2026-02-02/12"]["rows"] == 3
+    until = archive.timestamps.to_epoch_ms("2026-02-02T12:45:00Z")
+    assert len(list(arc.iter_rows(end=until, event_ids={1102}))) == 1
+
+
+def test_rebuilt_store_is_not_archived_twice(tmp_path):
+    store = _archive(tmp_path)
+    events = list(colstore.ColumnStore(store).iter_rows())
+    # a plain run_day1 rebuild: new generation, same events, plus a second
+    # copy of one event that really was logged twice
+    colstore.write_store(events + [events[0]], store)
+    assert archive.archive_store(store, tmp_path / "archive") == 1
+    assert archive.archive_store(store, tmp_path / "archive") == 0
+
+    arc = archive.Archive(tmp_path / "archive")
+    assert sum(e["rows"] for e in arc.catalog["partitions"].values()) == len(events) + 1
+    assert len(detect.hunt(tmp_path / "archive", rule_ids=["AUD-001"])) == 1
@@ -0,0 +1,32 @@
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import benchmark
+import generate_logs
+import run_day1
+import timestamps
+
+
+def test_generator_is_seeded_and_readable(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    counts = generate_logs.generate(a, 500, seed=3)
+    generate_logs.generate(b, 500, seed=3)
+    for name in ("synthetic_logs.jsonl", "real_events.json"):
+        assert (a / name).read_bytes() == (b / name).read_bytes()
+
+    events = list(run_day1.iter_events(a))
+    assert len(events) == 500 == counts["synthetic"] + counts["real"]
+    assert all(e["ts"] is not None for e in events)
+    assert {e["event_id"] for e in events} >= {4625, 4624, 4688}
+
+    # The export is newest first, like Get-WinEvent
+    times = [timestamps.to_epoch_ms(e["timestamp"]) for e in run_day1.iter_real_events_json(a / "real_events.json")]
+    assert len(times) == counts["real"] and times == sorted(times, reverse=True)
+
+
+def test_compare_flags_regressions_over_threshold():
+    baseline = {"stages": {"detect": {"wall_s": 1.0}, "dashboard": {"wall_s": 1.0}}}
+    current = {"stages": {"detect": {"wall_s": 1.5}, "dashboard": {"wall_s": 1.1}}}
+    assert [r[0] for r in benchmark.compare(current, baseline, threshold=0.2)] == ["detect"]
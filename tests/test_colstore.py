@@ -0,0 +1,38 @@
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import colstore
+import run_day1
+
+
+def _events():
+    return [
+        run_day1.normalize_event({"source": "synthetic", "host": "LAB", "timestamp": "2026-02-05T14:12:11Z",
+                                  "event_id": 4625, "user": "jsmith", "ip": "203.0.113.10",
+                                  "message": "An account failed to log on.", "tags": ["auth"]}),
+        run_day1.normalize_event({"source": "real", "host": "LAB", "timestamp": "", "event_id": None,
+                                  "message": "Multi\nline ✓"}),
+    ]
+
+
+def test_round_trip_matches_normalized_events(tmp_path):
+    events = _events()
+    assert colstore.write_store(events, tmp_path / "s.cols") == 2
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+    assert list(store.iter_rows()) == events
+    assert list(store.column("ts")) == [1770300731000, colstore.MISSING]
+    assert store.dictionary("host") == ["LAB"]
+
+
+def test_iter_rows_filters_ids_and_columns(tmp_path):
+    colstore.write_store(_events(), tmp_path / "s.cols")
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+    rows = list(store.iter_rows(columns=["event_id", "user"], event_ids={4625}))
+    assert rows == [{"event_id": 4625, "user": "jsmith"}]
+
+
+def test_empty_store(tmp_path):
+    colstore.write_store([], tmp_path / "s.cols")
+    assert list(colstore.ColumnStore(tmp_path / "s.cols").iter_rows()) == []
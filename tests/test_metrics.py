@@ -0,0 +1,38 @@
+from pathlib import Path
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import detect
+import metrics
+
+
+def test_profile_records_stage_and_rule_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    monkeypatch.setattr(metrics, "METRICS", {"stages": {}, "rules": {}})
+    monkeypatch.setattr(metrics, "OPTIONS", dict(metrics.OPTIONS))
+    metrics.enable(tmp_path, cprofile=True)
+
+    events = [{"event_id": 4625, "user": "bob", "ip": "10.0.0.1", "timestamp": f"2026-02-05T14:0{i}:00Z"}
+              for i in range(3)]
+    with metrics.stage("detect"):
+        findings = detect.run_rules(events + [{"event_id": 4624}])
+        metrics.count_findings(findings)
+        metrics.note(events=4)
+    metrics.write(tmp_path, prometheus=True)
+
+    data = json.loads((tmp_path / metrics.METRICS_FILE).read_text(encoding="utf-8"))
+    assert data["stages"]["detect"]["events"] == 4
+    assert data["rules"]["AUTH-001"]["events"] == 3
+    assert data["rules"]["AUTH-001"]["findings"] == 1
+    assert (tmp_path / metrics.PROFILE_DIR / "detect.pstats").exists()
+    prom = (tmp_path / metrics.PROM_FILE).read_text(encoding="utf-8")
+    assert 'rmf_rule_findings{rule="AUTH-001"} 1' in prom
+    assert 'rmf_stage_wall_seconds{stage="detect"}' in prom
+
+    # a later run of another stage keeps the detect entries
+    monkeypatch.setattr(metrics, "METRICS", {"stages": {"poam_export": {"wall_s": 0.1}}, "rules": {}})
+    metrics.write(tmp_path)
+    data = json.loads((tmp_path / metrics.METRICS_FILE).read_text(encoding="utf-8"))
+    assert set(data["stages"]) == {"detect", "poam_export"}
@@ -1,12 +1,45 @@
 from pathlib import Path
+import shutil
 import subprocess
 import sys
 
-def test_pipeline_runs():
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import run_pipeline
+
+
+def test_pipeline_runs(tmp_path):
+    # Runs against a copy of data/raw: the full pipeline also creates tickets
     repo = Path(__file__).resolve().parents[1]
-    out_md = repo / "data" / "processed" / "ai_summary.md"
+    shutil.copytree(repo / "data" / "raw", tmp_path / "data" / "raw")
+    out_md = tmp_path / "data" / "processed" / "ai_summary.md"
 
-    r = subprocess.run([sys.executable, "run_pipeline.py"], cwd=str(repo))
+    r = subprocess.run([sys.executable, "run_pipeline.py", "--root", str(tmp_path)], cwd=str(repo))
     assert r.returncode == 0
     assert out_md.exists()
     assert out_md.stat().st_size > 100
+    assert len(list((tmp_path / "tickets" / "open").glob("TICKET-*.json"))) == 5
+    assert (tmp_path / "DASHBOARD.md").exists()
+
+
+def test_pipeline_skips_unchanged_stages(tmp_path, capsys):
+    repo = Path(__file__).resolve().parents[1]
+    shutil.copytree(repo / "data" / "raw", tmp_path / "data" / "raw")
+    args = ["--root", str(tmp_path)]
+
+    run_pipeline.main(args)
+    poam = (tmp_path / "data" / "processed" / "poam.csv").read_text(encoding="utf-8")
+    capsys.readouterr()
+    run_pipeline.main(args)
+    out = capsys.readouterr().out
+    assert "(1 ran, 6 skipped)" in out  # only the dashboard reruns
+
+    # new raw data reruns everything downstream of ingest
+    with (tmp_path / "data" / "raw" / "synthetic_logs.jsonl").open("a", encoding="utf-8") as f:
+        f.write('{"source": "synthetic", "host": "LAB", "timestamp": "2026-02-06T10:00:00Z", "event_id": 1102,'
+                ' "user": "eve", "message": "The audit log was cleared."}\n')
+    run_pipeline.main(args)
+    out = capsys.readouterr().out
+    assert "[SKIP]" not in out
+    assert "[OK] Created ticket: TICKET-006" in out
+    assert (tmp_path / "data" / "processed" / "poam.csv").read_text(encoding="utf-8") != poam
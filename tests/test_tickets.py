@@ -0,0 +1,254 @@
+from pathlib import Path
+import shutil
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import dashboard
+import poam_export
+import ticket_index
+import ticketing
+import update_ticket
+from ai_summarize import template_catalog
+from findings_io import iter_findings
+
+
+def _poam(severity="High", weakness="AUD-001 - Audit log cleared"):
+    return {
+        "severity": severity,
+        "weakness_or_deficiency": weakness,
+        "nist_800_53_controls": "AU-6, IR-4",
+        "risk_statement": "",
+        "recommended_actions": "",
+    }
+
+
+def _make_tickets(root, n=3):
+    ticketing.ensure_dirs(root)
+    for i in range(1, n + 1):
+        ticketing.write_ticket(root, "open", ticketing.create_ticket(_poam(), f"TICKET-{i:03d}"))
+
+
+def test_index_follows_ticket_updates(tmp_path):
+    _make_tickets(tmp_path)
+    idx = ticket_index.open_index(tmp_path)
+    assert idx.count() == 3
+
+    update_ticket.move_ticket(tmp_path, "TICKET-002", "in_progress")
+    update_ticket.add_comment(tmp_path, "TICKET-002", "triaged")
+    status, path = update_ticket.find_ticket(tmp_path, "TICKET-002")
+    assert (status, path.parent.name) == ("in_progress", "in_progress")
+    assert idx.get("TICKET-002")["status"] == "in_progress"
+    assert idx.verify() == []
+
+
+def test_verify_reports_out_of_band_changes(tmp_path):
+    _make_tickets(tmp_path)
+    idx = ticket_index.open_index(tmp_path)
+    open_dir = tmp_path / "tickets" / "open"
+    (open_dir / "TICKET-001.json").rename(tmp_path / "tickets" / "closed" / "TICKET-001.json")
+    (open_dir / "TICKET-003.json").unlink()
+    (open_dir / "TICKET-009.json").write_text('{"ticket_id": "TICKET-009"}', encoding="utf-8")
+
+    problems = {(p, tid) for p, tid, _ in idx.verify()}
+    assert problems == {("moved", "TICKET-001"), ("missing", "TICKET-003"), ("unindexed", "TICKET-009")}
+
+    # lookups repair a stale entry on their own
+    assert update_ticket.find_ticket(tmp_path, "TICKET-001")[0] == "closed"
+    idx.rebuild()
+    assert idx.verify() == []
+
+
+def test_incremental_dashboard_matches_full(tmp_path):
+    from datetime import date, timedelta
+
+    _make_tickets(tmp_path, 5)
+    idx = ticket_index.open_index(tmp_path)
+    today = date.today()
+    assert dashboard.update_aggregates(idx, today)[0] == "full"
+
+    update_ticket.move_ticket(tmp_path, "TICKET-001", "in_progress")
+    update_ticket.add_evidence(tmp_path, "TICKET-002", "scan.txt")
+    ticketing.write_ticket(tmp_path, "open", ticketing.create_ticket(_poam("Critical", "new"), "TICKET-006"))
+    assert dashboard.update_aggregates(idx, today) == ("incremental", 3)
+    incremental = dashboard.render(idx)[2:]
+
+    # due dates pass: only the crossed tickets are re-evaluated
+    later = today + timedelta(days=20)
+    dashboard.update_aggregates(idx, later)
+    overdue = {r[0] for r in idx.conn.execute("SELECT ticket_id FROM dash_overdue")}
+    assert overdue == {f"TICKET-{i:03d}" for i in range(1, 7)}
+
+    dashboard.update_aggregates(idx, today, full=True)
+    assert dashboard.render(idx)[2:] == incremental
+
+
+def test_batch_applies_valid_tickets_and_reports_failures(tmp_path):
+    _make_tickets(tmp_path, 3)
+    ops_path = tmp_path / "ops.csv"
+    ops_path.write_text(
+        "op,ticket_id,value\n"
+        "move,TICKET-001,in_progress\n"
+        "comment,TICKET-001,patched\n"
+        "move,TICKET-001,awaiting_validation\n"
+        "close,TICKET-001,verified\n"
+        "evidence,TICKET-002,scan.txt\n"
+        "close,TICKET-002,too early\n"
+        "comment,TICKET-404,hello\n",
+        encoding="utf-8",
+    )
+    results = update_ticket.apply_batch(tmp_path, update_ticket.load_operations(ops_path))
+    assert [r["ok"] for r in results] == [True, True, True, True, False, False, False]
+    assert results[5]["error"] == "Transition not allowed: open -> closed"
+    assert results[4]["error"].startswith("skipped")
+
+    status, path = update_ticket.find_ticket(tmp_path, "TICKET-001")
+    ticket = update_ticket.load_ticket(path)
+    assert status == "closed"
+    assert [c["comment"] for c in ticket["comments"]] == ["patched", "CLOSURE JUSTIFICATION: verified"]
+    # the rejected ticket was not touched
+    assert update_ticket.load_ticket(update_ticket.find_ticket(tmp_path, "TICKET-002")[1])["evidence"] == []
+    assert ticket_index.open_index(tmp_path).verify() == []
+
+
+def test_recover_replays_or_rolls_back_interrupted_moves(tmp_path):
+    import ticket_store
+
+    _make_tickets(tmp_path, 2)
+    open_dir, progress_dir = tmp_path / "tickets" / "open", tmp_path / "tickets" / "in_progress"
+
+    # TICKET-001: crashed after the new copy was written
+    t1 = update_ticket.load_ticket(open_dir / "TICKET-001.json")
+    journal = ticket_store.journal_path(tmp_path, "TICKET-001")
+    journal.parent.mkdir(parents=True)
+    ticket_store.atomic_write_json(journal, {"ticket_id": "TICKET-001", "from": "tickets/open/TICKET-001.json",
+                                             "to": "tickets/in_progress/TICKET-001.json"})
+    ticket_store.atomic_write_json(progress_dir / "TICKET-001.json", dict(t1, status="in_progress"))
+    # TICKET-002: crashed while writing the new copy
+    ticket_store.atomic_write_json(ticket_store.journal_path(tmp_path, "TICKET-002"), {
+        "ticket_id": "TICKET-002", "from": "tickets/open/TICKET-002.json", "to": "tickets/in_progress/TICKET-002.json"})
+    (progress_dir / ".TICKET-002.json.123.tmp").write_text('{"tick', encoding="utf-8")
+
+    kinds = {p for p, _, _ in ticket_store.check(tmp_path)}
+    assert {"pending_move", "temp_file", "duplicate"} <= kinds
+
+    actions = [a for a, _ in ticket_store.recover(tmp_path)]
+    assert sorted(actions) == ["removed_temp", "rolled_back", "rolled_forward"]
+    assert update_ticket.find_ticket(tmp_path, "TICKET-001")[0] == "in_progress"
+    assert update_ticket.find_ticket(tmp_path, "TICKET-002")[0] == "open"
+    assert ticket_store.check(tmp_path) == []
+
+
+def test_check_flags_truncated_ticket(tmp_path):
+    import ticket_store
+
+    _make_tickets(tmp_path, 2)
+    (tmp_path / "tickets" / "open" / "TICKET-002.json").write_text('{"ticket_id": "TICK', encoding="utf-8")
+    assert ticket_store.check(tmp_path) == [("partial", "TICKET-002", "tickets/open/TICKET-002.json")]
+
+
+def test_concurrent_comments_are_not_lost(tmp_path):
+    import subprocess
+
+    _make_tickets(tmp_path, 1)
+    repo = Path(__file__).resolve().parents[1]
+    script = (
+        "import sys; from pathlib import Path; sys.path.insert(0, sys.argv[1]); import update_ticket\n"
+        "for i in range(15): update_ticket.add_comment(Path(sys.argv[2]), 'TICKET-001', f'{sys.argv[3]}-{i}')\n"
+    )
+    procs = [subprocess.Popen([sys.executable, "-c", script, str(repo), str(tmp_path), str(w)]) for w in range(4)]
+    assert all(p.wait() == 0 for p in procs)
+
+    ticket = update_ticket.load_ticket(update_ticket.find_ticket(tmp_path, "TICKET-001")[1])
+    assert len(ticket["comments"]) == 60
+
+
+def test_lock_wait_is_recorded(tmp_path):
+    import threading
+    import time
+    import ticket_store
+
+    ticket_store.LOCK_STATS.clear()
+    held = threading.Event()
+
+    def holder():
+        with ticket_store.ticket_lock(tmp_path, "TICKET-001"):
+            held.set()
+            time.sleep(0.1)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    held.wait()
+    with ticket_store.ticket_lock(tmp_path, "TICKET-001"):
+        pass
+    t.join()
+    assert ticket_store.LOCK_STATS["contended"] == 1
+    assert ticket_store.LOCK_STATS["max_wait_ms"] >= 50
+
+
+def test_upsert_is_idempotent_and_counts_recurrences(tmp_path):
+    _make_tickets(tmp_path, 2)
+    row = dict(_poam(weakness="PRIV-001 - User added to Administrators group"), fingerprint="fp-a",
+               occurrence_id="occ-1")
+
+    assert ticketing.upsert_ticket(tmp_path, row) == ("created", "TICKET-003")
+    assert ticketing.upsert_ticket(tmp_path, row) == ("unchanged", "TICKET-003")
+    update_ticket.move_ticket(tmp_path, "TICKET-003", "in_progress")
+    assert ticketing.upsert_ticket(tmp_path, dict(row, occurrence_id="occ-2")) == ("updated", "TICKET-003")
+    assert ticketing.upsert_ticket(tmp_path, dict(row, fingerprint="fp-b")) == ("created", "TICKET-004")
+
+    status, path = update_ticket.find_ticket(tmp_path, "TICKET-003")
+    ticket = update_ticket.load_ticket(path)
+    assert (status, ticket["occurrences"], ticket["fingerprint"]) == ("in_progress", 2, "fp-a")
+
+    # the fingerprint index is recovered from the ticket files
+    idx = ticket_index.open_index(tmp_path)
+    idx.rebuild()
+    assert idx.ticket_for("fp-a") == "TICKET-003"
+
+
+def test_legacy_tickets_are_adopted_not_duplicated(tmp_path):
+    repo = Path(__file__).resolve().parents[1]
+    shutil.copytree(repo / "tickets", tmp_path / "tickets")
+    findings = list(iter_findings(repo / "data" / "processed" / "findings.jsonl"))
+    rows = list(poam_export.poam_rows(findings, template_catalog()))
+
+    assert ticketing.upsert_all(tmp_path, rows) == {"linked": 5}
+    assert ticketing.upsert_all(tmp_path, rows) == {"unchanged": 5}
+    assert sorted(p.stem for p in (tmp_path / "tickets").glob("*/TICKET-*.json")) == \
+        [f"TICKET-{i:03d}" for i in range(1, 6)]
+
+    status, path = update_ticket.find_ticket(tmp_path, "TICKET-001")
+    ticket = update_ticket.load_ticket(path)
+    assert status == "in_progress" and len(ticket["comments"]) == 2
+    assert ticket["fingerprint"] == findings[0]["fingerprint"]
+
+    # the links survive an index rebuild, and a new weakness still gets a ticket
+    idx = ticket_index.open_index(tmp_path)
+    idx.rebuild()
+    assert idx.ticket_for(findings[0]["fingerprint"]) == "TICKET-001"
+    assert ticketing.upsert_ticket(tmp_path, dict(rows[0], fingerprint="fp-new")) == ("created", "TICKET-006")
+
+
+def test_legacy_adoption_checks_status_entity_and_time(tmp_path):
+    ticketing.ensure_dirs(tmp_path)
+    for tid, status, entity in (("TICKET-1000", "open", None), ("TICKET-999", "open", None),
+                                ("TICKET-998", "closed", None), ("TICKET-997", "open", "host=DC01")):
+        ticket = ticketing.create_ticket(_poam(), tid)
+        if entity is None:
+            del ticket["entity"]  # written before entities were recorded
+        else:
+            ticket["entity"] = entity
+        ticketing.write_ticket(tmp_path, status, ticket)
+
+    def row(n, entity, first_seen="2026-02-05T16:20:44Z"):
+        return dict(_poam(), fingerprint=f"fp-{n}", occurrence_id=f"occ-{n}", entity=entity, first_seen=first_seen)
+
+    # numeric order, and TICKET-997 names another host
+    assert ticketing.upsert_ticket(tmp_path, row(1, "host=WS01")) == ("linked", "TICKET-999")
+    # first seen after the legacy tickets were opened: not what they were opened for
+    assert ticketing.upsert_ticket(tmp_path, row(2, "host=WS02", "2999-01-01T00:00:00Z")) == ("created", "TICKET-1001")
+    assert ticketing.upsert_ticket(tmp_path, row(3, "host=DC01")) == ("linked", "TICKET-997")
+    # the closed TICKET-998 is never reopened this way
+    assert ticketing.upsert_ticket(tmp_path, row(4, "host=WS03")) == ("linked", "TICKET-1000")
+    assert ticketing.upsert_ticket(tmp_path, row(5, "host=WS04")) == ("created", "TICKET-1002")
@@ -0,0 +1,31 @@
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import timestamps
+
+
+def test_supported_formats_agree():
+    expected = 1770300731000
+    assert timestamps.to_epoch_ms("2026-02-05T14:12:11Z") == expected
+    assert timestamps.to_epoch_ms("2026-02-05T09:12:11-05:00") == expected
+    assert timestamps.to_epoch_ms("/Date(1770300731000)/") == expected
+    assert timestamps.to_epoch_ms("\\/Date(1770300731000)\\/") == expected
+    assert timestamps.to_epoch_ms("2026-02-05T14:12:11.250Z") == expected + 250
+
+
+def test_failures_are_counted():
+    timestamps.reset_stats()
+    assert timestamps.to_epoch_ms("not a time") is None
+    assert timestamps.to_epoch_ms("2026-13-45T99:00:00Z") is None
+    assert timestamps.to_epoch_ms("2026-02-31T00:00:00Z") is None
+    assert timestamps.to_epoch_ms("2026-02-31T00:00:00+00:00") is None
+    assert timestamps.to_epoch_ms("") is None
+    assert timestamps.failures() == 4
+    assert timestamps.PARSE_STATS["empty"] == 1
+
+
+def test_format_ms_round_trip():
+    for text in ("2026-02-05T14:12:11Z", "2026-02-08T01:58:53.766Z"):
+        assert timestamps.format_ms(timestamps.to_epoch_ms(text)) == text
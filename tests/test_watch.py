@@ -0,0 +1,77 @@
+from pathlib import Path
+import asyncio
+import json
+import shutil
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import detect
+import watch
+
+AUDIT_CLEARED = ('{"source": "synthetic", "host": "LAB", "timestamp": "2026-02-06T10:00:00Z", "event_id": 1102,'
+                 ' "user": "eve", "message": "The audit log was cleared."}\n')
+
+
+def test_watch_follows_appends_and_new_files(tmp_path):
+    repo = Path(__file__).resolve().parents[1]
+    shutil.copytree(repo / "data" / "raw", tmp_path / "data" / "raw")
+    raw = tmp_path / "data" / "raw"
+
+    assert asyncio.run(watch.Watcher(tmp_path, once=True).run())["tickets_created"] == 5
+
+    async def live():
+        w = watch.Watcher(tmp_path, interval=0.05)
+        task = asyncio.create_task(w.run())
+        await asyncio.sleep(0.2)
+        with (raw / "synthetic_logs.jsonl").open("a", encoding="utf-8") as f:
+            f.write(AUDIT_CLEARED)
+        # a new export whose last line is still being written
+        (raw / "dropped.jsonl").write_text(AUDIT_CLEARED.replace('"eve"', '"mallory"') + AUDIT_CLEARED[:40],
+                                           encoding="utf-8")
+        for _ in range(100):
+            if w.stats["events"] == 2:
+                break
+            await asyncio.sleep(0.05)
+        w.stop.set()
+        return await task
+
+    stats = asyncio.run(live())
+    # both 1102s are new findings; they share the host fingerprint, so one
+    # new ticket and one recurrence
+    assert stats == {"events": 2, "findings": 2, "tickets_created": 1, "tickets_updated": 1}
+    assert len(list((tmp_path / "tickets" / "open").glob("TICKET-*.json"))) == 6
+
+    # the partial line is picked up once it is complete, and nothing is read twice
+    with (raw / "dropped.jsonl").open("a", encoding="utf-8") as f:
+        f.write(AUDIT_CLEARED[40:])
+    assert asyncio.run(watch.Watcher(tmp_path, once=True).run())["events"] == 1
+
+    # closed findings were appended, open ones taken back out on each start
+    keys = [detect.finding_key(f) for f in detect.iter_findings(tmp_path / "data" / "processed" / "findings.jsonl")]
+    assert len(keys) == len(set(keys)) == 8
+
+
+def test_export_is_read_once_complete(tmp_path):
+    export = tmp_path / "export.json"
+
+    def records(*minutes):
+        # newest first, as Get-WinEvent writes them
+        return [{"MachineName": "LAB", "TimeCreated": f"2026-02-06T10:0{m}:00Z", "Id": 1102, "Message": f"m{m}"}
+                for m in sorted(minutes, reverse=True)]
+
+    body = json.dumps(records(1, 2, 3))
+    # still being written: nothing is queued and the cursor is kept
+    export.write_text(body[:-30], encoding="utf-8")
+    cursor = {}
+    assert list(watch.read_changes(export, cursor)) == [] and cursor == {}
+
+    export.write_text(body, encoding="utf-8")
+    got = list(watch.read_changes(export, cursor))
+    assert [e["message"] for e, _ in got] == ["m3", "m2", "m1"]
+    assert [cp is None for _, cp in got] == [True, True, False] and got[-1][1] == cursor
+
+    # a re-export with a newer event on top yields just that event
+    export.write_text(json.dumps(records(1, 2, 3, 4)), encoding="utf-8")
+    assert [e["message"] for e, _ in watch.read_changes(export, cursor)] == ["m4"]
+    assert list(watch.read_changes(export, cursor)) == []
@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+# SQLite index of the tickets/ tree: ticket_id -> status folder, path and the
+# fields the dashboard reports on, so lookups and rollups never have to probe
+# folders or parse ticket JSON. Every ticket write goes through put() right
+# after the file is written; each put() commits on its own unless it runs
+# inside a batch(). File size and mtime are recorded so verify() can spot
+# out-of-band edits with a directory listing and stat() alone.
+#
+# Each put()/delete() also appends to the changes table, in the same
+# transaction, the ticket's previously indexed fields, so consumers such as
+# the dashboard can apply deltas instead of rescanning. rebuild() bumps
+# meta.epoch instead of logging every ticket; consumers that see a new epoch
+# start over. The index is a cache: a file from another schema version is
+# dropped and rebuilt.
+#
+# fingerprints maps a finding fingerprint to the ticket that tracks it and
+# occurrences records every occurrence_id already counted, so ticketing can
+# upsert findings with two primary-key lookups. Tickets from before
+# fingerprints (no fingerprint field) are never in fingerprints;
+# legacy_tickets() lists the open ones by weakness and controls so ticketing
+# can adopt them instead of opening duplicates.
+
+STATUS_DIRS = ["open", "in_progress", "awaiting_validation", "closed"]
+INDEX_FILE = ".index.sqlite"
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    status_dir TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT,
+    severity TEXT,
+    due_date TEXT,
+    controls TEXT,
+    weakness TEXT,
+    last_updated TEXT,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS tickets_status_dir ON tickets (status_dir);
+CREATE INDEX IF NOT EXISTS tickets_due_date ON tickets (due_date);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id TEXT NOT NULL,
+    old TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    ticket_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    occurrence_id TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+"""
+FIELDS = ["ticket_id", "status_dir", "path", "status", "severity", "due_date", "controls", "weakness",
+          "last_updated", "size", "mtime_ns"]
+# Fields recorded in the change log
+LOGGED = ["status_dir", "status", "severity", "due_date", "controls"]
+
+def index_path(root: Path):
+    return root / "tickets" / INDEX_FILE
+
+class TicketIndex:
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        path = index_path(self.root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not path.exists()
+        # open_index() shares one connection per process; callers such as the
+        # pipeline runner use it from worker threads, one stage at a time
+        self.conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        if not fresh and self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ("tickets", "changes", "meta", "fingerprints", "occurrences"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            fresh = True
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.depth = 0
+        self.logging = True
+        if fresh:
+            self.rebuild()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @contextmanager
+    def batch(self):
+        # One transaction for many put()/delete() calls
+        self.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.rollback()
+            raise
+        self.depth -= 1
+        if self.depth == 0:
+            self.conn.commit()
+
+    def _commit(self):
+        if self.depth == 0:
+            self.conn.commit()
+
+    def _row(self, status, path: Path, ticket):
+        st = path.stat()
+        return (
+            ticket["ticket_id"],
+            status,
+            path.resolve().relative_to(self.root).as_posix(),
+            ticket.get("status"),
+            ticket.get("severity"),
+            ticket.get("due_date"),
+            str(ticket.get("nist_controls", "")),
+            ticket.get("weakness"),
+            ticket.get("last_updated") or ticket.get("created_date"),
+            st.st_size,
+            st.st_mtime_ns,
+        )
+
+    def _log(self, ticket_id):
+        if not self.logging:
+            return
+        old = self.get(ticket_id)
+        if old is not None:
+            old = json.dumps({k: old[k] for k in LOGGED})
+        self.conn.execute("INSERT INTO changes (ticket_id, old) VALUES (?, ?)", (ticket_id, old))
+
+    def put(self, status, path: Path, ticket):
+        self._log(ticket["ticket_id"])
+        self.conn.execute(f"INSERT OR REPLACE INTO tickets VALUES ({', '.join('?' * len(FIELDS))})",
+                          self._row(status, Path(path), ticket))
+        self._commit()
+
+    def delete(self, ticket_id):
+        self._log(ticket_id)
+        self.conn.execute("DELETE FROM tickets WHERE ticket_id = ?", (ticket_id,))
+        self._commit()
+
+    def ticket_for(self, fingerprint):
+        row = self.conn.execute("SELECT ticket_id FROM fingerprints WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return row[0] if row else None
+
+    def link(self, fingerprint, ticket_id):
+        self.conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?)", (fingerprint, ticket_id))
+        self._commit()
+
+    def legacy_tickets(self, weakness, controls):
+        # Tickets not closed with this weakness and controls that no
+        # fingerprint points at yet, lowest number first
+        cur = self.conn.execute(
+            "SELECT ticket_id FROM tickets WHERE weakness = ? AND controls = ? AND status_dir != 'closed' "
+            "AND ticket_id NOT IN (SELECT ticket_id FROM fingerprints) "
+            "ORDER BY CAST(SUBSTR(ticket_id, 8) AS INTEGER), ticket_id",
+            (weakness, controls))
+        return [row[0] for row in cur]
+
+    def add_occurrence(self, occurrence_id, fingerprint):
+        # False when the occurrence was already recorded
+        cur = self.conn.execute("INSERT OR IGNORE INTO occurrences VALUES (?, ?)", (occurrence_id, fingerprint))
+        self._commit()
+        return cur.rowcount == 1
+
+    def next_ticket_id(self):
+        # Seeded from the highest existing TICKET-nnn; the UPDATE takes the
+        # write lock before the value is read, so concurrent callers never
+        # get the same number
+        with self.batch():
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'ticket_seq', COALESCE(MAX(CAST(SUBSTR(ticket_id, 8) AS INTEGER)), 0) "
+                "FROM tickets WHERE ticket_id LIKE 'TICKET-%'")
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'ticket_seq'")
+            n = int(self.conn.execute("SELECT value FROM meta WHERE key = 'ticket_seq'").fetchone()[0])
+        return f"TICKET-{n:03d}"
+
+    def epoch(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        return row[0] if row else None
+
+    def get(self, ticket_id):
+        cur = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM tickets WHERE ticket_id = ?", (ticket_id,))
+        row = cur.fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def locate(self, ticket_id):
+        row = self.get(ticket_id)
+        if row is None:
+            return None, None
+        return row["status_dir"], self.root / row["path"]
+
+    def rows(self, status_dir=None):
+        sql = f"SELECT {', '.join(FIELDS)} FROM tickets"
+        if status_dir:
+            cur = self.conn.execute(sql + " WHERE status_dir = ?", (status_dir,))
+        else:
+            cur = self.conn.execute(sql)
+        for row in cur:
+            yield dict(zip(FIELDS, row))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def rebuild(self):
+        # Re-reads every ticket file; the only operation that parses them all
+        with self.batch():
+            self.conn.execute("DELETE FROM tickets")
+            self.conn.execute("DELETE FROM changes")
+            self.conn.execute("DELETE FROM fingerprints")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+            self.logging = False
+            try:
+                for status, path in iter_ticket_files(self.root):
+                    try:
+                        ticket = json.loads(path.read_text(encoding="utf-8-sig"))
+                    except ValueError:
+                        continue  # truncated file; verify() reports it as unindexed
+                    ticket.setdefault("ticket_id", path.stem)
+                    self.put(status, path, ticket)
+                    if ticket.get("fingerprint"):
+                        self.link(ticket["fingerprint"], ticket["ticket_id"])
+            finally:
+                self.logging = True
+        return self.count()
+
+    def verify(self):
+        # Returns (problem, ticket_id, detail) tuples. Only directory listings
+        # and stat() are used, so no ticket file is opened.
+        problems = []
+        on_disk = {}
+        for status, path in iter_ticket_files(self.root):
+            tid = path.stem
+            if tid in on_disk:
+                problems.append(("duplicate", tid, f"{on_disk[tid][0]} and {status}"))
+                continue
+            on_disk[tid] = (status, path)
+
+        indexed = {row["ticket_id"]: row for row in self.rows()}
+        for tid, (status, path) in sorted(on_disk.items()):
+            row = indexed.pop(tid, None)
+            if row is None:
+                problems.append(("unindexed", tid, path.relative_to(self.root).as_posix()))
+            elif row["status_dir"] != status:
+                problems.append(("moved", tid, f"index says {row['status_dir']}, file is in {status}"))
+            else:
+                st = path.stat()
+                if (st.st_size, st.st_mtime_ns) != (row["size"], row["mtime_ns"]):
+                    problems.append(("stale", tid, "file changed since it was indexed"))
+        for tid in sorted(indexed):
+            problems.append(("missing", tid, indexed[tid]["path"]))
+        return problems
+
+def iter_ticket_files(root: Path):
+    for status in STATUS_DIRS:
+        folder = root / "tickets" / status
+        if not folder.exists():
+            continue
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    yield status, Path(entry.path)
+
+_OPEN = {}
+
+def open_index(root: Path):
+    # One connection per tickets/ tree for the life of the process
+    root = Path(root).resolve()
+    idx = _OPEN.get(root)
+    if idx is None:
+        idx = _OPEN[root] = TicketIndex(root)
+    return idx
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the SQLite index of tickets/.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--root", default=str(Path(__file__).resolve().parent), help="repo root holding tickets/")
+    args = parser.parse_args(argv)
+
+    idx = open_index(Path(args.root))
+    if args.command == "rebuild":
+        print(f"[OK] Indexed {idx.rebuild()} tickets -> {index_path(idx.root)}")
+        return
+
+    problems = idx.verify()
+    for problem, tid, detail in problems:
+        print(f"[WARN] {problem}: {tid} ({detail})")
+    if problems:
+        print(f"[ERROR] {len(problems)} index problems; run: python ticket_index.py rebuild")
+        raise SystemExit(1)
+    print(f"[OK] Index matches tickets/ ({idx.count()} tickets)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from ticket_index import STATUS_DIRS, iter_ticket_files, open_index
+
+# Crash-safe ticket file operations. Every write goes to a temp file in the
+# target folder, is fsynced and then renamed over the ticket, so a ticket is
+# always either its old or its new content. A move between status folders is
+# journaled first (tickets/.journal/<ticket_id>.json): recover() rolls an
+# interrupted move forward when the new copy is complete, and back otherwise.
+
+JOURNAL_DIR = ".journal"
+TMP_SUFFIX = ".tmp"
+
+# -----------------------
+# Per-ticket locks
+# -----------------------
+# Read-modify-write of a ticket runs under an exclusive advisory lock
+# (flock, or msvcrt.locking on Windows) on one of LOCK_STRIPES lock files in
+# tickets/.locks, picked by hashing the ticket ID. Updates to different
+# tickets rarely share a stripe, so writers do not queue behind one global
+# lock, and the number of lock files stays fixed. Locks are re-entrant
+# within a thread. LOCK_STATS counts acquisitions, contended acquisitions
+# and the total/max time spent waiting. Other kinds of keys (fingerprints)
+# get their own set of lock files via `namespace`; such locks are always
+# taken before, never while holding, a ticket lock.
+LOCK_DIR = ".locks"
+LOCK_STRIPES = 256
+LOCK_TIMEOUT = 30.0
+
+LOCK_STATS = Counter()
+_held = threading.local()
+
+def _try_lock(fd):
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def ticket_lock(root: Path, ticket_id, timeout=None, namespace="ticket"):
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    stripe = f"{namespace}-{zlib.crc32(ticket_id.encode('utf-8')) % LOCK_STRIPES:03d}"
+    held = _held.__dict__.setdefault("stripes", {})
+    if stripe in held:
+        held[stripe] += 1
+        try:
+            yield
+        finally:
+            held[stripe] -= 1
+        return
+
+    lock_dir = root / "tickets" / LOCK_DIR
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(lock_dir / f"{stripe}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        t0 = time.perf_counter()
+        delay = 0.001
+        contended = False
+        while not _try_lock(fd):
+            contended = True
+            if time.perf_counter() - t0 > timeout:
+                raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for the lock on {ticket_id}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        waited_ms = (time.perf_counter() - t0) * 1000
+        LOCK_STATS["acquired"] += 1
+        if contended:
+            LOCK_STATS["contended"] += 1
+            LOCK_STATS["wait_ms"] += waited_ms
+            LOCK_STATS["max_wait_ms"] = max(LOCK_STATS["max_wait_ms"], waited_ms)
+
+        held[stripe] = 1
+        try:
+            yield
+        finally:
+            del held[stripe]
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+def lock_report(stats=None):
+    stats = LOCK_STATS if stats is None else stats
+    return (f"acquired={stats['acquired']} contended={stats['contended']} "
+            f"wait_ms={stats['wait_ms']:.1f} max_wait_ms={stats['max_wait_ms']:.1f}")
+
+def fsync_dir(folder: Path):
+    # Makes a rename/unlink durable; directories cannot be opened on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(str(folder), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_json(path: Path, obj):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}{TMP_SUFFIX}")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(obj, indent=2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+def journal_path(root: Path, ticket_id):
+    return root / "tickets" / JOURNAL_DIR / f"{ticket_id}.json"
+
+def move_ticket_file(root: Path, ticket: dict, old_path: Path, new_path: Path):
+    # journal -> write new copy -> unlink old copy -> drop journal
+    journal = journal_path(root, ticket["ticket_id"])
+    journal.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(journal, {
+        "ticket_id": ticket["ticket_id"],
+        "from": old_path.relative_to(root).as_posix(),
+        "to": new_path.relative_to(root).as_posix(),
+    })
+    atomic_write_json(new_path, ticket)
+    old_path.unlink()
+    fsync_dir(old_path.parent)
+    journal.unlink()
+
+def read_json(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8-sig"))
+    except (OSError, ValueError):
+        return None
+
+def temp_owner(tmp: Path):
+    # ".TICKET-001.json.<pid>.tmp" -> "TICKET-001"
+    return tmp.name[1:].split(".json.")[0]
+
+def recover(root: Path):
+    # Finishes or undoes interrupted moves and removes stray temp files.
+    # Each ticket is handled under its lock, so a move or write another
+    # process is still performing is waited for, not mistaken for a crash.
+    # Returns a list of (action, detail) for what was done.
+    actions = []
+    idx = open_index(root)
+    journal_dir = root / "tickets" / JOURNAL_DIR
+    if journal_dir.exists():
+        for entry in sorted(journal_dir.glob("*.json")):
+            with ticket_lock(root, entry.stem):
+                if not entry.exists():
+                    continue  # the move finished while we waited
+                record = read_json(entry)
+                if record is None:
+                    # Journal write itself was interrupted, so nothing was moved yet
+                    entry.unlink()
+                    actions.append(("discarded", entry.name))
+                    continue
+                src, dst = root / record["from"], root / record["to"]
+                ticket = read_json(dst) if dst.exists() else None
+                if ticket is not None:
+                    if src.exists():
+                        src.unlink()
+                        fsync_dir(src.parent)
+                    idx.put(dst.parent.name, dst, ticket)
+                    actions.append(("rolled_forward", f"{record['ticket_id']} -> {record['to']}"))
+                else:
+                    if dst.exists():
+                        dst.unlink()
+                    src_ticket = read_json(src)
+                    if src_ticket is not None:
+                        idx.put(src.parent.name, src, src_ticket)
+                    actions.append(("rolled_back", f"{record['ticket_id']} stays in {record['from']}"))
+                entry.unlink()
+
+    for folder in [journal_dir] + [root / "tickets" / s for s in STATUS_DIRS]:
+        if folder.exists():
+            for tmp in folder.glob(f".*{TMP_SUFFIX}"):
+                with ticket_lock(root, temp_owner(tmp)):
+                    if tmp.exists():
+                        tmp.unlink()
+                        actions.append(("removed_temp", tmp.relative_to(root).as_posix()))
+    return actions
+
+def check(root: Path):
+    # Consistency check from directory listings and the index's recorded
+    # size/mtime: only files the index cannot vouch for are parsed.
+    problems = []
+    journal_dir = root / "tickets" / JOURNAL_DIR
+    if journal_dir.exists():
+        for entry in sorted(journal_dir.glob("*.json")):
+            problems.append(("pending_move", entry.stem, "run: python ticket_store.py recover"))
+    for folder in [root / "tickets" / s for s in STATUS_DIRS]:
+        if folder.exists():
+            for tmp in sorted(folder.glob(f".*{TMP_SUFFIX}")):
+                problems.append(("temp_file", tmp.name, folder.name))
+
+    paths = {path.stem: path for _, path in iter_ticket_files(root)}
+    for problem, ticket_id, detail in open_index(root).verify():
+        if problem in ("unindexed", "stale", "moved") and ticket_id in paths:
+            path = paths[ticket_id]
+            if path.stat().st_size == 0 or read_json(path) is None:
+                problems.append(("partial", ticket_id, path.relative_to(root).as_posix()))
+                continue
+        problems.append((problem, ticket_id, detail))
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or repair the tickets/ tree after a crash.")
+    parser.add_argument("command", choices=["check", "recover"])
+    parser.add_argument("--root", default=str(Path(__file__).resolve().parent), help="repo root holding tickets/")
+    args = parser.parse_args(argv)
+    root = Path(args.root)
+
+    if args.command == "recover":
+        actions = recover(root)
+        for action, detail in actions:
+            print(f"[OK] {action}: {detail}")
+        print(f"[INFO] Recovery complete ({len(actions)} actions)")
+        return
+
+    problems = check(root)
+    for problem, ticket_id, detail in problems:
+        print(f"[WARN] {problem}: {ticket_id} ({detail})")
+    if problems:
+        print(f"[ERROR] {len(problems)} problems found")
+        raise SystemExit(1)
+    print("[OK] tickets/ is consistent")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
+import argparse
+import hashlib
 import json
 from pathlib import Path
 from datetime import datetime, timedelta
 import csv
+from collections import Counter
+
+import metrics
+import timestamps
+from ticket_index import open_index
+from ticket_store import atomic_write_json, read_json, ticket_lock
 
 STATUS_DIRS = ["open", "in_progress", "awaiting_validation", "closed"]
 
@@ -38,29 +46,133 @@ def create_ticket(poam_row, ticket_id, owner="Cyber Ops"):
         "nist_controls": poam_row["nist_800_53_controls"],
         "risk_statement": poam_row["risk_statement"],
         "recommended_actions": poam_row["recommended_actions"],
+        "entity": poam_row.get("entity", ""),
         "evidence": [],
         "comments": [],
     }
 
+def row_fingerprint(poam_row):
+    # POA&M files written before fingerprints existed: hash the row content
+    if poam_row.get("fingerprint"):
+        return poam_row["fingerprint"]
+    content = {k: v for k, v in poam_row.items() if k not in ("poam_id", "date_identified")}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
 def write_ticket(root: Path, status: str, ticket: dict):
     path = root / "tickets" / status / f"{ticket['ticket_id']}.json"
-    path.write_text(json.dumps(ticket, indent=2), encoding="utf-8")
+    with ticket_lock(root, ticket["ticket_id"]):
+        atomic_write_json(path, ticket)
+        open_index(root).put(status, path, ticket)
     return path
 
-def main():
-    root = Path(__file__).resolve().parent
+def legacy_match(ticket, poam_row):
+    # A ticket that names its entity must name this finding's. One from
+    # before entities were recorded can only have been opened for a finding
+    # already seen when it was created (created_date is local time, read as
+    # UTC), so later findings, e.g. for another user or host, get their own.
+    if ticket.get("entity"):
+        return ticket["entity"] == poam_row.get("entity")
+    scratch = Counter()
+    seen = timestamps.to_epoch_ms(poam_row.get("first_seen"), stats=scratch)
+    created = timestamps.to_epoch_ms(ticket.get("created_date"), stats=scratch)
+    return seen is not None and created is not None and seen <= created
+
+def adopt_legacy_ticket(root: Path, idx, poam_row, fp, occurrence, now):
+    # Tickets written before fingerprints carry none, so their findings would
+    # look new and be ticketed again. The first fingerprint whose POA&M row
+    # has the same weakness and controls and passes legacy_match() takes an
+    # open ticket over: the fingerprint is stored in the ticket file (so
+    # rebuild() keeps the link) and this occurrence is the one the ticket was
+    # opened for.
+    for ticket_id in idx.legacy_tickets(poam_row["weakness_or_deficiency"], str(poam_row["nist_800_53_controls"])):
+        with ticket_lock(root, ticket_id):
+            status, path = idx.locate(ticket_id)
+            ticket = read_json(path) if path is not None and path.exists() else None
+            if ticket is None:
+                continue
+            if ticket.get("fingerprint"):
+                idx.link(ticket["fingerprint"], ticket_id)  # another process adopted it first
+                continue
+            if status == "closed" or not legacy_match(ticket, poam_row):
+                continue
+            ticket.update({"fingerprint": fp, "occurrences": ticket.get("occurrences", 1), "last_seen": now})
+            if poam_row.get("entity"):
+                ticket.setdefault("entity", poam_row["entity"])
+            atomic_write_json(path, ticket)
+            idx.put(status, path, ticket)
+            idx.link(fp, ticket_id)
+            idx.add_occurrence(occurrence, fp)
+            return ticket_id
+    return None
+
+def upsert_ticket(root: Path, poam_row, owner="Cyber Ops"):
+    # New fingerprint -> a legacy ticket for the same weakness if there is
+    # one ("linked"), else a new ticket in open/. Known fingerprint -> the
+    # existing ticket (in whatever status) gets its occurrence count and
+    # last_seen bumped, once per occurrence_id. Returns (action, ticket_id).
+    idx = open_index(root)
+    fp = row_fingerprint(poam_row)
+    occurrence = poam_row.get("occurrence_id") or fp
+    now = datetime.now().isoformat(timespec="seconds")
+
+    with ticket_lock(root, fp, namespace="fingerprint"):
+        ticket_id = idx.ticket_for(fp)
+        if ticket_id is None:
+            ticket_id = adopt_legacy_ticket(root, idx, poam_row, fp, occurrence, now)
+            if ticket_id is not None:
+                return "linked", ticket_id
+            ticket_id = idx.next_ticket_id()
+            ticket = create_ticket(poam_row, ticket_id, owner)
+            ticket.update({"fingerprint": fp, "occurrences": 1, "last_seen": now})
+            write_ticket(root, "open", ticket)
+            idx.link(fp, ticket_id)
+            idx.add_occurrence(occurrence, fp)
+            return "created", ticket_id
+
+    with ticket_lock(root, ticket_id):
+        if not idx.add_occurrence(occurrence, fp):
+            return "unchanged", ticket_id
+        status, path = idx.locate(ticket_id)
+        ticket = read_json(path) if path is not None and path.exists() else None
+        if ticket is None:
+            return "missing", ticket_id
+        ticket["occurrences"] = ticket.get("occurrences", 1) + 1
+        ticket["last_seen"] = now
+        atomic_write_json(path, ticket)
+        idx.put(status, path, ticket)
+        return "updated", ticket_id
+
+def upsert_all(root: Path, poam_rows, owner="Cyber Ops"):
     ensure_dirs(root)
+    counts = {}
+    for row in poam_rows:
+        action, ticket_id = upsert_ticket(root, row, owner)
+        counts[action] = counts.get(action, 0) + 1
+        if action == "created":
+            print(f"[OK] Created ticket: {ticket_id}")
+        elif action == "updated":
+            print(f"[OK] Recurring finding -> {ticket_id}")
+        elif action == "linked":
+            print(f"[OK] Existing ticket {ticket_id} now tracks this finding")
+        elif action == "missing":
+            print(f"[WARN] {ticket_id} is indexed but its file is missing; run: python ticket_store.py check")
 
-    poam_path = root / "data" / "processed" / "poam.csv"
-    poam_rows = load_poam(poam_path)
+    print(f"[INFO] Tickets: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    metrics.note(rows=sum(counts.values()), **{f"tickets_{k}": v for k, v in counts.items()})
+    return counts
 
-    print(f"[INFO] Loaded POA&M rows: {len(poam_rows)}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or update tickets from poam.csv.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    processed_dir = root / "data" / "processed"
 
-    for i, row in enumerate(poam_rows, start=1):
-        ticket_id = f"TICKET-{i:03d}"
-        ticket = create_ticket(row, ticket_id)
-        path = write_ticket(root, "open", ticket)
-        print(f"[OK] Created ticket: {path}")
+    with metrics.profiled("ticketing", args, processed_dir):
+        poam_rows = load_poam(processed_dir / "poam.csv")
+        print(f"[INFO] Loaded POA&M rows: {len(poam_rows)}")
+        upsert_all(root, poam_rows)
 
 if __name__ == "__main__":
     main()
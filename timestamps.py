@@ -0,0 +1,98 @@
+import calendar
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Timestamp normalization: every supported input shape is converted to
+# integer epoch milliseconds (UTC) once, at ingest.
+#   - ISO-8601 with Z            2026-02-05T14:12:11Z / 2026-02-05T14:12:11.123Z
+#   - ISO-8601 with an offset    2026-02-05T09:12:11-05:00
+#   - MS JSON date (ConvertTo-Json)  /Date(1770515933766)/ or \/Date(...)\/
+# Naive ISO values are taken as UTC. Unparseable values return None and are
+# counted in PARSE_STATS rather than silently dropped.
+
+MS_DATE = re.compile(r"^\\?/Date\((-?\d+)(?:[+-]\d{4})?\)\\?/$")
+
+PARSE_STATS = Counter()
+
+def reset_stats():
+    PARSE_STATS.clear()
+
+def failures():
+    return PARSE_STATS["failed"]
+
+@lru_cache(maxsize=65536)
+def _iso_seconds_ms(prefix):
+    # prefix is the fixed-width "YYYY-MM-DDTHH:MM:SS" part; logs repeat the
+    # same second many times, so this is cached.
+    fields = (int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+              int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19]))
+    y, mo, d, h, mi, s = fields
+    # timegm would roll an impossible day (Feb 31) into the next month
+    if not (1 <= mo <= 12 and 1 <= d <= calendar.monthrange(y, mo)[1] and h < 24 and mi < 60 and s < 60):
+        raise ValueError(prefix)
+    return calendar.timegm(fields) * 1000
+
+def _fast_iso(ts):
+    n = len(ts)
+    if ts[-1] != "Z" or ts[4] != "-" or ts[7] != "-" or ts[10] != "T" or ts[13] != ":" or ts[16] != ":":
+        return None
+    if n == 20:
+        return _iso_seconds_ms(ts[:19])
+    if n > 21 and ts[19] == ".":
+        frac = ts[20:-1]
+        if frac.isdigit():
+            return _iso_seconds_ms(ts[:19]) + int(frac[:3].ljust(3, "0"))
+    return None
+
+def to_epoch_ms(ts, stats=None):
+    # stats: the Counter to tally into (default PARSE_STATS)
+    stats = PARSE_STATS if stats is None else stats
+    if ts is None or ts == "":
+        stats["empty"] += 1
+        return None
+    ts = str(ts).strip()
+
+    if len(ts) >= 20:
+        try:
+            ms = _fast_iso(ts)
+        except ValueError:
+            ms = None
+        if ms is not None:
+            stats["iso_fast"] += 1
+            return ms
+
+    if "Date(" in ts:
+        m = MS_DATE.match(ts)
+        if m:
+            stats["ms_date"] += 1
+            return int(m.group(1))
+
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        stats["failed"] += 1
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    stats["iso"] += 1
+    return int(dt.timestamp() * 1000)
+
+def to_datetime(ms):
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+def format_ms(ms):
+    # ISO-8601 UTC with Z; milliseconds only when present
+    dt = to_datetime(ms)
+    if ms % 1000:
+        return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ms % 1000:03d}Z"
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def report(stats=None):
+    stats = PARSE_STATS if stats is None else stats
+    parsed = stats["iso_fast"] + stats["iso"] + stats["ms_date"]
+    return (f"parsed={parsed} (iso_fast={stats['iso_fast']}, iso={stats['iso']}, "
+            f"ms_date={stats['ms_date']}) empty={stats['empty']} failed={stats['failed']}")
@@ -1,7 +1,12 @@
+import csv
 import json
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 
+from ticket_index import open_index
+from ticket_store import LOCK_STATS, atomic_write_json, lock_report, move_ticket_file, recover, ticket_lock
+
 STATUS_DIRS = ["open", "in_progress", "awaiting_validation", "closed"]
 
 ALLOWED_TRANSITIONS = {
@@ -12,78 +17,197 @@ ALLOWED_TRANSITIONS = {
 }
 
 def find_ticket(root: Path, ticket_id: str):
+    idx = open_index(root)
+    status, path = idx.locate(ticket_id)
+    if path is not None and path.exists():
+        return status, path
+
+    # Not indexed, or moved behind the index's back: probe and repair
     for status in STATUS_DIRS:
-        path = root / "tickets" / status / f"{ticket_id}.json"
-        if path.exists():
-            return status, path
+        found = root / "tickets" / status / f"{ticket_id}.json"
+        if found.exists():
+            idx.put(status, found, load_ticket(found))
+            return status, found
+    if path is not None:
+        idx.delete(ticket_id)
     return None, None
 
 def load_ticket(path: Path):
     return json.loads(path.read_text(encoding="utf-8-sig"))
 
 def save_ticket(path: Path, ticket: dict):
-    path.write_text(json.dumps(ticket, indent=2), encoding="utf-8")
+    atomic_write_json(path, ticket)
 
 def move_ticket(root: Path, ticket_id: str, new_status: str):
     if new_status not in STATUS_DIRS:
         raise ValueError(f"Invalid status: {new_status}")
 
-    old_status, old_path = find_ticket(root, ticket_id)
-    if not old_path:
-        raise FileNotFoundError(f"Ticket not found: {ticket_id}")
+    with ticket_lock(root, ticket_id):
+        old_status, old_path = find_ticket(root, ticket_id)
+        if not old_path:
+            raise FileNotFoundError(f"Ticket not found: {ticket_id}")
 
-    allowed = ALLOWED_TRANSITIONS.get(old_status, [])
-    if new_status not in allowed:
-        raise ValueError(f"Transition not allowed: {old_status} -> {new_status}")
+        allowed = ALLOWED_TRANSITIONS.get(old_status, [])
+        if new_status not in allowed:
+            raise ValueError(f"Transition not allowed: {old_status} -> {new_status}")
 
-    ticket = load_ticket(old_path)
-    ticket["status"] = new_status
-    ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
+        ticket = load_ticket(old_path)
+        ticket["status"] = new_status
+        ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
 
-    new_path = root / "tickets" / new_status / f"{ticket_id}.json"
-    save_ticket(new_path, ticket)
-
-    old_path.unlink()
-    return old_status, new_status, new_path
+        new_path = root / "tickets" / new_status / f"{ticket_id}.json"
+        move_ticket_file(root, ticket, old_path, new_path)
+        open_index(root).put(new_status, new_path, ticket)
+        return old_status, new_status, new_path
 
 def add_comment(root: Path, ticket_id: str, comment: str):
-    status, path = find_ticket(root, ticket_id)
-    if not path:
-        raise FileNotFoundError(f"Ticket not found: {ticket_id}")
-    ticket = load_ticket(path)
+    with ticket_lock(root, ticket_id):
+        status, path = find_ticket(root, ticket_id)
+        if not path:
+            raise FileNotFoundError(f"Ticket not found: {ticket_id}")
+        ticket = load_ticket(path)
 
-    ticket.setdefault("comments", [])
-    ticket["comments"].append({
-        "timestamp": datetime.now().isoformat(timespec="seconds"),
-        "comment": comment
-    })
-    ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
+        ticket.setdefault("comments", [])
+        ticket["comments"].append({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "comment": comment
+        })
+        ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
 
-    save_ticket(path, ticket)
-    return status, path
+        save_ticket(path, ticket)
+        open_index(root).put(status, path, ticket)
+        return status, path
 
 def add_evidence(root: Path, ticket_id: str, evidence_item: str):
-    status, path = find_ticket(root, ticket_id)
-    if not path:
-        raise FileNotFoundError(f"Ticket not found: {ticket_id}")
-    ticket = load_ticket(path)
+    with ticket_lock(root, ticket_id):
+        status, path = find_ticket(root, ticket_id)
+        if not path:
+            raise FileNotFoundError(f"Ticket not found: {ticket_id}")
+        ticket = load_ticket(path)
 
-    ticket.setdefault("evidence", [])
-    ticket["evidence"].append({
-        "timestamp": datetime.now().isoformat(timespec="seconds"),
-        "evidence": evidence_item
-    })
-    ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
+        ticket.setdefault("evidence", [])
+        ticket["evidence"].append({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "evidence": evidence_item
+        })
+        ticket["last_updated"] = datetime.now().isoformat(timespec="seconds")
 
-    save_ticket(path, ticket)
-    return status, path
+        save_ticket(path, ticket)
+        open_index(root).put(status, path, ticket)
+        return status, path
 
 def close_ticket(root: Path, ticket_id: str, justification: str):
-    # Add justification and move to closed
-    add_comment(root, ticket_id, f"CLOSURE JUSTIFICATION: {justification}")
-    old_status, new_status, new_path = move_ticket(root, ticket_id, "closed")
+    # Add justification and move to closed, as one locked update
+    with ticket_lock(root, ticket_id):
+        add_comment(root, ticket_id, f"CLOSURE JUSTIFICATION: {justification}")
+        old_status, new_status, new_path = move_ticket(root, ticket_id, "closed")
     return old_status, new_status, new_path
 
+# -----------------------
+# Batch operations
+# -----------------------
+# A batch file lists one operation per JSONL line or CSV row:
+#   {"op": "move", "ticket_id": "TICKET-001", "value": "in_progress"}
+#   op,ticket_id,value
+# Operations are grouped by ticket and every ticket's sequence of
+# transitions is validated before anything is written. A ticket whose
+# operations do not all validate is left untouched; the others are loaded
+# once, updated in memory and written once.
+BATCH_OPS = ("move", "comment", "evidence", "close")
+
+def load_operations(path: Path):
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [
+        {"line": i, "op": str(r.get("op", "")).strip().lower(), "ticket_id": str(r.get("ticket_id", "")).strip(),
+         "value": "" if r.get("value") is None else str(r.get("value")).strip()}
+        for i, r in enumerate(rows, start=1)
+    ]
+
+def validate_ticket_ops(status, ops):
+    # Returns an error message per operation (None when valid)
+    errors = []
+    for op in ops:
+        error = None
+        if op["op"] not in BATCH_OPS:
+            error = f"Unknown operation: {op['op']}"
+        elif op["op"] in ("move", "close"):
+            target = "closed" if op["op"] == "close" else op["value"]
+            if target not in STATUS_DIRS:
+                error = f"Invalid status: {target}"
+            elif target not in ALLOWED_TRANSITIONS.get(status, []):
+                error = f"Transition not allowed: {status} -> {target}"
+            else:
+                status = target
+        if op["op"] in ("comment", "evidence", "close") and not op["value"].strip():
+            error = f"{op['op']} needs a value"
+        errors.append(error)
+    return errors
+
+def apply_ticket_ops(ticket, status, ops):
+    for op in ops:
+        now = datetime.now().isoformat(timespec="seconds")
+        if op["op"] == "comment":
+            ticket.setdefault("comments", []).append({"timestamp": now, "comment": op["value"]})
+        elif op["op"] == "evidence":
+            ticket.setdefault("evidence", []).append({"timestamp": now, "evidence": op["value"]})
+        elif op["op"] == "close":
+            ticket.setdefault("comments", []).append({"timestamp": now, "comment": f"CLOSURE JUSTIFICATION: {op['value']}"})
+            status = ticket["status"] = "closed"
+        else:
+            status = ticket["status"] = op["value"]
+        ticket["last_updated"] = now
+    return status
+
+def apply_batch(root: Path, operations):
+    groups = OrderedDict()
+    for op in operations:
+        groups.setdefault(op["ticket_id"], []).append(op)
+
+    results = {}
+    plan = []
+    for ticket_id, ops in groups.items():
+        status, path = find_ticket(root, ticket_id)
+        if not path:
+            errors = [f"Ticket not found: {ticket_id}"] * len(ops)
+        else:
+            errors = validate_ticket_ops(status, ops)
+        if any(errors):
+            for op, error in zip(ops, errors):
+                results[op["line"]] = dict(op, ok=False, error=error or "skipped: another operation on this ticket failed")
+            continue
+        plan.append((ticket_id, status, path, ops))
+
+    # Each ticket is re-read under its lock and re-validated if another
+    # writer changed its status since the up-front check. Index updates
+    # commit per ticket so no index transaction is held while waiting for
+    # a ticket lock.
+    idx = open_index(root)
+    for ticket_id, status, path, ops in plan:
+        with ticket_lock(root, ticket_id):
+            current, path = find_ticket(root, ticket_id)
+            errors = validate_ticket_ops(current, ops) if current != status else []
+            if not path or any(errors):
+                for op, error in zip(ops, errors or [None] * len(ops)):
+                    results[op["line"]] = dict(op, ok=False, error=error or f"Ticket changed during batch: {ticket_id}")
+                continue
+
+            ticket = load_ticket(path)
+            new_status = apply_ticket_ops(ticket, current, ops)
+            new_path = root / "tickets" / new_status / f"{ticket_id}.json"
+            if new_path != path:
+                move_ticket_file(root, ticket, path, new_path)
+            else:
+                save_ticket(path, ticket)
+            idx.put(new_status, new_path, ticket)
+        for op in ops:
+            results[op["line"]] = dict(op, ok=True, status=new_status)
+
+    return [results[op["line"]] for op in operations]
+
 def usage():
     print("""
 Usage:
@@ -91,6 +215,7 @@ Usage:
   python update_ticket.py comment <TICKET-###> "comment text"
   python update_ticket.py evidence <TICKET-###> "evidence text or file path"
   python update_ticket.py close <TICKET-###> "closure justification"
+  python update_ticket.py batch <operations.jsonl|operations.csv> [report.jsonl]
 """.strip())
 
 def main():
@@ -104,6 +229,29 @@ def main():
     cmd = sys.argv[1].lower()
     ticket_id = sys.argv[2]
 
+    # Finish any move a previous crash left half done
+    for action, detail in recover(root):
+        print(f"[INFO] Recovered {action}: {detail}")
+
+    if cmd == "batch":
+        results = apply_batch(root, load_operations(Path(sys.argv[2])))
+        for r in results:
+            if r["ok"]:
+                print(f"[OK] line {r['line']}: {r['op']} {r['ticket_id']} ({r['status']})")
+            else:
+                print(f"[ERROR] line {r['line']}: {r['op']} {r['ticket_id']}: {r['error']}")
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], "w", encoding="utf-8") as f:
+                for r in results:
+                    f.write(json.dumps(r) + "\n")
+            print(f"[OK] Wrote: {sys.argv[3]}")
+        failed = sum(1 for r in results if not r["ok"])
+        print(f"[INFO] Batch: {len(results) - failed} applied, {failed} failed")
+        print(f"[INFO] Lock wait: {lock_report()}")
+        if failed:
+            raise SystemExit(1)
+        return
+
     try:
         if cmd == "move":
             if len(sys.argv) != 4:
@@ -139,5 +287,8 @@ def main():
     except Exception as e:
         print(f"[ERROR] {e}")
 
+    if LOCK_STATS["contended"]:
+        print(f"[INFO] Lock wait: {lock_report()}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import os
+import signal
+import time
+from pathlib import Path
+
+import colstore
+import detect
+import metrics
+import run_day1
+from ai_summarize import template_catalog
+from colstore import ColumnStore
+from dashboard import write_dashboard
+from findings_io import findings_path, iter_findings, write_jsonl
+from poam_export import poam_rows
+from ticketing import ensure_dirs, upsert_ticket
+
+# Watch mode: a long-running loop that follows data/raw and turns new
+# events into findings and tickets within seconds, instead of waiting for
+# the next batch run. Three asyncio tasks are joined by bounded queues:
+#
+#   tail    -> stats every *.jsonl / *.json in data/raw each --interval
+#              seconds and reads only files whose inode/size/mtime changed,
+#              from their ingest checkpoint (JSONL: appended lines; JSON
+#              exports: records newer than the last ingested). Reading
+#              runs in a worker thread that streams events -> queue.
+#   detect  -> takes what is queued (up to BATCH_MAX events), appends it to
+#              normalized_events.cols, runs the streaming rules over the new
+#              rows with the state carried in detect_state.json, then commits
+#              the checkpoints and appends closed findings to findings.jsonl.
+#              Changed findings -> queue.
+#   tickets -> upserts each finding through ticketing (worker thread) and
+#              refreshes DASHBOARD.md after each batch that touched a ticket.
+#
+# A slow consumer fills its queue, which blocks the producer on put(), so a
+# ticketing backlog pauses detection and then reading. Memory stays bounded
+# by the queue sizes plus the findings still open (AUTH-001 bursts whose
+# window has not closed): closed findings are appended to findings.jsonl,
+# which is never rewritten per batch, and open ones are appended only when
+# the watcher stops and taken back out when it starts. The loop sleeps
+# between polls and waits on the queues, so an idle watcher uses no CPU. The
+# files are the same ones run_day1.py --incremental and detect.py
+# --incremental use, so batch and watch runs can be mixed.
+
+POLL_SECONDS = 2.0
+EVENT_QUEUE = 10000
+FINDING_QUEUE = 1000
+BATCH_MAX = 5000
+
+def raw_sources(raw_dir: Path):
+    return sorted(p for p in raw_dir.glob("*") if p.is_file() and p.suffix.lower() in (".jsonl", ".json"))
+
+def read_changes(path: Path, cursor: dict):
+    # (normalized event, checkpoint to commit once it is stored) pairs for
+    # what was added to one source since `cursor`; advances the cursor
+    if path.suffix.lower() == ".jsonl":
+        for e in run_day1.iter_jsonl_tail(path, cursor):
+            yield run_day1.normalize_event(e), dict(cursor)
+        return
+    yield from read_export(path, cursor)
+
+def read_export(path: Path, cursor: dict):
+    # New records of a Get-WinEvent export (see run_day1.iter_real_events_tail),
+    # streamed rather than parsed into a list. The export lists the newest
+    # event first and its checkpoint covers the whole file, so only the last
+    # record carries it. An export that is still being written does not
+    # parse yet: it is checked in full before anything is queued, and on
+    # failure the cursor is kept and the file retried on the next poll.
+    try:
+        for _ in run_day1.iter_json_array(path):
+            pass
+    except ValueError:
+        return
+    cp = dict(cursor)
+    pending = None
+    for e in run_day1.iter_real_events_tail(path, cp):
+        if pending is not None:
+            yield pending, None
+        pending = run_day1.normalize_event(e)
+    cursor.clear()
+    cursor.update(cp)
+    if pending is not None:
+        yield pending, dict(cp)
+
+# -----------------------
+# Stages
+# -----------------------
+class Watcher:
+    def __init__(self, root: Path, interval=POLL_SECONDS, once=False):
+        self.root = Path(root)
+        self.raw_dir = self.root / "data" / "raw"
+        self.processed_dir = self.root / "data" / "processed"
+        self.store_path = self.processed_dir / "normalized_events.cols"
+        self.checkpoints_path = self.processed_dir / run_day1.CHECKPOINTS_FILE
+        self.interval = interval
+        self.once = once
+        self.stop = asyncio.Event()
+        self.events = asyncio.Queue(EVENT_QUEUE)
+        self.found = asyncio.Queue(FINDING_QUEUE)
+        self.stats = {"events": 0, "findings": 0, "tickets_created": 0, "tickets_updated": 0}
+
+        # As in run_day1.ingest: without a store there is nothing the old
+        # checkpoints could refer to
+        if ColumnStore.exists(self.store_path):
+            self.checkpoints = run_day1.load_checkpoints(self.checkpoints_path)
+        else:
+            self.checkpoints = {}
+        self.cursors = {name: dict(cp) for name, cp in self.checkpoints.items()}
+
+        self.rules, self.start, self.generation = None, 0, None
+        self.open = {}
+        if ColumnStore.exists(self.store_path):
+            self.load_rules(ColumnStore(self.store_path))
+
+    def load_rules(self, store):
+        self.rules, self.start = detect.load_incremental(self.processed_dir, store)
+        self.generation = store.generation
+        self.open = {detect.finding_key(f): f for f in self.snapshot()}
+
+        # findings.jsonl keeps closed findings; open ones live in memory until
+        # they close. From row 0 every finding is raised again, so start over.
+        out = self.processed_dir / "findings.jsonl"
+        prior = findings_path(self.processed_dir, "findings")
+        if not self.start or not prior.exists():
+            write_jsonl([], out)
+            return
+        if not self.open and prior == out:
+            return
+
+        def closed():
+            for f in iter_findings(prior):
+                key = detect.finding_key(f)
+                if key in self.open:
+                    self.open[key] = f  # last version written, to diff against
+                else:
+                    yield f
+        tmp = out.with_name(out.name + ".tmp")
+        write_jsonl(closed(), tmp)
+        os.replace(tmp, out)
+
+    def snapshot(self):
+        return [f for r in self.rules for f in r.snapshot()]
+
+    def read_source(self, path, cursor, loop):
+        # Worker thread: parsing never blocks the event loop, and each put
+        # waits for queue space, so a full queue still pauses the reader
+        for event, cp in read_changes(path, cursor):
+            asyncio.run_coroutine_threadsafe(self.events.put((event, path.name, cp)), loop).result()
+
+    async def tail(self):
+        loop = asyncio.get_running_loop()
+        seen = {}
+        while not self.stop.is_set():
+            for path in raw_sources(self.raw_dir):
+                st = path.stat()
+                signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+                if seen.get(path.name) == signature:
+                    continue
+                seen[path.name] = signature
+                await asyncio.to_thread(self.read_source, path, self.cursors.setdefault(path.name, {}), loop)
+            if self.once:
+                break
+            try:
+                await asyncio.wait_for(self.stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        await self.events.put(None)
+
+    async def detect(self):
+        done = False
+        while not done:
+            item = await self.events.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= BATCH_MAX or self.events.empty():
+                    break
+                item = self.events.get_nowait()
+            done = item is None
+            if batch:
+                changed = await asyncio.to_thread(self.detect_batch, batch)
+                for f in changed:
+                    await self.found.put(f)
+        await self.found.put(None)
+
+    def detect_batch(self, batch):
+        t0 = time.perf_counter()
+        colstore.write_store((event for event, _, _ in batch), self.store_path, append=True)
+        for _, name, cp in batch:
+            if cp is not None:
+                self.checkpoints[name] = cp
+        run_day1.save_checkpoints(self.checkpoints_path, self.checkpoints)
+
+        store = ColumnStore(self.store_path)
+        if store.generation != self.generation:
+            self.load_rules(store)  # first batch, or a batch run rebuilt the store
+        new = detect.detect_rows(store, self.rules, self.start)
+        self.start = store.rows
+
+        # Open findings are re-reported every batch until they close; only
+        # the ones that changed go on to ticketing, and only closed ones are
+        # written out
+        opened = {detect.finding_key(f): f for f in self.snapshot()}
+        changed, closed = [], []
+        for f in new:
+            key = detect.finding_key(f)
+            if self.open.get(key) != f:
+                changed.append(f)
+            if key not in opened:
+                closed.append(f)
+        self.open = opened
+        if closed:
+            write_jsonl(closed, self.processed_dir / "findings.jsonl", append=True)
+        detect.save_incremental(self.processed_dir, store, self.rules)
+
+        self.stats["events"] += len(batch)
+        self.stats["findings"] += len(changed)
+        print(f"[INFO] Watch: {len(batch)} events -> {len(changed)} findings "
+              f"({time.perf_counter() - t0:.2f}s, store rows {store.rows})")
+        for f in changed:
+            print(f"- [{f['severity']}] {f['rule_id']} {f['title']}")
+        return changed
+
+    async def tickets(self):
+        catalog = template_catalog()
+        ensure_dirs(self.root)
+        done = False
+        while not done:
+            item = await self.found.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if self.found.empty():
+                    break
+                item = self.found.get_nowait()
+            done = item is None
+            if batch:
+                await asyncio.to_thread(self.ticket_batch, list(poam_rows(batch, catalog)))
+
+    def ticket_batch(self, rows):
+        touched = False
+        for row in rows:
+            action, ticket_id = upsert_ticket(self.root, row)
+            if action == "created":
+                print(f"[OK] Created ticket: {ticket_id}")
+            elif action == "updated":
+                print(f"[OK] Recurring finding -> {ticket_id}")
+            elif action == "linked":
+                print(f"[OK] Existing ticket {ticket_id} now tracks this finding")
+            elif action == "missing":
+                print(f"[WARN] {ticket_id} is indexed but its file is missing; run: python ticket_store.py check")
+            if action in ("created", "updated"):
+                self.stats[f"tickets_{action}"] += 1
+                touched = True
+        if touched:
+            write_dashboard(self.root)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows, or not the main thread: Ctrl+C still ends the loop
+        await asyncio.gather(self.tail(), self.detect(), self.tickets())
+        # Leave findings.jsonl complete for the batch stages; the next start
+        # takes the still-open findings back out
+        if self.open:
+            write_jsonl(self.open.values(), self.processed_dir / "findings.jsonl", append=True)
+        return self.stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Follow data/raw and raise findings and tickets as events arrive.")
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS,
+                        help=f"seconds between polls of data/raw (default {POLL_SECONDS})")
+    parser.add_argument("--once", action="store_true",
+                        help="process what has arrived since the checkpoints, then exit")
+    parser.add_argument("--root", help="project root (default: this directory)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).resolve() if args.root else Path(__file__).resolve().parent
+    print(f"[INFO] Watching {root / 'data' / 'raw'} every {args.interval}s (Ctrl+C to stop)")
+    with metrics.profiled("watch", args, root / "data" / "processed"):
+        stats = asyncio.run(Watcher(root, args.interval, args.once).run())
+        metrics.note(**stats)
+    print(f"[OK] Watch stopped: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+if __name__ == "__main__":
+    main()